@@ -1,26 +1,19 @@
 # Home.py
 import streamlit as st
-import datetime, bcrypt
-from db_core import init_schema_and_seed, get_conn, USE_PG, DATABASE_URL
-from security import verify_credentials, ensure_admin_seed, list_user_companies
-
-# (opcional) roda migrações idempotentes se o arquivo existir
-try:
-    from init_db import migrate as _migrate
-except Exception:
-    _migrate = None
+import datetime
+from db_core import get_conn, query_cache_stats, USE_PG, DATABASE_URL
+from security import hash_password, verify_credentials
+from session_helpers import TenantContext, clear_tenant_context, switch_company, tenant_context
+from init_db import migrate
 
 st.set_page_config(page_title="Locadora Finance • Home", layout="wide", initial_sidebar_state="expanded")
 
-# 1) Garantir schema/seed/migração (Cloud pode reiniciar container)
-init_schema_and_seed()
-ensure_admin_seed()
-if _migrate:
-    try:
-        _migrate()
-    except Exception as _e:
-        # evita quebrar a Home se migração falhar por detalhe de permissão
-        pass
+# 1) Garantir schema/seed (migrações versionadas; já migrado = 1 consulta de versão)
+try:
+    migrate()
+except Exception as _e:
+    # evita quebrar a Home se migração falhar por detalhe de permissão
+    pass
 
 # 2) Sessão
 if "user" not in st.session_state:
@@ -75,7 +68,7 @@ def handle_set_password_token():
         if not p1 or p1 != p2:
             st.warning("As senhas não conferem.")
         else:
-            pw_hash = bcrypt.hashpw(p1.encode(), bcrypt.gensalt())
+            pw_hash = hash_password(p1)
             with get_conn() as conn:
                 conn.execute("UPDATE users SET password_hash=? WHERE id=?", (pw_hash, row["user_id"]))
                 conn.execute("UPDATE password_reset_tokens SET used=? WHERE id=?", (1, row["id"]))
@@ -83,7 +76,7 @@ def handle_set_password_token():
             st.success("Senha alterada com sucesso. Faça login novamente.")
             # Limpa usuário logado, se houver
             st.session_state.user = None
-            st.session_state.company = None
+            clear_tenant_context()
     return True
 
 # ---------- Login ----------
@@ -97,6 +90,7 @@ def do_login():
             u = verify_credentials(email, pwd)
             if u:
                 st.session_state.user = u
+                st.session_state.tenant = TenantContext.load(u)
                 st.rerun()
             else:
                 st.error("Credenciais inválidas")
@@ -115,16 +109,16 @@ def sidebar_after_login():
             st.sidebar.caption(f"Host: `{host}`")
         except Exception:
             pass
+    if u["role"] == "admin":
+        qc = query_cache_stats()
+        st.sidebar.caption(f"Cache de consultas: {qc['hit_ratio']:.0%} de acerto ({qc['hits']}/{qc['hits'] + qc['misses']})")
 
-    # Carrega empresas vinculadas (ou todas, se admin sem vínculo)
-    with get_conn() as conn:
-        rows = list_user_companies(u["id"])
-        if not rows and u["role"] == "admin":
-            rows = conn.execute("SELECT * FROM companies ORDER BY razao_social").fetchall()
+    # Empresas vinculadas (ou todas, se admin sem vínculo), do contexto da sessão
+    ctx = tenant_context()
 
-    if rows:
-        labels = {r["id"]: f'{r["razao_social"]} ({r["regime"]})' for r in rows}
-        ids = [r["id"] for r in rows]
+    if ctx.companies:
+        labels = ctx.labels()
+        ids = [c["id"] for c in ctx.companies]
         # seleciona padrão
         default_idx = 0
         if st.session_state.get("company"):
@@ -136,10 +130,7 @@ def sidebar_after_login():
         sel_id = st.sidebar.selectbox("🏢 Empresa ativa", ids, index=default_idx, format_func=lambda x: labels[x])
         # Atualiza sessão se mudou
         if (not st.session_state.get("company")) or (st.session_state.company["id"] != sel_id):
-            with get_conn() as conn:
-                st.session_state.company = dict(
-                    conn.execute("SELECT * FROM companies WHERE id=?", (sel_id,)).fetchone()
-                )
+            switch_company(sel_id)
         st.sidebar.success(f"Empresa: {st.session_state.company['razao_social']}")
     else:
         st.sidebar.warning("Nenhuma empresa vinculada. Cadastre em **📦 Empresas**.")
@@ -147,7 +138,7 @@ def sidebar_after_login():
     # Sair
     if st.sidebar.button("🔓 Sair"):
         st.session_state.user = None
-        st.session_state.company = None
+        clear_tenant_context()
         st.rerun()
 
 # ---------- Fluxo principal ----------
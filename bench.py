@@ -0,0 +1,759 @@
+# bench.py
+"""
+Micro-benchmarks de banco/renderização (SQLite local; não toca no Supabase).
+
+Execute localmente:
+    python bench.py sqlite-reads         # leituras/s com 1, 4 e 16 sessões (dev x production)
+    python bench.py bulk-insert          # 10k/100k parcelas: execute por linha x executemany x copy_rows
+    python bench.py plan-check           # EXPLAIN das consultas quentes; sai com erro se houver full scan
+    python bench.py query-cache          # reruns lendo a lista de clientes, com 1 escrita a cada 20 leituras
+    python bench.py login-load           # p50/p99 do login com 1, 8 e 32 logins simultâneos
+    python bench.py grid-edits           # checa o diff do grid de serviços com NULL <-> valor (sai com erro)
+    python bench.py settlement           # baixa em lote de 1k/5k parcelas (caixa + paid=1)
+    python bench.py schedule             # 10k contratos x 12 parcelas: laço Python x schedule.py (NumPy)
+    python bench.py recurrence           # despesa repetida: 60 cópias x regra; previsão de 500 regras
+    python bench.py cash-cube            # 08 com 10 anos de parcelas: agregação a cada carga x cubo cash_daily
+    python bench.py pdf-batch            # 300 OS em PDF: sequencial x pool com 1, 2 e 4 processos
+    python bench.py pdf-memory           # pico de memória: PDF em BytesIO x exportação em disco (PDF/ZIP)
+    python bench.py pdf-cache            # reimpressão de 200 OS: frio x repetido x 1 OS alterada
+    python bench.py pdf-template         # 1.000 OS num PDF só (sequencial x lote da tela): tempo, tamanho, XObjects
+Cada comando cria um banco temporário próprio e o apaga ao final.
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import db_core
+from dialect import ids_param
+
+
+# ---------- helpers ----------
+def _temp_db() -> str:
+    fd, path = tempfile.mkstemp(prefix="bench_", suffix=".db")
+    os.close(fd)
+    os.remove(path)
+    return path
+
+
+def _cleanup(path: str):
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass
+
+
+def _run_threads(n_threads: int, seconds: float, work) -> int:
+    """Roda `work()` em n_threads até esgotar o tempo; devolve o total de chamadas."""
+    stop = time.perf_counter() + seconds
+    counts = [0] * n_threads
+
+    def loop(i):
+        while time.perf_counter() < stop:
+            work()
+            counts[i] += 1
+
+    threads = [threading.Thread(target=loop, args=(i,)) for i in range(n_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(counts)
+
+
+# ---------- SQLite: leituras concorrentes ----------
+def bench_sqlite_reads(seconds: float = 2.0, rows: int = 5000):
+    path = _temp_db()
+    old_path, old_profile = db_core.SQLITE_PATH, db_core.SQLITE_PROFILE
+    db_core.SQLITE_PATH = path
+    try:
+        with db_core.get_conn() as conn:
+            conn.execute("CREATE TABLE clients(id INTEGER PRIMARY KEY, company_id INTEGER, nome TEXT)")
+            conn.executemany(
+                "INSERT INTO clients(company_id, nome) VALUES (?,?)",
+                [(i % 10, f"Cliente {i:05d}") for i in range(rows)],
+            )
+            conn.execute("CREATE INDEX idx_clients_company_id ON clients(company_id)")
+
+        def read_once():
+            with db_core.get_conn() as conn:
+                conn.execute("SELECT id, nome FROM clients WHERE company_id=? ORDER BY id LIMIT 50", (3,)).fetchall()
+
+        print(f"{'perfil':<12}{'sessões':>8}{'leituras/s':>14}")
+        for profile in ("dev", "production"):
+            db_core.SQLITE_PROFILE = profile
+            for n in (1, 4, 16):
+                total = _run_threads(n, seconds, read_once)
+                print(f"{profile:<12}{n:>8}{total / seconds:>14.0f}")
+    finally:
+        db_core.SQLITE_PATH, db_core.SQLITE_PROFILE = old_path, old_profile
+        _cleanup(path)
+
+
+# ---------- escrita em lote ----------
+def bench_bulk_insert(sizes=(10_000, 100_000)):
+    path = _temp_db()
+    old_path = db_core.SQLITE_PATH
+    db_core.SQLITE_PATH = path
+    sql = "INSERT INTO expense_installments(expense_id,num_parcela,due_date,amount) VALUES (?,?,?,?)"
+    cols = ["expense_id", "num_parcela", "due_date", "amount"]
+
+    def per_row(conn, rows):
+        for r in rows:
+            conn.execute(sql, r)
+
+    def many(conn, rows):
+        conn.executemany(sql, rows)
+
+    def copy(conn, rows):
+        conn.copy_rows("expense_installments", cols, rows)
+
+    try:
+        with db_core.get_conn() as conn:
+            conn.execute(
+                "CREATE TABLE expense_installments(id INTEGER PRIMARY KEY, expense_id INTEGER,"
+                " num_parcela INTEGER, due_date TEXT, amount REAL, paid INTEGER DEFAULT 0)"
+            )
+        print(f"{'linhas':>8}  {'método':<12}{'segundos':>10}{'linhas/s':>12}")
+        for n in sizes:
+            rows = [(i // 12, i % 12 + 1, f"2025-{i % 12 + 1:02d}-10", 100.0 + i % 7) for i in range(n)]
+            for name, fn in (("execute", per_row), ("executemany", many), ("copy_rows", copy)):
+                with db_core.get_conn() as conn:
+                    conn.execute("DELETE FROM expense_installments")
+                t0 = time.perf_counter()
+                with db_core.get_conn() as conn:
+                    fn(conn, rows)
+                dt = time.perf_counter() - t0
+                print(f"{n:>8}  {name:<12}{dt:>10.3f}{n / dt:>12.0f}")
+    finally:
+        db_core.SQLITE_PATH = old_path
+        _cleanup(path)
+
+
+# ---------- regressão de planos (sem full scan nas consultas quentes) ----------
+def _plan_queries() -> dict:
+    """
+    Consultas quentes com parâmetros de exemplo. O SQL vem dos módulos que as
+    páginas usam (service_ops, settlement, recurrence, cash_cube): mudou lá,
+    o EXPLAIN daqui acompanha.
+    """
+    import cash_cube
+    import recurrence
+    import service_ops
+    import settlement
+
+    ids = ids_param([1, 2])
+    queries = {
+        "05 Serviços": (service_ops.SERVICES_SQL, (1,)),
+        "05 Recebíveis": (service_ops.RECEIVABLES_SQL, (1,)),
+    }
+    for label, sql, n_company in service_ops.DELETE_SERVICES_CASCADE:
+        queries[f"05 Cascata: {label}"] = (sql, (1,) * n_company + (ids,))
+    queries.update({
+        "06 Parcelas em aberto": (settlement.OPEN_EXPENSE_INSTALLMENTS_SQL, (1,)),
+        "06 Caixa do dia": (settlement.CASH_DAY_SQL, (1, "2025-01-01", "2025-01-02")),
+        "06 Baixa: reivindica parcelas": (settlement.claim_sql("expense_installment"), ("2025-01-10", 1, ids)),
+        "06 Baixa: caixa do lote": (settlement.ledger_sql("expense_installment"),
+                                    ("2025-01-10", "out", "expense_installment", 1, ids)),
+        "06 Baixa: totais do lote": (settlement.BATCH_TOTALS_SQL, (1, 1, 1)),
+        "06 Recorrências: lista": (recurrence.RULE_LIST_SQL, (1,)),
+        "06 Recorrências: regras": (recurrence.RULES_SQL, (1, "2026-01-01")),
+        "06 Recorrências: materializadas": (recurrence.MATERIALIZED_SQL, (1,)),
+        "07 Parcelas em aberto": (settlement.OPEN_REVENUE_INSTALLMENTS_SQL, (1,)),
+        "08 Cubo: KPIs": (cash_cube.KPIS_SQL, ("2025-06-01", 1)),
+        "08 Cubo: curva mensal": (cash_cube.CURVE_MONTHLY_SQL, (1,)),
+        "08 Cubo: curva diária": (cash_cube.CURVE_DAILY_SQL, (1, "2025-01-01", "2025-04-01")),
+    })
+    return queries
+
+
+# SQLite: "SCAN t" sem índice (percorrer a lista de ids de json_each é esperado);
+# PG: "Seq Scan" (com enable_seqscan=off só sobra o inevitável)
+_FULL_SCAN_SQLITE = re.compile(r"^SCAN (\w+)\b(?! USING| VIRTUAL TABLE)")
+_FULL_SCAN_PG = re.compile(r"Seq Scan on (\w+)")
+
+
+def _seed_plan_data(conn, companies: int = 5, per_company: int = 200):
+    """Volume pequeno, mas com várias empresas para o planner ter o que filtrar."""
+    for cid in range(1, companies + 1):
+        conn.execute("INSERT INTO companies(id, razao_social, cnpj) VALUES (?,?,?)", (cid, f"Empresa {cid}", f"{cid:014d}"))
+    conn.copy_rows("services", ["company_id", "data", "valor_total"],
+                   [(i % companies + 1, f"2025-{i % 12 + 1:02d}-10", 100.0) for i in range(companies * per_company)])
+    conn.copy_rows("revenue", ["company_id", "service_id", "data", "valor"],
+                   [(i % companies + 1, i + 1, "2025-01-10", 100.0) for i in range(companies * per_company)])
+    conn.copy_rows("revenues", ["company_id", "data_lancamento", "valor_total", "parcelas", "fiscal"],
+                   [(i % companies + 1, "2025-01-10", 100.0, 3, 1) for i in range(companies * per_company)])
+    conn.copy_rows("expenses", ["company_id", "descricao", "data_lancamento", "valor_total", "parcelas"],
+                   [(i % companies + 1, "x", "2025-01-10", 100.0, 3) for i in range(companies * per_company)])
+    for table, fk in (("revenue_installments", "revenue_id"), ("expense_installments", "expense_id")):
+        conn.copy_rows(table, [fk, "num_parcela", "due_date", "amount", "paid"],
+                       [(i // 3 + 1, i % 3 + 1, f"2025-{i % 12 + 1:02d}-10", 33.3, int(i % 4 == 0))
+                        for i in range(companies * per_company * 3)])
+    conn.copy_rows("cash_ledger", ["company_id", "data", "tipo", "valor", "link_tipo", "link_id"],
+                   [(i % companies + 1, f"2025-01-{i % 28 + 1:02d}", "in", 10.0, "revenue_installment", i + 1)
+                    for i in range(companies * per_company)])
+    conn.execute("ANALYZE")
+
+
+def _plan_lines(conn, sql: str, params) -> list[str]:
+    if db_core.USE_PG:
+        rows = conn.execute("EXPLAIN " + sql, params).fetchall()
+        return [r["QUERY PLAN"] for r in rows]
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    return [r["detail"] for r in rows]
+
+
+def bench_plan_check():
+    import init_db
+
+    path = None
+    old_path = db_core.SQLITE_PATH
+    if not db_core.USE_PG:
+        path = _temp_db()
+        db_core.SQLITE_PATH = path
+    failures = 0
+    try:
+        init_db.migrate()
+        with db_core.get_conn() as conn:
+            if db_core.USE_PG:
+                conn.execute("SET LOCAL enable_seqscan = off")
+            else:
+                _seed_plan_data(conn)
+            for name, (sql, params) in _plan_queries().items():
+                lines = _plan_lines(conn, sql, params)
+                pat = _FULL_SCAN_PG if db_core.USE_PG else _FULL_SCAN_SQLITE
+                scans = [m.group(1) for line in lines if (m := pat.search(line.strip()))]
+                status = "OK" if not scans else "FULL SCAN: " + ", ".join(scans)
+                failures += bool(scans)
+                print(f"{name:<42}{status}")
+                for line in lines:
+                    print(f"    {line}")
+            conn.rollback()
+    finally:
+        db_core.SQLITE_PATH = old_path
+        if path:
+            _cleanup(path)
+    if failures:
+        sys.exit(f"{failures} consulta(s) com full scan")
+
+
+# ---------- cache de consultas ----------
+def bench_query_cache(reads: int = 2000, write_every: int = 20, rows: int = 2000):
+    import init_db
+
+    path = _temp_db()
+    old_path = db_core.SQLITE_PATH
+    db_core.SQLITE_PATH = path
+    sql = "SELECT * FROM clients WHERE company_id=? ORDER BY nome"
+    try:
+        init_db.migrate()
+        with db_core.get_conn() as conn:
+            conn.execute("INSERT INTO companies(id, razao_social, cnpj) VALUES (1, 'Empresa', '1')")
+            conn.copy_rows("clients", ["company_id", "nome"], [(1, f"Cliente {i:05d}") for i in range(rows)])
+
+        def direct():
+            with db_core.get_conn() as conn:
+                return conn.execute(sql, (1,)).fetchall()
+
+        def cached():
+            return db_core.cached_query(sql, (1,))
+
+        db_core.query_cache_clear()
+        print(f"{'modo':<10}{'leituras/s':>12}")
+        for name, read in (("direto", direct), ("cache", cached)):
+            t0 = time.perf_counter()
+            for i in range(reads):
+                if i % write_every == write_every - 1:
+                    with db_core.get_conn() as conn:
+                        conn.execute("UPDATE clients SET nome=nome WHERE id=?", (i % rows + 1,))
+                read()
+            print(f"{name:<10}{reads / (time.perf_counter() - t0):>12.0f}")
+        print("stats:", db_core.query_cache_stats())
+    finally:
+        db_core.SQLITE_PATH = old_path
+        _cleanup(path)
+
+
+# ---------- login (bcrypt no pool de workers) ----------
+def _percentile(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def bench_login_load(levels=(1, 8, 32), logins_per_user: int = 4):
+    import init_db
+    import security
+
+    path = _temp_db()
+    old_path = db_core.SQLITE_PATH
+    db_core.SQLITE_PATH = path
+    try:
+        init_db.migrate()
+        print(f"custo bcrypt: {security.bcrypt_rounds()}  workers: {security.BCRYPT_WORKERS}")
+        print(f"{'simultâneos':>12}{'logins':>8}{'p50 ms':>10}{'p99 ms':>10}")
+        for n in levels:
+            lat = []
+            lock = threading.Lock()
+            start = threading.Barrier(n)
+
+            def user():
+                start.wait()
+                for _ in range(logins_per_user):
+                    t0 = time.perf_counter()
+                    assert security.verify_credentials("admin@admin", "admin")
+                    with lock:
+                        lat.append((time.perf_counter() - t0) * 1000)
+
+            threads = [threading.Thread(target=user) for _ in range(n)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            print(f"{n:>12}{len(lat):>8}{_percentile(lat, 50):>10.0f}{_percentile(lat, 99):>10.0f}")
+    finally:
+        db_core.SQLITE_PATH = old_path
+        _cleanup(path)
+
+
+# ---------- grid de serviços (05) ----------
+def bench_grid_edits():
+    """
+    Checagem de service_ops.changed_rows com colunas string[pyarrow] (como
+    fetch_df devolve): NULL -> valor, valor -> NULL e valor -> valor contam como
+    alteração; NULL dos dois lados não. Sai com erro se algo escapar.
+    """
+    import pandas as pd
+
+    from service_ops import changed_rows
+
+    text = pd.StringDtype("pyarrow")
+    original = pd.DataFrame({
+        "id": [1, 2, 3, 4, 5],
+        "descricao": pd.Series([None, "a", "b", None, "c"], dtype=text),
+        "status": pd.Series([None, "aberta", None, None, "aberta"], dtype=text),
+    })
+    edited = original.copy()
+    edited.loc[0, ["descricao", "status"]] = ["novo", "concluída"]   # NULL -> valor
+    edited.loc[1, "status"] = None                                   # valor -> NULL
+    edited.loc[4, "descricao"] = "c2"                                # valor -> valor
+    for label, (o, e) in {"string[pyarrow]": (original, edited),
+                          "object": (original.astype(object), edited.astype(object))}.items():
+        got = changed_rows(o, e)["id"].tolist()
+        print(f"{label:<16} alteradas: {got}")
+        if got != [1, 2, 5]:
+            sys.exit(f"changed_rows ({label}) devolveu {got}, esperado [1, 2, 5]")
+
+
+# ---------- baixa de parcelas em lote ----------
+def bench_settlement(sizes=(1_000, 5_000)):
+    """Fechamento do mês: quita N parcelas de despesa num lote (settlement.py)."""
+    import init_db
+    from settlement import settle_installments
+
+    path = _temp_db()
+    old_path = db_core.SQLITE_PATH
+    db_core.SQLITE_PATH = path
+    try:
+        init_db.migrate()
+        with db_core.get_conn() as conn:
+            conn.execute("INSERT INTO companies(id, razao_social, cnpj) VALUES (1, 'Empresa', '1')")
+        print(f"{'parcelas':>9}{'segundos':>10}{'caixa':>8}")
+        for n in sizes:
+            with db_core.get_conn() as conn:
+                exp_id = conn.execute(
+                    "INSERT INTO expenses(company_id, descricao, data_lancamento, valor_total, parcelas)"
+                    " VALUES (1, 'bench', '2025-01-10', 0, ?) RETURNING id", (n,)
+                ).fetchone()["id"]
+                conn.copy_rows("expense_installments", ["expense_id", "num_parcela", "due_date", "amount"],
+                               [(exp_id, i + 1, "2025-01-31", 10.0) for i in range(n)])
+                ids = [r["id"] for r in conn.execute(
+                    "SELECT id FROM expense_installments WHERE expense_id=?", (exp_id,)).fetchall()]
+            t0 = time.perf_counter()
+            batch = settle_installments(1, "expense_installment", ids)
+            dt = time.perf_counter() - t0
+            with db_core.get_conn() as conn:
+                qtd = conn.execute("SELECT qtd FROM settlement_batches WHERE id=?", (batch,)).fetchone()["qtd"]
+            print(f"{n:>9}{dt:>10.3f}{qtd:>8}")
+    finally:
+        db_core.SQLITE_PATH = old_path
+        _cleanup(path)
+
+
+# ---------- parcelamento ----------
+def bench_schedule(contracts: int = 10_000, parcelas: int = 12):
+    """Parcelas de muitos contratos: laço Python (como as páginas faziam) x schedule.py."""
+    from datetime import date
+
+    import numpy as np
+
+    from schedule import build_schedule
+    from utils import add_months
+
+    starts = [date(2025, 1, 1 + i % 28) for i in range(contracts)]
+    t0 = time.perf_counter()
+    rows = []
+    for cid, start in enumerate(starts):
+        par_val = round(1234.56 / parcelas, 2)
+        vals = [par_val] * parcelas
+        vals[-1] += round(1234.56 - sum(vals), 2)
+        rows += [(cid, i + 1, add_months(start, i).isoformat(), vals[i]) for i in range(parcelas)]
+    loop = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    sched = build_schedule(np.full(contracts, 1234.56), np.full(contracts, parcelas), starts)
+    vec_rows = sched.rows(np.arange(contracts))
+    vec = time.perf_counter() - t0
+    print(f"{contracts} contratos x {parcelas} parcelas = {len(vec_rows)} linhas")
+    print(f"laço Python  {loop:.3f}s\nschedule.py  {vec:.3f}s  (x{loop / vec:.1f})")
+
+
+def bench_recurrence(rules: int = 500, repetir: int = 60, parcelas: int = 120):
+    """
+    "Repetir por N meses": N cópias materializadas x uma regra (recurrence.py).
+    Mede linhas gravadas por lançamento e o custo de prever as ocorrências de
+    `rules` regras até o horizonte, como 06/08 fazem a cada carga.
+    """
+    import numpy as np
+
+    import init_db
+    from recurrence import create_rule, horizon, materialize_installments, virtual_installments
+    from schedule import build_schedule
+
+    path = _temp_db()
+    old_path = db_core.SQLITE_PATH
+    db_core.SQLITE_PATH = path
+    try:
+        init_db.migrate()
+        offsets = np.arange(repetir + 1)
+        t0 = time.perf_counter()
+        with db_core.get_conn() as conn:
+            exp_ids = [conn.execute(
+                "INSERT INTO expenses(company_id, descricao, valor_total, parcelas) VALUES (2, 'cópia', 1000, ?)"
+                " RETURNING id", (parcelas,)).fetchone()["id"] for _ in offsets]
+            sched = build_schedule(np.full(offsets.size, 1000.0), np.full(offsets.size, parcelas),
+                                   np.full(offsets.size, np.datetime64("2025-01-31")), offsets)
+            n_rows = len(exp_ids) + conn.copy_rows(
+                "expense_installments", ["expense_id", "num_parcela", "due_date", "amount"], sched.rows(exp_ids))
+        copies = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        with db_core.get_conn() as conn:
+            create_rule(conn, 2, 1000.0, parcelas, "2025-01-31", occurrences=repetir + 1)
+        rule = time.perf_counter() - t0
+        print(f"lançamento com {repetir} cópias x {parcelas} parcelas: {n_rows} linhas em {copies:.3f}s")
+        print(f"lançamento como regra:                    1 linha  em {rule:.4f}s")
+
+        with db_core.get_conn() as conn:
+            for i in range(rules):
+                create_rule(conn, 1, 100.0 + i, 1 + i % 3, f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}", freq_months=(1, 3, 12)[i % 3])
+        until = horizon()
+        t0 = time.perf_counter()
+        prev = virtual_installments(1, until)
+        cold = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        virtual_installments(1, until)
+        warm = time.perf_counter() - t0
+        print(f"{rules} regras até {until}: {len(prev)} parcelas previstas em {cold:.3f}s (cache: {warm:.3f}s)")
+        t0 = time.perf_counter()
+        ids = materialize_installments(1, prev["key"].head(50))
+        print(f"pagar 50 previstas: {len(ids)} ids reais em {time.perf_counter() - t0:.3f}s")
+    finally:
+        db_core.SQLITE_PATH = old_path
+        _cleanup(path)
+
+
+# ---------- dashboard (08) ----------
+def bench_cash_cube(years: int = 10, per_day: int = 40):
+    """
+    08_📊 com `years` anos de parcelas: agregação das parcelas a cada carga (antes)
+    x leituras do cubo cash_daily; mais o custo de manter o cubo numa baixa.
+    """
+    import numpy as np
+
+    import init_db
+    from cash_cube import rebuild
+    from dialect import before, day_bucket, month_bucket
+    from settlement import settle_installments
+
+    path = _temp_db()
+    old_path = db_core.SQLITE_PATH
+    db_core.SQLITE_PATH = path
+    try:
+        init_db.migrate()
+        days = np.arange(np.datetime64("2016-01-01"), np.datetime64("2016-01-01") + 365 * years)
+        due = np.datetime_as_string(np.repeat(days, per_day), unit="D").tolist()
+        with db_core.get_conn() as conn:
+            exp_id = conn.execute("INSERT INTO expenses(company_id, descricao) VALUES (1, 'bench') RETURNING id"
+                                  ).fetchone()["id"]
+            rev_id = conn.execute("INSERT INTO revenues(company_id, descricao) VALUES (1, 'bench') RETURNING id"
+                                  ).fetchone()["id"]
+            conn.copy_rows("expense_installments", ["expense_id", "num_parcela", "due_date", "amount"],
+                           ((exp_id, i, d, 10.0) for i, d in enumerate(due)))
+            conn.copy_rows("revenue_installments", ["revenue_id", "num_parcela", "due_date", "amount", "origem"],
+                           ((rev_id, i, d, 15.0, "avulsa") for i, d in enumerate(due)))
+        t0 = time.perf_counter()
+        cells = rebuild()
+        print(f"{2 * len(due)} parcelas em {years} anos; rebuild: {cells} células em {time.perf_counter() - t0:.2f}s")
+
+        def old_load():
+            with db_core.get_conn() as conn:
+                rows = 0
+                for table, parent, flag in (("expense_installments", "expenses", "paid"),
+                                            ("revenue_installments", "revenues", "received")):
+                    fk = "expense_id" if parent == "expenses" else "revenue_id"
+                    rows += len(conn.execute(f"""
+                        SELECT {day_bucket('i.due_date')} AS data, SUM(i.amount) AS valor
+                        FROM {table} i JOIN {parent} p ON p.id=i.{fk}
+                        WHERE p.company_id=? GROUP BY 1 ORDER BY 1""", (1,)).fetchall())
+                    rows += len(conn.execute(f"""
+                        SELECT SUM(i.amount) AS v FROM {table} i JOIN {parent} p ON p.id=i.{fk}
+                        WHERE p.company_id=? AND i.{flag}=0 AND {before('i.due_date')}""",
+                        (1, "2025-06-01")).fetchall())
+            return rows
+
+        def cube_load():
+            with db_core.get_conn() as conn:
+                rows = len(conn.execute("""
+                    SELECT direction, SUM(total) AS total,
+                           SUM(CASE WHEN status='open' AND day < ? THEN total ELSE 0 END) AS vencido
+                    FROM cash_daily WHERE company_id=? GROUP BY direction""", ("2025-06-01", 1)).fetchall())
+                rows += len(conn.execute(f"""
+                    SELECT {month_bucket('day')} AS data, direction, SUM(total) AS valor
+                    FROM cash_daily WHERE company_id=? GROUP BY 1, 2 ORDER BY 1""", (1,)).fetchall())
+            return rows
+
+        for label, fn in (("agregando parcelas", old_load), ("cubo cash_daily", cube_load)):
+            fn()
+            t0 = time.perf_counter()
+            rows = fn()
+            print(f"{label:<20}{time.perf_counter() - t0:>8.3f}s  {rows:>6} linhas lidas")
+
+        with db_core.get_conn() as conn:
+            ids = [r["id"] for r in conn.execute(
+                "SELECT id FROM expense_installments WHERE expense_id=? LIMIT 500", (exp_id,)).fetchall()]
+        t0 = time.perf_counter()
+        settle_installments(1, "expense_installment", ids)
+        print(f"baixa de 500 parcelas (com o cubo): {time.perf_counter() - t0:.3f}s")
+    finally:
+        db_core.SQLITE_PATH = old_path
+        _cleanup(path)
+
+
+# ---------- OS em PDF ----------
+@contextmanager
+def _pdf_cache_off():
+    """Desliga os caches de PDF (fragmentos e lotes): os tempos medem renderização de fato."""
+    import os_pdf
+
+    old = os_pdf.fragment_cache, os_pdf.batch_cache
+    os_pdf.fragment_cache = os_pdf._FragmentCache(tempfile.gettempdir(), 0)
+    os_pdf.batch_cache = os_pdf._FragmentCache(tempfile.gettempdir(), 0)
+    try:
+        yield
+    finally:
+        os_pdf.fragment_cache, os_pdf.batch_cache = old
+
+
+def _pdf_xobjects(pdf: bytes) -> int:
+    """XObjects distintos usados pelas páginas (form do cabeçalho/rodapé)."""
+    from pypdf import PdfReader
+
+    seen = set()
+    for page in PdfReader(io.BytesIO(pdf)).pages:
+        for ref in (page.get("/Resources") or {}).get("/XObject", {}).values():
+            seen.add(ref.idnum)
+    return len(seen)
+
+
+def _seed_os_data(n: int):
+    """n serviços da empresa 1 com cliente, colaborador, equipamento e 3 parcelas."""
+    desc = "Montagem do equipamento\nTreinamento da equipe\n" + "Observação longa do serviço. " * 8
+    with db_core.get_conn() as conn:
+        conn.execute("INSERT INTO companies(id, razao_social, cnpj, cidade, estado) VALUES (1, 'Empresa', '1', 'Campinas', 'SP')")
+        conn.execute("INSERT INTO clients(id, company_id, nome, doc, cidade, estado) VALUES (1, 1, 'Cliente', '123', 'Campinas', 'SP')")
+        conn.execute("INSERT INTO employees(id, company_id, nome, funcao) VALUES (1, 1, 'Técnico', 'Montador')")
+        conn.execute("INSERT INTO equipment(id, company_id, descricao) VALUES (1, 1, 'Andaime')")
+        conn.copy_rows("services", ["id", "company_id", "client_id", "data", "descricao", "valor_total",
+                                    "forma_pagamento", "parcelas", "status"],
+                       [(i, 1, 1, f"2025-{i % 12 + 1:02d}-10", desc, 300.0, "Pix", 3, "aberta") for i in range(1, n + 1)])
+        conn.copy_rows("service_employees", ["service_id", "employee_id"], [(i, 1) for i in range(1, n + 1)])
+        conn.copy_rows("service_equipments", ["service_id", "equipment_id"], [(i, 1) for i in range(1, n + 1)])
+        conn.copy_rows("revenue", ["id", "company_id", "service_id", "data", "valor"],
+                       [(i, 1, i, "2025-01-10", 300.0) for i in range(1, n + 1)])
+        conn.copy_rows("revenue_installments", ["revenue_id", "num_parcela", "due_date", "amount", "origem"],
+                       [(i, k, f"2025-0{k + 1}-10", 100.0, "os") for i in range(1, n + 1) for k in (1, 2, 3)])
+    return list(range(1, n + 1))
+
+
+def bench_pdf_batch(n: int = 300, levels=(1, 2, 4)):
+    """OS em PDF: sequencial x pool de processos (união em ordem + numeração)."""
+    import init_db
+    import os_pdf
+    from pypdf import PdfReader
+
+    path = _temp_db()
+    old_path = db_core.SQLITE_PATH
+    db_core.SQLITE_PATH = path
+    try:
+        with _pdf_cache_off():
+            init_db.migrate()
+            ids = _seed_os_data(n)
+            print(f"{n} OS, {os.cpu_count()} CPU(s)")
+            print(f"{'modo':<14}{'segundos':>10}{'páginas':>9}")
+            t0 = time.perf_counter()
+            pages = len(PdfReader(io.BytesIO(os_pdf.generate_os_pdf_pro(ids, 1))).pages)
+            base = time.perf_counter() - t0
+            print(f"{'sequencial':<14}{base:>10.2f}{pages:>9}")
+            for w in levels:
+                t0 = time.perf_counter()
+                pdf = os_pdf.generate_os_pdf_batch(ids, 1, workers=w, chunk_size=max(1, n // (4 * w)))
+                dt = time.perf_counter() - t0
+                reader = PdfReader(io.BytesIO(pdf))
+                assert f"Página {len(reader.pages)}" in reader.pages[-1].extract_text()
+                print(f"{f'{w} worker(s)':<14}{dt:>10.2f}{len(reader.pages):>9}   x{base / dt:.2f}")
+    finally:
+        db_core.SQLITE_PATH = old_path
+        _cleanup(path)
+
+
+def bench_pdf_cache(n: int = 200):
+    """Reimpressão: lote frio x lote repetido x lote com 1 OS alterada (cache de fragmentos)."""
+    import shutil
+
+    import init_db
+    import os_pdf
+
+    path = _temp_db()
+    old_path = db_core.SQLITE_PATH
+    db_core.SQLITE_PATH = path
+    cache_dir = tempfile.mkdtemp(prefix="bench_pdfcache_")
+    old_caches = os_pdf.fragment_cache, os_pdf.batch_cache
+    os_pdf.fragment_cache = os_pdf._FragmentCache(os.path.join(cache_dir, "os"), 256 * 2**20)
+    os_pdf.batch_cache = os_pdf._FragmentCache(os.path.join(cache_dir, "lotes"), 64 * 2**20)
+    try:
+        init_db.migrate()
+        ids = _seed_os_data(n)
+
+        def run(label):
+            t0 = time.perf_counter()
+            cpu0 = time.process_time()
+            before = os_pdf.fragment_cache.stats()
+            os_pdf.generate_os_pdf_batch(ids, 1, workers=1)
+            after = os_pdf.fragment_cache.stats()
+            print(f"{label:<14}{time.perf_counter() - t0:>10.2f}{time.process_time() - cpu0:>10.2f}"
+                  f"{after['hits'] - before['hits']:>7}{after['misses'] - before['misses']:>8}")
+
+        print(f"{n} OS")
+        print(f"{'lote':<14}{'segundos':>10}{'CPU s':>10}{'hits':>7}{'misses':>8}")
+        run("frio")
+        run("repetido")
+        with db_core.get_conn() as conn:
+            conn.execute("UPDATE services SET status='concluída' WHERE id=?", (ids[n // 2],))
+        run("1 alterada")
+    finally:
+        os_pdf.fragment_cache, os_pdf.batch_cache = old_caches
+        db_core.SQLITE_PATH = old_path
+        _cleanup(path)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def bench_pdf_template(n: int = 1000):
+    """
+    Lote de n OS num PDF só: tempo, tamanho e XObjects distintos, no renderizador
+    sequencial e no caminho da tela (generate_os_pdf_batch: fragmentos unidos,
+    forms iguais fundidos na união), sem cache.
+    """
+    import init_db
+    import os_pdf
+
+    path = _temp_db()
+    old_path = db_core.SQLITE_PATH
+    db_core.SQLITE_PATH = path
+    try:
+        init_db.migrate()
+        ids = _seed_os_data(n)
+        os_pdf.generate_os_pdf_pro(ids[:1], 1)   # aquecimento
+        print(f"{n} OS")
+        print(f"{'caminho':<22}{'segundos':>10}{'ms/OS':>8}{'MB':>7}{'XObjects':>10}")
+        with _pdf_cache_off():
+            for label, fn in (("generate_os_pdf_pro", os_pdf.generate_os_pdf_pro),
+                              ("generate_os_pdf_batch", lambda i, c: os_pdf.generate_os_pdf_batch(i, c, workers=1))):
+                t0 = time.perf_counter()
+                pdf = fn(ids, 1)
+                dt = time.perf_counter() - t0
+                print(f"{label:<22}{dt:>10.2f}{dt / n * 1000:>8.1f}{len(pdf) / 2**20:>7.2f}{_pdf_xobjects(pdf):>10}")
+    finally:
+        db_core.SQLITE_PATH = old_path
+        _cleanup(path)
+
+
+def bench_pdf_memory(sizes=(50, 200)):
+    """
+    Pico de memória (tracemalloc) da OS em PDF: em memória x exportação em disco.
+    Só "disco ZIP" deve ficar constante entre os tamanhos; "disco PDF" cresce
+    com o lote (o ReportLab guarda as páginas até save()).
+    """
+    import tracemalloc
+
+    import init_db
+    import os_pdf
+
+    path = _temp_db()
+    old_path = db_core.SQLITE_PATH
+    db_core.SQLITE_PATH = path
+    out = _temp_db()
+    try:
+        init_db.migrate()
+        all_ids = _seed_os_data(max(sizes))
+        modes = {
+            "BytesIO": lambda ids: os_pdf.generate_os_pdf_pro(ids, 1),
+            "disco PDF": lambda ids: os_pdf.export_os_pdf(ids, 1, out),
+            "disco ZIP": lambda ids: os_pdf.export_os_pdf(ids, 1, out, per_os_zip=True),
+        }
+        os_pdf.generate_os_pdf_pro(all_ids[:1], 1)   # aquecimento: imports/fontes fora da medição
+        print(f"{'OS':>6}  {'modo':<11}{'pico MB':>9}{'arquivo MB':>12}")
+        for n in sizes:
+            for name, run in modes.items():
+                tracemalloc.start()
+                result = run(all_ids[:n])
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                size = len(result) if isinstance(result, bytes) else os.path.getsize(out)
+                del result
+                print(f"{n:>6}  {name:<11}{peak / 2**20:>9.1f}{size / 2**20:>12.1f}")
+    finally:
+        db_core.SQLITE_PATH = old_path
+        _cleanup(path)
+        _cleanup(out)
+
+
+BENCHES = {
+    "sqlite-reads": bench_sqlite_reads,
+    "bulk-insert": bench_bulk_insert,
+    "plan-check": bench_plan_check,
+    "query-cache": bench_query_cache,
+    "login-load": bench_login_load,
+    "grid-edits": bench_grid_edits,
+    "settlement": bench_settlement,
+    "schedule": bench_schedule,
+    "recurrence": bench_recurrence,
+    "cash-cube": bench_cash_cube,
+    "pdf-batch": bench_pdf_batch,
+    "pdf-memory": bench_pdf_memory,
+    "pdf-cache": bench_pdf_cache,
+    "pdf-template": bench_pdf_template,
+}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("bench", choices=sorted(BENCHES))
+    args = ap.parse_args()
+    BENCHES[args.bench]()
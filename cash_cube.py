@@ -0,0 +1,179 @@
+# cash_cube.py
+# -*- coding: utf-8 -*-
+"""
+Cubo diário do fluxo de caixa (cash_daily), lido por 08_📊_Caixa_e_Dashboards.
+
+Uma linha por (company_id, day, direction, status) com a soma e a contagem das
+parcelas daquele dia:
+  - direction 'out': expense_installments de expenses (status pelo flag paid)
+  - direction 'in' : revenue_installments de revenues, só origem='avulsa' (status
+    pelo flag received). Parcelas de OS (origem='os', documento em `revenue`, 05)
+    ficam fora: revenue e revenues têm ids independentes, então revenue_id sozinho
+    não diz de qual documento a parcela é
+  - status 'open' (em aberto) ou 'settled' (pago/recebido)
+
+Manutenção incremental, na mesma transação de quem escreve as parcelas:
+  - track(conn, direction, -1, ...) antes e +1 depois (ou o contexto tracked())
+    tiram e repõem a contribuição do escopo alterado — por documento (parents)
+    ou por parcela (ids) —, um INSERT ... SELECT ... GROUP BY com upsert
+  - baixas que já sabem o que mudaram (UPDATE ... RETURNING id) movem só essas
+    parcelas: track(..., -1, ids=baixadas, status="open") e track(..., 1, ids=baixadas)
+  - bump() soma um valor conhecido sem consultar (inserção de uma parcela só)
+rebuild() refaz o cubo a partir das parcelas (correção de divergência):
+    python cash_cube.py rebuild [--company ID]
+"""
+from __future__ import annotations
+
+import argparse
+from contextlib import contextmanager
+
+from db_core import get_conn
+from dialect import day_bucket, ids_param, in_ids, in_range, month_bucket
+
+# direction -> parcelas, documento (com a empresa), quais parcelas contam e flag de baixa
+_SOURCES = {
+    "out": {
+        "table": "expense_installments",
+        "join": "JOIN expenses p ON p.id = i.expense_id",
+        "only": "i.due_date IS NOT NULL",
+        "parent": "i.expense_id",
+        "flag": "i.paid",
+    },
+    "in": {
+        "table": "revenue_installments",
+        "join": "JOIN revenues p ON p.id = i.revenue_id",
+        "only": "i.due_date IS NOT NULL AND i.origem = 'avulsa'",
+        "parent": "i.revenue_id",
+        "flag": "i.received",
+    },
+}
+
+_UPSERT = """
+    INSERT INTO cash_daily(company_id, day, direction, status, total, qtd)
+    {select}
+    ON CONFLICT(company_id, day, direction, status) DO UPDATE SET
+      total = cash_daily.total + excluded.total,
+      qtd = cash_daily.qtd + excluded.qtd
+"""
+
+
+def _select(direction: str, where: str, sign: str = "1", status: str | None = None) -> str:
+    src = _SOURCES[direction]
+    status_sql = f"'{status}'" if status else f"CASE WHEN {src['flag']} = 1 THEN 'settled' ELSE 'open' END"
+    return f"""
+    SELECT p.company_id, {day_bucket('i.due_date')}, '{direction}',
+           {status_sql},
+           {sign} * SUM(i.amount), {sign} * COUNT(*)
+    FROM {src['table']} i
+    {src['join']}
+    WHERE {src['only']} AND {where}
+    GROUP BY 1, 2, 3, 4
+    """
+
+# Leituras de 08_📊 (importadas também por bench.py plan-check)
+# (hoje, company_id): total e vencido em aberto por direção
+KPIS_SQL = """
+    SELECT direction,
+           SUM(total) AS total,
+           SUM(CASE WHEN status='open' AND day < ? THEN total ELSE 0 END) AS vencido
+    FROM cash_daily
+    WHERE company_id=?
+    GROUP BY direction
+"""
+
+# (company_id,)
+CURVE_MONTHLY_SQL = f"""
+    SELECT {month_bucket('day')} AS data, direction, SUM(total) AS valor
+    FROM cash_daily
+    WHERE company_id=?
+    GROUP BY 1, 2
+    ORDER BY 1
+"""
+
+# (company_id, de, até exclusivo)
+CURVE_DAILY_SQL = f"""
+    SELECT day AS data, direction, SUM(total) AS valor
+    FROM cash_daily
+    WHERE company_id=? AND {in_range('day')}
+    GROUP BY 1, 2
+    ORDER BY 1
+"""
+
+
+# =============================================================================
+# Incremental
+# =============================================================================
+def track(conn, direction: str, sign: int, parents=None, ids=None, status: str | None = None):
+    """
+    Soma (sign=1) ou subtrai (sign=-1) do cubo as parcelas do escopo: todas as
+    dos documentos `parents` (expense_id/revenue_id) ou as parcelas `ids`.
+    status força a célula ('open'/'settled') em vez de ler o flag — para tirar
+    do aberto parcelas que o próprio comando acabou de baixar.
+    """
+    if status not in (None, "open", "settled"):
+        raise ValueError(f"status inválido: {status!r}")
+    if parents is not None:
+        col, scope = _SOURCES[direction]["parent"], parents
+    else:
+        col, scope = "i.id", ids
+    scope = list(scope or [])
+    if not scope:
+        return
+    conn.execute(
+        _UPSERT.format(select=_select(direction, in_ids(col), "?", status)),
+        (int(sign), int(sign), ids_param(scope)),
+    )
+
+
+@contextmanager
+def tracked(conn, direction: str, parents=None, ids=None):
+    """Tira a contribuição do escopo antes do bloco e repõe a nova ao final."""
+    track(conn, direction, -1, parents=parents, ids=ids)
+    yield
+    track(conn, direction, 1, parents=parents, ids=ids)
+
+
+def bump(conn, company_id: int, day: str, direction: str, status: str, total: float, qtd: int = 1):
+    """Soma um valor conhecido a uma célula do cubo (sem ler as parcelas)."""
+    conn.execute(
+        _UPSERT.format(select="VALUES (?, ?, ?, ?, ?, ?)"),
+        (company_id, str(day)[:10], direction, status, total, qtd),
+    )
+
+
+# =============================================================================
+# Reconstrução
+# =============================================================================
+def rebuild_with(conn, company_id: int | None = None):
+    """Refaz o cubo (de uma empresa ou de todas) na transação de `conn`."""
+    if company_id is None:
+        conn.execute("DELETE FROM cash_daily")
+        where, params = "1 = 1", ()
+    else:
+        conn.execute("DELETE FROM cash_daily WHERE company_id=?", (company_id,))
+        where, params = "p.company_id = ?", (company_id,)
+    for direction in _SOURCES:
+        conn.execute(_UPSERT.format(select=_select(direction, where)), params)
+
+
+def rebuild(company_id: int | None = None) -> int:
+    """Refaz o cubo e devolve quantas células ficaram."""
+    with get_conn() as conn:
+        rebuild_with(conn, company_id)
+        sql, params = "SELECT COUNT(*) AS n FROM cash_daily", ()
+        if company_id is not None:
+            sql, params = sql + " WHERE company_id=?", (company_id,)
+        n = conn.execute(sql, params).fetchone()["n"]
+        conn.commit()
+    return n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cubo diário do fluxo de caixa (cash_daily)")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--company", type=int, default=None, help="só esta empresa (padrão: todas)")
+    args = parser.parse_args()
+    from init_db import migrate
+
+    migrate()
+    print(f"cash_daily reconstruído: {rebuild(args.company)} células")
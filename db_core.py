@@ -2,9 +2,16 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import atexit
 import os
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
 from contextlib import contextmanager
+from functools import lru_cache
+from contextvars import ContextVar
 from datetime import datetime
 
 # -----------------------------------------------------------------------------
@@ -73,6 +80,72 @@ USE_PG: bool = bool(DATABASE_URL and DATABASE_URL.startswith(("postgres://", "po
 # SQLite local (dev) – caminho padrão
 SQLITE_PATH = os.getenv("SQLITE_PATH", "locadora_finance.db")
 
+# Perfil SQLite: "dev" (padrão: conexão nova por bloco, journal padrão) ou
+# "production" (WAL + conexão cacheada por thread + fila de escrita com retry)
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "dev").strip().lower()
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # bytes
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))   # por conexão
+SQLITE_WRITE_RETRIES = int(os.getenv("SQLITE_WRITE_RETRIES", "8"))
+
+# Pool de conexões Postgres (valores por env; defaults pensados p/ Supabase free tier)
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "1"))                  # conexões mantidas abertas
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "10"))                 # teto por processo
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "30"))       # espera máx. no checkout (s)
+PG_POOL_MAX_IDLE = float(os.getenv("PG_POOL_MAX_IDLE", "300"))    # ociosa além disso é fechada (s)
+PG_POOL_CHECK_IDLE = float(os.getenv("PG_POOL_CHECK_IDLE", "30")) # ociosa além disso faz SELECT 1 (s)
+
+
+# =============================================================================
+# Escrita em lote: nomes de tabela/coluna entram no SQL, então são validados
+# =============================================================================
+_IDENT_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _check_idents(table: str, columns) -> list[str]:
+    cols = list(columns)
+    for name in [table, *cols]:
+        if not _IDENT_RE.match(name):
+            raise ValueError(f"Identificador SQL inválido: {name!r}")
+    if not cols:
+        raise ValueError("copy_rows exige ao menos uma coluna")
+    return cols
+
+
+# =============================================================================
+# Tradução de placeholders "?" -> "%s" (psycopg), respeitando literais
+# =============================================================================
+# Literais/identificadores/comentários passam intactos (exceto o escape de %);
+# fora deles "?" vira "%s". Todo "%" vira "%%": o psycopg interpreta % na
+# query inteira (inclusive dentro de '...') sempre que há parâmetros, e o
+# adapter sempre envia uma tupla.
+_SQL_TOKEN_RE = re.compile(
+    r"""
+      '(?:[^']|'')*'                             # 'literal' ('' escapa)
+    | "(?:[^"]|"")*"                             # "identificador"
+    | --[^\n]*                                   # comentário de linha
+    | /\*.*?\*/                                  # comentário de bloco
+    | \$(?P<tag>[A-Za-z_]\w*|)\$.*?\$(?P=tag)\$   # $tag$ dollar quote $tag$
+    | \?                                         # placeholder
+    | %
+    """,
+    re.DOTALL | re.VERBOSE,
+)
+PG_SQL_CACHE_SIZE = int(os.getenv("PG_SQL_CACHE_SIZE", "1024"))   # statements traduzidos em memória
+
+
+def _translate_token(m: re.Match) -> str:
+    tok = m.group(0)
+    if tok == "?":
+        return "%s"
+    return tok.replace("%", "%%")
+
+
+@lru_cache(maxsize=PG_SQL_CACHE_SIZE)
+def _qmark_to_pg(sql: str) -> str:
+    """Traduz uma vez por processo cada texto SQL (cache LRU por texto)."""
+    return _SQL_TOKEN_RE.sub(_translate_token, sql)
+
 
 # =============================================================================
 # Adaptador de conexão para expor .execute() com fetchone()/fetchall()
@@ -83,11 +156,14 @@ class _PgConnAdapter:
     - .execute(sql, params) -> cursor com .fetchone()/.fetchall()
     - .commit(), .close(), e suporte a 'with get_conn() as conn:'
     Converte placeholders "?" (sqlite) para "%s" (postgres).
+    Quando a conexão vem do pool, .close() devolve ao pool em vez de fechar.
     """
 
-    def __init__(self, raw_conn, driver: str):
+    def __init__(self, raw_conn, driver: str, release=None):
         self._raw = raw_conn
         self._driver = driver
+        self._release = release
+        self._touched: set[str] = set()   # tabelas escritas na transação (cache de consultas)
 
     def _cursor(self):
         if self._driver == "psycopg3":
@@ -98,26 +174,95 @@ class _PgConnAdapter:
 
     @staticmethod
     def _qmark_to_percent(sql: str) -> str:
-        # Conversão simples cobre nossos usos (placeholders posicionais).
-        return sql.replace("?", "%s")
+        return _qmark_to_pg(sql)
 
     def execute(self, sql: str, params: tuple | list = ()):
         if params is None:
             params = ()
         sql_pg = self._qmark_to_percent(sql)
+        _note_writes(self, sql)
         cur = self._cursor()
         cur.execute(sql_pg, params)
         return cur
 
+    def execute_tuples(self, sql: str, params: tuple | list = ()):
+        """Como execute(), mas com linhas em tupla (base do fetch colunar)."""
+        if params is None:
+            params = ()
+        _note_writes(self, sql)
+        cur = self._raw.cursor()
+        cur.execute(self._qmark_to_percent(sql), params)
+        return cur
+
+    def executemany(self, sql: str, seq_of_params):
+        """Mesmo SQL para várias linhas. psycopg3 envia tudo em pipeline
+        (um round trip); psycopg2 agrupa com execute_batch."""
+        sql_pg = self._qmark_to_percent(sql)
+        _note_writes(self, sql)
+        cur = self._raw.cursor()
+        if self._driver == "psycopg3":
+            cur.executemany(sql_pg, seq_of_params)
+        else:
+            _pg_extras.execute_batch(cur, sql_pg, seq_of_params, page_size=1000)
+        return cur
+
+    def copy_rows(self, table: str, columns, rows) -> int:
+        """Insere linhas novas pelo caminho mais rápido do driver:
+        COPY ... FROM STDIN (psycopg3) ou INSERT multi-VALUES (psycopg2).
+        Não trata conflitos — para upsert use executemany."""
+        cols = _check_idents(table, columns)
+        col_list = ", ".join(cols)
+        self._touched.add(table.lower())
+        cur = self._raw.cursor()
+        n = 0
+        if self._driver == "psycopg3":
+            with cur.copy(f"COPY {table} ({col_list}) FROM STDIN") as cp:
+                for row in rows:
+                    cp.write_row(row)
+                    n += 1
+        else:
+            rows = list(rows)
+            _pg_extras.execute_values(cur, f"INSERT INTO {table} ({col_list}) VALUES %s", rows, page_size=1000)
+            n = len(rows)
+        return n
+
+    @contextmanager
+    def pipeline(self):
+        """
+        Enfileira os comandos do bloco e os envia juntos (psycopg3 pipeline mode).
+        Chame commit() dentro do bloco para que BEGIN..COMMIT saiam num único
+        round trip; leia os cursores (RETURNING) só depois do bloco.
+        Em psycopg2 o bloco roda normalmente, comando a comando.
+        """
+        if self._driver == "psycopg3":
+            with self._raw.pipeline():
+                yield self
+        else:
+            yield self
+
     def executescript(self, *_args, **_kwargs):
         # Não usamos script em PG
         return None
 
     def commit(self):
+        stamps = _stamp_versions(self)
         self._raw.commit()
+        _publish_versions(stamps)
+
+    def rollback(self):
+        self._touched.clear()
+        self._raw.rollback()
+
+    def data_version_changed(self) -> bool:
+        # PG não tem data_version: o cache consulta cache_versions por intervalo
+        return True
 
     def close(self):
-        self._raw.close()
+        release, self._release = self._release, None
+        if release is not None:
+            release(self._raw)
+        elif not self._raw.closed:
+            self._raw.close()
 
     # context manager
     def __enter__(self):
@@ -127,288 +272,834 @@ class _PgConnAdapter:
         try:
             if exc:
                 try:
-                    self._raw.rollback()
+                    self.rollback()
                 except Exception:
                     pass
             else:
-                self._raw.commit()
+                self.commit()
         finally:
             self.close()
 
 
 # =============================================================================
-# Conexão unificada
+# Adaptador SQLite (mesma interface; no perfil production serializa escritas)
 # =============================================================================
-@contextmanager
-def get_conn():
+_WRITE_VERBS = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER")
+
+# Uma escrita por vez no processo: a transação de escrita segura o lock do
+# primeiro INSERT/UPDATE/... até commit()/rollback(); as demais esperam na fila.
+_sqlite_write_lock = threading.Lock()
+
+
+def _is_write(sql: str) -> bool:
+    head = sql.lstrip().split(None, 2)
+    if not head:
+        return False
+    verb = head[0].upper()
+    if verb == "BEGIN":  # BEGIN IMMEDIATE/EXCLUSIVE já reservam a escrita
+        return len(head) > 1 and head[1].upper().rstrip(";") in ("IMMEDIATE", "EXCLUSIVE")
+    return verb in _WRITE_VERBS
+
+
+_RETURNING_RE = re.compile(r"\bRETURNING\b", re.IGNORECASE)
+
+
+class _BufferedCursor:
+    """Cursor já lido (INSERT ... RETURNING no SQLite); mesma leitura de um cursor comum."""
+
+    def __init__(self, cur):
+        self._rows = cur.fetchall()
+        self._pos = 0
+        self.rowcount = cur.rowcount
+        self.lastrowid = cur.lastrowid
+        self.description = cur.description
+
+    def fetchone(self):
+        if self._pos >= len(self._rows):
+            return None
+        self._pos += 1
+        return self._rows[self._pos - 1]
+
+    def fetchmany(self, size: int = 1):
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._rows[self._pos:]
+        self._pos = len(self._rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+def _is_locked_error(exc: Exception) -> bool:
+    msg = str(exc).lower()
+    return "locked" in msg or "busy" in msg
+
+
+class _SqliteConnAdapter:
     """
-    Retorna uma conexão com interface uniforme para SQLite e Postgres (Supabase).
-    - SQLite: sqlite3.Connection com .execute()
-    - Postgres: _PgConnAdapter expondo .execute() (placeholders "?" convertidos p/ %s)
+    Envolve sqlite3.Connection mantendo a interface usada nas páginas
+    (.execute() -> cursor, .commit(), .close(), cur.lastrowid, linhas sqlite3.Row).
+    Com serialize_writes=True:
+    - a 1ª escrita da transação entra na fila (_sqlite_write_lock) e só sai no commit/rollback
+    - "database is locked" (outro processo escrevendo) é re-tentado com backoff
     """
-    if USE_PG:
-        if not _pg_mod:
-            raise RuntimeError(
-                "Driver Postgres não encontrado. Adicione 'psycopg[binary]>=3.1' "
-                "ou 'psycopg2-binary>=2.9' ao requirements.txt."
-            )
-        driver, mod = _pg_mod
-        if driver == "psycopg3":
-            conn = mod.connect(DATABASE_URL, autocommit=False)
-            try:
-                yield _PgConnAdapter(conn, driver="psycopg3")
-            finally:
-                conn.close()
-        else:  # psycopg2
-            conn = mod.connect(DATABASE_URL)
+
+    def __init__(self, raw_conn: sqlite3.Connection, serialize_writes: bool = False):
+        self._raw = raw_conn
+        self._serialize = serialize_writes
+        self._holds_write = False
+        self._touched: set[str] = set()   # tabelas escritas na transação (cache de consultas)
+        self._data_version = None
+
+    def _acquire_write(self):
+        if self._serialize and not self._holds_write:
+            if not _sqlite_write_lock.acquire(timeout=SQLITE_BUSY_TIMEOUT_MS / 1000 * SQLITE_WRITE_RETRIES):
+                raise sqlite3.OperationalError("database is locked (fila de escrita esgotou o tempo)")
+            self._holds_write = True
+
+    def _release_write(self):
+        if self._holds_write:
+            self._holds_write = False
+            _sqlite_write_lock.release()
+
+    def _retry(self, fn, *args):
+        if not self._serialize:
+            return fn(*args)
+        delay = 0.01
+        for attempt in range(SQLITE_WRITE_RETRIES):
             try:
-                yield _PgConnAdapter(conn, driver="psycopg2")
-            finally:
-                conn.close()
-    else:
-        conn = sqlite3.connect(SQLITE_PATH, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
+                return fn(*args)
+            except sqlite3.OperationalError as exc:
+                if not _is_locked_error(exc) or attempt == SQLITE_WRITE_RETRIES - 1:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+
+    def execute(self, sql: str, params: tuple | list = ()):
+        if params is None:
+            params = ()
+        if _is_write(sql):
+            self._acquire_write()
+            _note_writes(self, sql)
+            cur = self._retry(self._raw.execute, sql, params)
+            if _RETURNING_RE.search(sql):
+                # sqlite só conclui o comando ao ler o RETURNING; sem isso o
+                # commit falha com "SQL statements in progress"
+                return _BufferedCursor(cur)
+            return cur
+        return self._raw.execute(sql, params)
+
+    def execute_tuples(self, sql: str, params: tuple | list = ()):
+        """Como execute(), mas com linhas em tupla (sem sqlite3.Row por linha)."""
+        if _is_write(sql):
+            return self.execute(sql, params)
+        cur = self._raw.cursor()
+        cur.row_factory = None
+        return cur.execute(sql, params or ())
+
+    def executemany(self, sql: str, seq_of_params):
+        if self._serialize:
+            seq_of_params = list(seq_of_params)  # o retry precisa reler as linhas
+        self._acquire_write()
+        _note_writes(self, sql)
+        return self._retry(self._raw.executemany, sql, seq_of_params)
+
+    def copy_rows(self, table: str, columns, rows) -> int:
+        """Mesma API do PG: um único INSERT preparado reaproveitado em executemany."""
+        cols = _check_idents(table, columns)
+        marks = ", ".join("?" * len(cols))
+        cur = self.executemany(f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({marks})", rows)
+        return cur.rowcount
+
+    def executescript(self, script: str):
+        self._acquire_write()
+        _note_writes(self, script, force=True)
+        return self._retry(self._raw.executescript, script)
+
+    @contextmanager
+    def pipeline(self):
+        # SQLite é local: não há round trip a economizar
+        yield self
+
+    def commit(self):
         try:
-            conn.execute("PRAGMA foreign_keys = ON;")
-        except Exception:
-            pass
+            stamps = _stamp_versions(self)
+            self._retry(self._raw.commit)
+            _publish_versions(stamps)
+        finally:
+            self._release_write()
+
+    def rollback(self):
+        self._touched.clear()
         try:
-            yield conn
+            self._raw.rollback()
         finally:
-            conn.close()
+            self._release_write()
+
+    def data_version_changed(self) -> bool:
+        """True se outra conexão (thread/processo) commitou desde a última checagem."""
+        v = self._raw.execute("PRAGMA data_version").fetchone()[0]
+        changed, self._data_version = v != self._data_version, v
+        return changed
+
+    def close(self):
+        try:
+            self._raw.close()
+        finally:
+            self._release_write()
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._raw.in_transaction
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    # context manager
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc:
+                self.rollback()
+            else:
+                self.commit()
+        finally:
+            self.close()
+
+
+_sqlite_local = threading.local()
+
+
+def _sqlite_production() -> bool:
+    return SQLITE_PROFILE in ("production", "prod")
+
+
+def _sqlite_connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(SQLITE_PATH, check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+    conn.row_factory = sqlite3.Row
+    pragmas = ["PRAGMA foreign_keys = ON;"]
+    if _sqlite_production():
+        pragmas += [
+            "PRAGMA journal_mode = WAL;",       # leitores não bloqueiam o escritor
+            "PRAGMA synchronous = NORMAL;",     # seguro com WAL, fsync só no checkpoint
+            f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS};",
+            f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE};",
+            f"PRAGMA cache_size = {-SQLITE_CACHE_SIZE_KB};",  # negativo = KiB
+        ]
+    for pragma in pragmas:
+        try:
+            conn.execute(pragma)
+        except Exception:
+            pass
+    return conn
+
+
+def _sqlite_thread_conn() -> _SqliteConnAdapter:
+    """Conexão cacheada da thread atual (perfil production)."""
+    adapter = getattr(_sqlite_local, "conn", None)
+    if adapter is None or getattr(_sqlite_local, "path", None) != SQLITE_PATH:
+        adapter = _SqliteConnAdapter(_sqlite_connect(), serialize_writes=True)
+        _sqlite_local.conn = adapter
+        _sqlite_local.path = SQLITE_PATH
+    return adapter
 
 
 # =============================================================================
-# Schema / Seed (idempotente)
-#  - Em SQLite: cria e ajusta colunas.
-#  - Em Postgres/Supabase: tenta criar/alterar (se permissões permitirem). Se não puder, ignora.
+# Pool de conexões Postgres (processo inteiro)
 # =============================================================================
-def init_schema_and_seed():
+class PoolTimeout(RuntimeError):
+    """Nenhuma conexão livre no pool dentro de PG_POOL_TIMEOUT."""
+
+
+class _PgPool:
     """
-    Cria o schema mínimo e garante colunas requeridas pelos módulos (Home, Empresas, Clientes).
+    Pool simples e thread-safe para psycopg3/psycopg2:
+    - min_size conexões mantidas abertas; no máximo max_size por processo
+    - checkout espera até `timeout` segundos e então levanta PoolTimeout
+    - conexões ociosas há mais de `check_idle` passam por um SELECT 1 antes do uso
+    - conexões ociosas há mais de `max_idle` (acima de min_size) são fechadas
+    - na devolução, qualquer transação pendente é desfeita (rollback)
     """
 
-    def _exec_silent(conn, sql: str, params: tuple = ()):
+    def __init__(self, connect, min_size: int, max_size: int, timeout: float,
+                 max_idle: float, check_idle: float):
+        self._connect = connect
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.check_idle = check_idle
+        self._idle = deque()  # (conn, devolvida_em); mais recente à direita
+        self._size = 0        # conexões abertas (ociosas + emprestadas)
+        self._cond = threading.Condition()
+        self._closed = False
+        for _ in range(self.min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    @staticmethod
+    def _is_closed(conn) -> bool:
+        return bool(getattr(conn, "closed", False)) or bool(getattr(conn, "broken", False))
+
+    @staticmethod
+    def _healthy(conn) -> bool:
         try:
-            conn.execute(sql, params)
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            conn.rollback()
+            return True
         except Exception:
-            # já existe / sem permissão / outro detalhe — segue
-            pass
+            return False
 
-    def _ensure_col(conn, table: str, col: str, decl: str):
-        """
-        Adiciona coluna se ainda não existir. Funciona em SQLite/PG usando try/except.
-        Ex.: _ensure_col(conn, "companies", "resp_cpf", "TEXT")
-        """
+    @staticmethod
+    def _discard(conn):
         try:
-            conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} {decl}")
+            conn.close()
         except Exception:
             pass
 
-    with get_conn() as conn:
-        # ---------------- users ----------------
-        if USE_PG:
-            _exec_silent(
-                conn,
-                """
-                CREATE TABLE IF NOT EXISTS users (
-                  id BIGSERIAL PRIMARY KEY,
-                  name TEXT NOT NULL,
-                  email TEXT UNIQUE NOT NULL,
-                  password_hash BYTEA NOT NULL,
-                  is_active INTEGER DEFAULT 1,
-                  role TEXT DEFAULT 'user',
-                  created_at TIMESTAMPTZ DEFAULT NOW()
-                )
-                """,
-            )
-        else:
-            _exec_silent(
-                conn,
-                """
-                CREATE TABLE IF NOT EXISTS users (
-                  id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  name TEXT NOT NULL,
-                  email TEXT UNIQUE NOT NULL,
-                  password_hash BLOB NOT NULL,
-                  is_active INTEGER DEFAULT 1,
-                  role TEXT DEFAULT 'user',
-                  created_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-                """,
-            )
-        _ensure_col(conn, "users", "is_active", "INTEGER DEFAULT 1")
-        _ensure_col(conn, "users", "role", "TEXT")
-        _ensure_col(conn, "users", "created_at", "TEXT" if not USE_PG else "TIMESTAMPTZ")
+    def _reap_locked(self, now: float) -> list:
+        """Remove (sob lock) ociosas antigas acima do mínimo; fecha fora do lock."""
+        reaped = []
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.max_idle:
+            reaped.append(self._idle.popleft()[0])
+            self._size -= 1
+        return reaped
 
-        # --------------- companies ---------------
-        if USE_PG:
-            _exec_silent(
-                conn,
-                """
-                CREATE TABLE IF NOT EXISTS companies (
-                  id BIGSERIAL PRIMARY KEY,
-                  cnpj TEXT NOT NULL,
-                  razao_social TEXT NOT NULL,
-                  nome_fantasia TEXT,
-                  endereco TEXT,
-                  regime TEXT,
-                  created_at TIMESTAMPTZ DEFAULT NOW()
-                )
-                """,
-            )
-        else:
-            _exec_silent(
-                conn,
-                """
-                CREATE TABLE IF NOT EXISTS companies (
-                  id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  cnpj TEXT NOT NULL,
-                  razao_social TEXT NOT NULL,
-                  nome_fantasia TEXT,
-                  endereco TEXT,
-                  regime TEXT,
-                  created_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-                """,
-            )
-        # Colunas utilizadas pela página Empresas (01)
-        _ensure_col(conn, "companies", "resp_cpf", "TEXT")
-        _ensure_col(conn, "companies", "resp_nome", "TEXT")
-        _ensure_col(conn, "companies", "resp_telefone", "TEXT")
-        _ensure_col(conn, "companies", "resp_email", "TEXT")
-        _ensure_col(conn, "companies", "cep", "TEXT")
-        _ensure_col(conn, "companies", "logradouro", "TEXT")
-        _ensure_col(conn, "companies", "complemento", "TEXT")
-        _ensure_col(conn, "companies", "numero", "TEXT")
-        _ensure_col(conn, "companies", "bairro", "TEXT")
-        _ensure_col(conn, "companies", "cidade", "TEXT")
-        _ensure_col(conn, "companies", "estado", "TEXT")
-        _ensure_col(conn, "companies", "cnae_principal", "TEXT")
-        _ensure_col(conn, "companies", "cnae_secundarios", "TEXT")
-
-        # --------------- clients ---------------
-        # (módulo Clientes / página 02)
-        if USE_PG:
-            _exec_silent(
-                conn,
-                """
-                CREATE TABLE IF NOT EXISTS clients (
-                  id BIGSERIAL PRIMARY KEY,
-                  company_id BIGINT NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
-                  nome TEXT NOT NULL,
-                  doc TEXT,
-                  email TEXT,
-                  phone TEXT,
-                  address TEXT,
-                  cep TEXT,
-                  logradouro TEXT,
-                  complemento TEXT,
-                  numero TEXT,
-                  bairro TEXT,
-                  cidade TEXT,
-                  estado TEXT,
-                  created_at TIMESTAMPTZ DEFAULT NOW()
-                )
-                """,
-            )
-        else:
-            _exec_silent(
-                conn,
-                """
-                CREATE TABLE IF NOT EXISTS clients (
-                  id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
-                  nome TEXT NOT NULL,
-                  doc TEXT,
-                  email TEXT,
-                  phone TEXT,
-                  address TEXT,
-                  cep TEXT,
-                  logradouro TEXT,
-                  complemento TEXT,
-                  numero TEXT,
-                  bairro TEXT,
-                  cidade TEXT,
-                  estado TEXT,
-                  created_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-                """,
-            )
-        # Garante colunas que páginas podem usar
-        _ensure_col(conn, "clients", "doc", "TEXT")
-        _ensure_col(conn, "clients", "email", "TEXT")
-        _ensure_col(conn, "clients", "phone", "TEXT")
-        _ensure_col(conn, "clients", "address", "TEXT")
-        _ensure_col(conn, "clients", "cep", "TEXT")
-        _ensure_col(conn, "clients", "logradouro", "TEXT")
-        _ensure_col(conn, "clients", "complemento", "TEXT")
-        _ensure_col(conn, "clients", "numero", "TEXT")
-        _ensure_col(conn, "clients", "bairro", "TEXT")
-        _ensure_col(conn, "clients", "cidade", "TEXT")
-        _ensure_col(conn, "clients", "estado", "TEXT")
-        _ensure_col(conn, "clients", "created_at", "TEXT" if not USE_PG else "TIMESTAMPTZ")
-        # Índice por empresa
-        _exec_silent(conn, "CREATE INDEX IF NOT EXISTS idx_clients_company_id ON clients(company_id)")
-
-        # --------------- user_companies ---------------
-        if USE_PG:
-            _exec_silent(
-                conn,
-                """
-                CREATE TABLE IF NOT EXISTS user_companies (
-                  user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                  company_id BIGINT NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
-                  PRIMARY KEY (user_id, company_id)
-                )
-                """,
-            )
-        else:
-            _exec_silent(
-                conn,
-                """
-                CREATE TABLE IF NOT EXISTS user_companies (
-                  user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                  company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
-                  PRIMARY KEY (user_id, company_id)
-                )
-                """,
-            )
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn, idle_since, create = None, None, False
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Pool de conexões encerrado.")
+                while True:
+                    now = time.monotonic()
+                    for old in self._reap_locked(now):
+                        self._discard(old)
+                    if self._idle:
+                        conn, idle_since = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            f"Sem conexão livre no pool após {self.timeout:g}s "
+                            f"(max={self.max_size})."
+                        )
+                    self._cond.wait(remaining)
 
-        # --------------- password_reset_tokens ---------------
-        if USE_PG:
-            _exec_silent(
-                conn,
-                """
-                CREATE TABLE IF NOT EXISTS password_reset_tokens (
-                  id BIGSERIAL PRIMARY KEY,
-                  user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                  token TEXT UNIQUE NOT NULL,
-                  expires_at TIMESTAMPTZ NOT NULL,
-                  used INTEGER DEFAULT 0
-                )
-                """,
-            )
-        else:
-            _exec_silent(
-                conn,
-                """
-                CREATE TABLE IF NOT EXISTS password_reset_tokens (
-                  id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                  token TEXT UNIQUE NOT NULL,
-                  expires_at TEXT NOT NULL,  -- ISO UTC
-                  used INTEGER DEFAULT 0
+            if create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            stale = time.monotonic() - idle_since > self.check_idle
+            if not self._is_closed(conn) and (not stale or self._healthy(conn)):
+                return conn
+            # conexão morta (ex.: Supabase derrubou por inatividade) — descarta e tenta de novo
+            self._discard(conn)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+
+    def putconn(self, conn, broken: bool = False):
+        if not broken and not self._is_closed(conn):
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        with self._cond:
+            if broken or self._closed or self._is_closed(conn):
+                self._size -= 1
+                drop = True
+            else:
+                self._idle.append((conn, time.monotonic()))
+                drop = False
+            self._cond.notify()
+        if drop:
+            self._discard(conn)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"size": self._size, "idle": len(self._idle), "max": self.max_size}
+
+
+_pg_pool: _PgPool | None = None
+_pg_pool_lock = threading.Lock()
+
+
+def _pg_connect():
+    driver, mod = _pg_mod
+    if driver == "psycopg3":
+        return mod.connect(DATABASE_URL, autocommit=False)
+    return mod.connect(DATABASE_URL)
+
+
+def get_pg_pool() -> _PgPool:
+    """Pool único do processo (criado sob demanda no primeiro get_conn)."""
+    global _pg_pool
+    if _pg_pool is None:
+        with _pg_pool_lock:
+            if _pg_pool is None:
+                _pg_pool = _PgPool(
+                    _pg_connect,
+                    min_size=PG_POOL_MIN,
+                    max_size=PG_POOL_MAX,
+                    timeout=PG_POOL_TIMEOUT,
+                    max_idle=PG_POOL_MAX_IDLE,
+                    check_idle=PG_POOL_CHECK_IDLE,
                 )
-                """,
+                atexit.register(_pg_pool.close)
+    return _pg_pool
+
+
+# =============================================================================
+# Conexão unificada + "unit of work" por contexto
+#  - O get_conn() mais externo abre a conexão e a publica num ContextVar.
+#  - get_conn() aninhados (ex.: list_user_companies chamado dentro de outro bloco)
+#    reutilizam a mesma conexão/transação; commit()/close() neles viram no-op.
+#  - Só o bloco mais externo faz commit (saída normal) ou rollback (exceção) e fecha.
+# =============================================================================
+_ambient_conn: ContextVar = ContextVar("db_core_ambient_conn", default=None)
+
+
+class _NestedConn:
+    """Visão de uma conexão aberta por um get_conn() externo (commit/close adiados)."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def commit(self):
+        # quem commita é o bloco mais externo
+        return None
+
+    def close(self):
+        return None
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def last_insert_id_sql(table: str, pk: str = "id") -> str:
+    """
+    Expressão SQL com o id recém-gerado em `table` nesta transação, para
+    encadear INSERTs dependentes sem ler o RETURNING (útil dentro de pipeline()).
+    PG: currval() da sequence é por sessão. SQLite: a transação que inseriu
+    segura o lock de escrita, então MAX(pk) é o próprio registro.
+    """
+    _check_idents(table, [pk])
+    if USE_PG:
+        return f"currval(pg_get_serial_sequence('{table}', '{pk}'))"
+    return f"(SELECT MAX({pk}) FROM {table})"
+
+
+@contextmanager
+def _open_conn():
+    if USE_PG:
+        if not _pg_mod:
+            raise RuntimeError(
+                "Driver Postgres não encontrado. Adicione 'psycopg[binary]>=3.1' "
+                "ou 'psycopg2-binary>=2.9' ao requirements.txt."
             )
+        pool = get_pg_pool()
+        raw = pool.getconn()
+        adapter = _PgConnAdapter(raw, driver=_pg_mod[0], release=pool.putconn)
+        try:
+            yield adapter
+        finally:
+            adapter.close()
+    elif _sqlite_production():
+        conn = _sqlite_thread_conn()
+        try:
+            yield conn
+        finally:
+            # a conexão fica com a thread; só garante que nenhuma transação sobrou
+            if conn.in_transaction:
+                conn.rollback()
+            else:
+                conn._release_write()
+    else:
+        conn = _SqliteConnAdapter(_sqlite_connect())
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+@contextmanager
+def get_conn():
+    """
+    Retorna uma conexão com interface uniforme para SQLite e Postgres (Supabase).
+    - SQLite: _SqliteConnAdapter (sqlite3.Connection com .execute()); no perfil
+      SQLITE_PROFILE=production a conexão é cacheada por thread (WAL)
+    - Postgres: _PgConnAdapter expondo .execute() (placeholders "?" convertidos p/ %s),
+      emprestado do pool do processo e devolvido ao final do bloco
+    Chamadas aninhadas reaproveitam a conexão (e a transação) do bloco externo.
+    """
+    outer = _ambient_conn.get()
+    if outer is not None:
+        yield _NestedConn(outer)
+        return
 
-        # FKs (SQLite) e finaliza
-        _exec_silent(conn, "PRAGMA foreign_keys = ON;")
+    with _open_conn() as conn:
+        token = _ambient_conn.set(conn)
         try:
+            yield conn
             conn.commit()
-        except Exception:
-            pass
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            _ambient_conn.reset(token)
+
+
+def in_transaction() -> bool:
+    """True se há um get_conn() aberto neste contexto (thread/sessão)."""
+    return _ambient_conn.get() is not None
+
+
+# =============================================================================
+# Leitura colunar: cursor -> pyarrow.Table / pandas.DataFrame (sem dict por linha)
+# =============================================================================
+FETCH_BATCH_ROWS = 20_000
+
+
+def _arrow_column(values):
+    import pyarrow as pa
+
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # tipos mistos (ex.: SQLite sem afinidade): cai para texto
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def _unify_chunks(chunks):
+    """Mesmo tipo para todos os lotes de uma coluna (lotes só-NULL herdam o tipo real)."""
+    import pyarrow as pa
+
+    types = {c.type for c in chunks if c.type != pa.null()}
+    if not types:
+        return pa.chunked_array(chunks, type=pa.null())
+    if len(types) == 1:
+        target = types.pop()
+    elif all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types):
+        target = pa.float64()
+    else:
+        target = pa.string()
+    return pa.chunked_array([c if c.type == target else c.cast(target) for c in chunks], type=target)
+
+
+def _parse_dates(col):
+    """Texto ISO (YYYY-MM-DD[ HH:MM:SS]) -> timestamp; valores inválidos viram nulo."""
+    import pyarrow as pa
+
+    if pa.types.is_timestamp(col.type):
+        return col
+    if pa.types.is_date(col.type):
+        return col.cast(pa.timestamp("us"))
+    try:
+        return col.cast(pa.timestamp("us"))
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        import pandas as pd
+
+        parsed = pd.to_datetime(pd.Series(col.to_pylist(), dtype="object"), errors="coerce", format="ISO8601")
+        return pa.chunked_array([pa.array(parsed, type=pa.timestamp("us"), from_pandas=True)])
+
+
+def fetch_arrow(sql: str, params: tuple | list = (), parse_dates=(), batch_rows: int = FETCH_BATCH_ROWS):
+    """
+    Executa um SELECT e devolve pyarrow.Table montada direto do cursor, em lotes
+    (fetchmany), coluna a coluna — sem materializar um dict Python por linha.
+    parse_dates: colunas de texto ISO a converter para timestamp.
+    """
+    import pyarrow as pa
+
+    with get_conn() as conn:
+        cur = conn.execute_tuples(sql, params)
+        names = [d[0] for d in cur.description]
+        chunks = [[] for _ in names]
+        while True:
+            batch = cur.fetchmany(batch_rows)
+            if not batch:
+                break
+            for i, values in enumerate(zip(*batch)):
+                chunks[i].append(_arrow_column(values))
+            del batch
+
+    columns = [_unify_chunks(c) if c else pa.chunked_array([], type=pa.null()) for c in chunks]
+    for i, name in enumerate(names):
+        if name in parse_dates:
+            columns[i] = _parse_dates(columns[i])
+    return pa.Table.from_arrays(columns, names=names)
+
+
+def fetch_df(sql: str, params: tuple | list = (), parse_dates=(), batch_rows: int = FETCH_BATCH_ROWS):
+    """
+    Como fetch_arrow(), mas devolve pandas.DataFrame com dtypes tipados:
+    inteiros/reais numéricos, datas em datetime64 e texto em string[pyarrow].
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    table = fetch_arrow(sql, params, parse_dates=parse_dates, batch_rows=batch_rows)
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get)
+
+
+# =============================================================================
+# Cache de consultas com versão por tabela
+#  - chave: SQL normalizado + parâmetros; LRU (QUERY_CACHE_MAX) + TTL (QUERY_CACHE_TTL)
+#  - cada entrada guarda as versões das tabelas lidas; qualquer escrita via
+#    get_conn() incrementa a versão das tabelas tocadas no commit, o que
+#    invalida as entradas que as leem
+#  - entre processos: cada commit também incrementa cache_versions no banco;
+#    SQLite só relê essa tabela quando PRAGMA data_version muda, PG a relê no
+#    máximo a cada QUERY_CACHE_PG_POLL segundos
+# =============================================================================
+QUERY_CACHE_MAX = int(os.getenv("QUERY_CACHE_MAX", "512"))              # entradas (0 desliga)
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "60"))             # s
+QUERY_CACHE_PG_POLL = float(os.getenv("QUERY_CACHE_PG_POLL", "1.0"))    # s entre leituras de cache_versions
+
+_VERSIONS_TABLE = "cache_versions"
+_READ_TABLES_RE = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)", re.IGNORECASE)
+_WRITE_TABLES_RE = re.compile(
+    r"\b(?:INTO|UPDATE|FROM|JOIN|TABLE)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?([A-Za-z_]\w*)", re.IGNORECASE
+)
+_NOT_TABLES = {"set", "only", _VERSIONS_TABLE, "schema_migrations"}
+
+
+@lru_cache(maxsize=1024)
+def _read_tables(sql: str) -> frozenset:
+    return frozenset(t.lower() for t in _READ_TABLES_RE.findall(sql)) - _NOT_TABLES
+
+
+@lru_cache(maxsize=1024)
+def _write_tables(sql: str) -> frozenset:
+    return frozenset(t.lower() for t in _WRITE_TABLES_RE.findall(sql)) - _NOT_TABLES
+
+
+@lru_cache(maxsize=1024)
+def _normalize_sql(sql: str) -> str:
+    # colapsa espaços fora de 'literais' (a chave não pode juntar literais distintos)
+    return re.sub(r"('(?:[^']|'')*')|\s+", lambda m: m.group(1) or " ", sql).strip()
+
+
+def _note_writes(conn, sql: str, force: bool = False):
+    if force or _is_write(sql):
+        conn._touched.update(_write_tables(sql))
+
+
+class _QueryCache:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()   # key -> (expira, tabelas, versões, valor)
+        self._versions: dict[str, int] = {}
+        self._versions_ready = False
+        self._last_poll = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def snapshot(self, tables) -> tuple:
+        with self._lock:
+            return tuple(self._versions.get(t, 0) for t in tables)
+
+    def get(self, key, tables):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, _tables, versions, value = entry
+                if now < expires and versions == tuple(self._versions.get(t, 0) for t in tables):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, tables, versions, value, ttl: float | None = None):
+        with self._lock:
+            if versions != tuple(self._versions.get(t, 0) for t in tables):
+                return  # houve escrita durante a leitura: não guarda valor velho
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), tables, versions, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def bump(self, versions: dict):
+        """Aplica versões novas (commit local ou lidas do banco) e descarta o que ficou velho."""
+        with self._lock:
+            changed = {t for t, v in versions.items() if v > self._versions.get(t, 0)}
+            for t in changed:
+                self._versions[t] = versions[t]
+            if changed:
+                stale = [k for k, e in self._entries.items() if changed & e[1]]
+                for k in stale:
+                    del self._entries[k]
+
+    def refresh(self, conn):
+        """Incorpora escritas de outros processos (ver cabeçalho da seção)."""
+        if USE_PG:
+            now = time.monotonic()
+            if now - self._last_poll < QUERY_CACHE_PG_POLL:
+                return
+            self._last_poll = now
+        elif not conn.data_version_changed():
+            return
+        if not _versions_table_ready(conn):
+            return
+        rows = conn.execute(f"SELECT table_name, version FROM {_VERSIONS_TABLE}").fetchall()
+        self.bump({r["table_name"]: int(r["version"]) for r in rows})
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / total) if total else 0.0,
+            }
+
+
+_query_cache = _QueryCache(QUERY_CACHE_MAX, QUERY_CACHE_TTL)
+
+
+def _versions_table_ready(conn) -> bool:
+    if _query_cache._versions_ready:
+        return True
+    if USE_PG:
+        row = conn.execute(f"SELECT to_regclass('{_VERSIONS_TABLE}') IS NOT NULL AS ok").fetchone()
+        ok = bool(row and row["ok"])
+    else:
+        ok = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (_VERSIONS_TABLE,)
+        ).fetchone() is not None
+    _query_cache._versions_ready = ok
+    return ok
+
+
+def _stamp_versions(conn):
+    """Antes do commit: incrementa cache_versions das tabelas escritas (mesma transação)."""
+    tables, conn._touched = conn._touched, set()
+    if not tables:
+        return None
+    if not _versions_table_ready(conn):
+        return [(t, None) for t in tables]
+    sql = (
+        f"INSERT INTO {_VERSIONS_TABLE}(table_name, version) VALUES (?, 1) "
+        f"ON CONFLICT(table_name) DO UPDATE SET version = {_VERSIONS_TABLE}.version + 1 "
+        "RETURNING version"
+    )
+    return [(t, conn.execute(sql, (t,))) for t in sorted(tables)]
+
+
+def _publish_versions(stamps):
+    """Depois do commit: publica as versões novas no cache do processo."""
+    if not stamps:
+        return
+    new = {}
+    for table, cur in stamps:
+        row = cur.fetchone() if cur is not None else None
+        # sem cache_versions (banco ainda não migrado) a versão só anda localmente
+        new[table] = int(row["version"]) if row else _query_cache._versions.get(table, 0) + 1
+    _query_cache.bump(new)
+
+
+def _cached(kind: str, sql: str, params, ttl, load, extra=()):
+    if QUERY_CACHE_MAX <= 0:
+        return load()
+    norm = _normalize_sql(sql)
+    tables = tuple(sorted(_read_tables(norm)))
+    key = (kind, norm, tuple(params or ()), extra)
+    with get_conn() as conn:
+        if conn._touched & set(tables):
+            return load()   # transação com escrita pendente nessas tabelas: lê direto
+        _query_cache.refresh(conn)
+        value = _query_cache.get(key, tables)
+        if value is not None:
+            return value
+        versions = _query_cache.snapshot(tables)
+        value = load()
+    _query_cache.put(key, frozenset(tables), versions, value, ttl)
+    return value
+
+
+def cached_query(sql: str, params: tuple | list = (), ttl: float | None = None) -> list[dict]:
+    """
+    Como conn.execute(sql, params).fetchall(), mas servido do cache enquanto
+    nenhuma tabela lida mudar (e dentro do TTL). Linhas vêm como dict (cópias).
+    """
+    def load():
+        with get_conn() as conn:
+            return tuple(dict(r) for r in conn.execute(sql, params).fetchall())
+
+    return [dict(r) for r in _cached("rows", sql, params, ttl, load)]
+
+
+def cached_df(sql: str, params: tuple | list = (), parse_dates=(), ttl: float | None = None):
+    """fetch_df() com o mesmo cache; devolve uma cópia (as páginas alteram o DataFrame)."""
+    def load():
+        return fetch_df(sql, params, parse_dates=parse_dates)
+
+    return _cached("df", sql, params, ttl, load, extra=tuple(parse_dates)).copy()
+
+
+def query_cache_stats() -> dict:
+    """Entradas, acertos, faltas e taxa de acerto do cache de consultas."""
+    return _query_cache.stats()
+
+
+def query_cache_clear():
+    _query_cache.clear()
+
+
+# =============================================================================
+# Schema / Seed
+#  - Agora versionado: ver init_db.MIGRATIONS (aplicadas uma vez, registradas em
+#    schema_migrations). Mantido aqui por compatibilidade com quem já importava.
+# =============================================================================
+def init_schema_and_seed():
+    """
+    Garante o schema (migrações pendentes). Depois da 1ª vez custa uma consulta de versão.
+    """
+    from init_db import migrate  # import tardio: init_db depende de db_core
+
+    migrate()
 
 
 # =============================================================================
@@ -0,0 +1,97 @@
+# dialect.py
+# -*- coding: utf-8 -*-
+"""
+Trechos de SQL que mudam entre SQLite e Postgres.
+
+Datas ficam em TEXT ISO ('YYYY-MM-DD' / 'YYYY-MM-DDTHH:MM:SS') nas duas bases,
+então a ordem lexicográfica é a cronológica: filtros viram comparações diretas
+na coluna (col >= ? AND col < ?), que usam índice, em vez de date(col) /
+strftime(col), que obrigam a avaliar linha a linha. "Hoje" vem do Python como
+parâmetro (data local), não de date('now') (UTC no SQLite, inexistente no PG).
+"""
+from __future__ import annotations
+
+import json
+from datetime import date
+
+from db_core import USE_PG, _check_idents
+
+
+# ---------- "agora" ----------
+def today_iso() -> str:
+    return date.today().isoformat()
+
+
+def now_sql() -> str:
+    """Expressão de timestamp do servidor (para DEFAULT/UPDATE ... SET x=...)."""
+    return "NOW()" if USE_PG else "CURRENT_TIMESTAMP"
+
+
+# ---------- buckets (SELECT / GROUP BY) ----------
+def month_bucket(col: str) -> str:
+    """'YYYY-MM' da coluna ISO (substr existe nas duas bases)."""
+    return f"substr({col}, 1, 7)"
+
+
+def day_bucket(col: str) -> str:
+    """'YYYY-MM-DD' da coluna ISO (descarta hora, se houver)."""
+    return f"substr({col}, 1, 10)"
+
+
+# ---------- filtros sargáveis (WHERE) ----------
+def before(col: str) -> str:
+    """col < ? — passe a data ISO (ex.: today_iso()) como parâmetro."""
+    return f"{col} < ?"
+
+
+def in_range(col: str) -> str:
+    """Intervalo meio-aberto col >= ? AND col < ?; parâmetros de day_params/month_params."""
+    return f"{col} >= ? AND {col} < ?"
+
+
+def day_params(d: date | str) -> tuple[str, str]:
+    """Início do dia e do dia seguinte, para in_range()."""
+    d = date.fromisoformat(str(d)[:10])
+    return d.isoformat(), date.fromordinal(d.toordinal() + 1).isoformat()
+
+
+def month_params(ym: str) -> tuple[str, str]:
+    """'YYYY-MM' -> primeiro dia do mês e do mês seguinte, para in_range()."""
+    y, m = int(ym[:4]), int(ym[5:7])
+    nxt = (y + 1, 1) if m == 12 else (y, m + 1)
+    return f"{y:04d}-{m:02d}-01", f"{nxt[0]:04d}-{nxt[1]:02d}-01"
+
+
+# ---------- listas de ids num único parâmetro ----------
+# O texto do SQL não muda com a quantidade de ids (cache de tradução e plano
+# reaproveitados; sem limite de placeholders).
+def in_ids(col: str) -> str:
+    """col pertence à lista passada por ids_param()."""
+    if USE_PG:
+        return f"{col} = ANY(?)"
+    return f"{col} IN (SELECT value FROM json_each(?))"
+
+
+def ids_param(ids):
+    ids = [int(i) for i in ids]
+    return ids if USE_PG else json.dumps(ids)
+
+
+# ---------- upsert ----------
+def insert_ignore(table: str, columns) -> str:
+    """INSERT que ignora conflito de chave (INSERT OR IGNORE do SQLite)."""
+    cols = _check_idents(table, columns)
+    marks = ", ".join("?" * len(cols))
+    return f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({marks}) ON CONFLICT DO NOTHING"
+
+
+def upsert(table: str, columns, key, update=None) -> str:
+    """INSERT ... ON CONFLICT(key) DO UPDATE das colunas `update` (padrão: as não-chave)."""
+    cols = _check_idents(table, columns)
+    keys = _check_idents(table, [key] if isinstance(key, str) else key)
+    upd = [c for c in (cols if update is None else _check_idents(table, update)) if c not in keys]
+    marks = ", ".join("?" * len(cols))
+    head = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({marks}) ON CONFLICT ({', '.join(keys)})"
+    if not upd:
+        return head + " DO NOTHING"
+    return head + " DO UPDATE SET " + ", ".join(f"{c}=excluded.{c}" for c in upd)
@@ -1,38 +1,50 @@
 # init_db.py
 """
 Inicializa e MIGRA o banco (SQLite local ou Postgres/Supabase).
-- Cria/atualiza o schema base (db_core.init_schema_and_seed)
-- Aplica migrações (novas colunas/tabelas)
-- Garante usuário admin seed (security.ensure_admin_seed)
+- Migrações numeradas, registradas em `schema_migrations` e aplicadas uma única vez
+- Aplicação serializada: advisory lock (PG) / transação EXCLUSIVE (SQLite)
+- Depois da 1ª execução, migrate() custa uma consulta de versão (PK)
+- Garante usuário admin seed (migração 2 / security.ensure_admin_seed)
 
 Execute localmente:
     python init_db.py
-No Streamlit Cloud, basta rodar uma vez (ou manter como util).
+No Streamlit Cloud, a Home (e as páginas) chamam migrate() a cada rerun — barato.
 """
 
-from db_core import init_schema_and_seed, get_conn, USE_PG
+import threading
+from datetime import datetime
+
+from db_core import get_conn, USE_PG
 from security import ensure_admin_seed
 
 
 # ---------- helpers de introspecção ----------
 def column_exists(conn, table: str, col: str) -> bool:
     """Verifica se coluna existe (compatível SQLite/Postgres)."""
+    return col in table_columns(conn, table)
+
+
+def table_columns(conn, table: str) -> set[str]:
+    """Colunas atuais da tabela (vazio se não existir)."""
     if USE_PG:
-        row = conn.execute(
-            "SELECT 1 FROM information_schema.columns WHERE table_name=? AND column_name=?",
-            (table, col),
-        ).fetchone()
-        return bool(row)
+        # só o schema atual: no Supabase existem auth.users etc. com o mesmo nome
+        rows = conn.execute(
+            "SELECT column_name FROM information_schema.columns"
+            " WHERE table_schema = current_schema() AND table_name=?",
+            (table,),
+        ).fetchall()
+        return {r["column_name"] for r in rows}
     else:
         rows = conn.execute(f"PRAGMA table_info({table})").fetchall()
-        return any(r["name"] == col for r in rows)
+        return {r["name"] for r in rows}
 
 
 def table_exists(conn, table: str) -> bool:
     """Verifica se tabela existe (compatível SQLite/Postgres)."""
     if USE_PG:
         row = conn.execute(
-            "SELECT 1 FROM information_schema.tables WHERE table_name=?", (table,)
+            "SELECT 1 FROM information_schema.tables WHERE table_schema = current_schema() AND table_name=?",
+            (table,),
         ).fetchone()
         return bool(row)
     else:
@@ -42,139 +54,516 @@ def table_exists(conn, table: str) -> bool:
         return bool(row)
 
 
-# ---------- MIGRAÇÕES ----------
-def migrate():
+# ---------- tipos por dialeto ----------
+_TYPES_PG = {
+    "pk": "BIGSERIAL PRIMARY KEY",
+    "fk": "BIGINT",
+    "real": "DOUBLE PRECISION",
+    "blob": "BYTEA",
+    "ts": "TIMESTAMPTZ DEFAULT NOW()",
+}
+_TYPES_SQLITE = {
+    "pk": "INTEGER PRIMARY KEY AUTOINCREMENT",
+    "fk": "INTEGER",
+    "real": "REAL",
+    "blob": "BLOB",
+    "ts": "TEXT DEFAULT CURRENT_TIMESTAMP",
+}
+
+
+def _t(decl: str) -> str:
+    return decl.format(**(_TYPES_PG if USE_PG else _TYPES_SQLITE))
+
+
+# ---------- schema base (união do que db_core e as páginas criavam) ----------
+# (tabela, [(coluna, tipo, restrições só na criação)], [restrições de tabela])
+BASE_SCHEMA = [
+    ("users", [
+        ("id", "{pk}", ""),
+        ("name", "TEXT", "NOT NULL"),
+        ("email", "TEXT", "UNIQUE NOT NULL"),
+        ("password_hash", "{blob}", "NOT NULL"),
+        ("is_active", "INTEGER DEFAULT 1", ""),
+        ("role", "TEXT DEFAULT 'user'", ""),
+        ("created_at", "{ts}", ""),
+    ], []),
+    ("companies", [
+        ("id", "{pk}", ""),
+        ("cnpj", "TEXT", "NOT NULL"),
+        ("razao_social", "TEXT", "NOT NULL"),
+        ("nome_fantasia", "TEXT", ""),
+        ("endereco", "TEXT", ""),
+        ("regime", "TEXT", ""),
+        ("created_at", "{ts}", ""),
+        ("resp_cpf", "TEXT", ""),
+        ("resp_nome", "TEXT", ""),
+        ("resp_telefone", "TEXT", ""),
+        ("resp_email", "TEXT", ""),
+        ("cep", "TEXT", ""),
+        ("logradouro", "TEXT", ""),
+        ("complemento", "TEXT", ""),
+        ("numero", "TEXT", ""),
+        ("bairro", "TEXT", ""),
+        ("cidade", "TEXT", ""),
+        ("estado", "TEXT", ""),
+        ("cnae_principal", "TEXT", ""),
+        ("cnae_secundarios", "TEXT", ""),  # lista de códigos separados por vírgula
+    ], []),
+    ("clients", [
+        ("id", "{pk}", ""),
+        ("company_id", "{fk}", "NOT NULL REFERENCES companies(id) ON DELETE CASCADE"),
+        ("nome", "TEXT", "NOT NULL"),
+        ("doc", "TEXT", ""),
+        ("email", "TEXT", ""),
+        ("phone", "TEXT", ""),
+        ("address", "TEXT", ""),
+        ("cep", "TEXT", ""),
+        ("logradouro", "TEXT", ""),
+        ("complemento", "TEXT", ""),
+        ("numero", "TEXT", ""),
+        ("bairro", "TEXT", ""),
+        ("cidade", "TEXT", ""),
+        ("estado", "TEXT", ""),
+        ("created_at", "{ts}", ""),
+    ], []),
+    ("user_companies", [
+        ("user_id", "{fk}", "NOT NULL REFERENCES users(id) ON DELETE CASCADE"),
+        ("company_id", "{fk}", "NOT NULL REFERENCES companies(id) ON DELETE CASCADE"),
+    ], ["PRIMARY KEY (user_id, company_id)"]),
+    ("password_reset_tokens", [
+        ("id", "{pk}", ""),
+        ("user_id", "{fk}", "NOT NULL REFERENCES users(id) ON DELETE CASCADE"),
+        ("token", "TEXT", "UNIQUE NOT NULL"),
+        ("expires_at", "TEXT", "NOT NULL"),  # ISO UTC
+        ("used", "INTEGER DEFAULT 0", ""),
+    ], []),
+    ("permissions", [
+        ("id", "{pk}", ""),
+        ("user_id", "{fk}", "NOT NULL REFERENCES users(id) ON DELETE CASCADE"),
+        ("company_id", "{fk}", "NOT NULL REFERENCES companies(id) ON DELETE CASCADE"),
+        ("page_key", "TEXT", "NOT NULL"),
+        ("can_view", "INTEGER DEFAULT 1", ""),
+        ("can_create", "INTEGER DEFAULT 0", ""),
+        ("can_edit", "INTEGER DEFAULT 0", ""),
+        ("can_delete", "INTEGER DEFAULT 0", ""),
+    ], ["UNIQUE(user_id, company_id, page_key)"]),
+    ("cnae", [
+        ("code", "TEXT", "PRIMARY KEY"),
+        ("descricao", "TEXT", "NOT NULL"),
+    ], []),
+    # --- 03 Colaboradores & Férias
+    ("employees", [
+        ("id", "{pk}", ""),
+        ("company_id", "{fk}", "NOT NULL"),
+        ("matricula", "TEXT", ""),
+        ("nome", "TEXT", ""),
+        ("funcao", "TEXT", ""),
+        ("salario", "{real} DEFAULT 0", ""),
+        ("diaria", "{real} DEFAULT 0", ""),
+        ("data_admissao", "TEXT", ""),
+        ("data_rescisao", "TEXT", ""),
+        ("ativo", "INTEGER DEFAULT 1", ""),
+    ], []),
+    ("vacations", [
+        ("id", "{pk}", ""),
+        ("employee_id", "{fk}", "NOT NULL"),
+        ("inicio_gozo", "TEXT", ""),
+        ("fim_gozo", "TEXT", ""),
+        ("dias", "INTEGER", ""),
+        ("base", "{real}", ""),
+        ("um_terco", "{real}", ""),
+        ("inss", "{real}", ""),
+        ("fgts", "{real}", ""),
+        ("irrf", "{real}", ""),
+        ("liquido", "{real}", ""),
+        ("observacao", "TEXT", ""),
+    ], []),
+    ("leaves", [
+        ("id", "{pk}", ""),
+        ("employee_id", "{fk}", "NOT NULL"),
+        ("tipo", "TEXT", ""),
+        ("inicio", "TEXT", ""),
+        ("fim", "TEXT", ""),
+        ("observacao", "TEXT", ""),
+    ], []),
+    # --- 04 Equipamentos & Manutenção
+    ("equipment", [
+        ("id", "{pk}", ""),
+        ("company_id", "{fk}", "NOT NULL"),
+        ("codigo", "TEXT", ""),
+        ("descricao", "TEXT", ""),
+        ("tipo", "TEXT", ""),
+        ("placa", "TEXT", ""),
+        ("chassi", "TEXT", ""),
+        ("doc_vencimento", "TEXT", ""),
+        ("manut_km", "INTEGER DEFAULT 0", ""),
+        ("manut_data", "TEXT", ""),
+        ("observacao", "TEXT", ""),
+        ("ativo", "INTEGER DEFAULT 1", ""),
+    ], []),
+    ("equipment_docs", [
+        ("id", "{pk}", ""),
+        ("equipment_id", "{fk}", "NOT NULL"),
+        ("nome", "TEXT", ""),
+        ("dt_validade", "TEXT", ""),
+        ("resolvido", "INTEGER DEFAULT 0", ""),
+    ], []),
+    ("equipment_maintenance", [
+        ("id", "{pk}", ""),
+        ("equipment_id", "{fk}", "NOT NULL"),
+        ("tipo", "TEXT", ""),
+        ("data", "TEXT", ""),
+        ("km", "INTEGER", ""),
+        ("descricao", "TEXT", ""),
+        ("custo", "{real} DEFAULT 0", ""),
+    ], []),
+    ("company_permits", [
+        ("id", "{pk}", ""),
+        ("company_id", "{fk}", "NOT NULL"),
+        ("nome", "TEXT", ""),
+        ("dt_validade", "TEXT", ""),
+        ("resolvido", "INTEGER DEFAULT 0", ""),
+    ], []),
+    # --- 05 Serviços & OS
+    ("services", [
+        ("id", "{pk}", ""),
+        ("company_id", "{fk}", "NOT NULL"),
+        ("client_id", "{fk}", ""),
+        ("data", "TEXT", ""),
+        ("descricao", "TEXT", ""),
+        ("valor_total", "{real}", ""),
+        ("forma_pagamento", "TEXT", ""),
+        ("parcelas", "INTEGER", ""),
+        ("fiscal", "INTEGER DEFAULT 1", ""),
+        ("status", "TEXT DEFAULT 'aberta'", ""),
+    ], []),
+    ("service_employees", [
+        ("service_id", "{fk}", ""),
+        ("employee_id", "{fk}", ""),
+    ], ["PRIMARY KEY (service_id, employee_id)"]),
+    ("service_equipments", [
+        ("service_id", "{fk}", ""),
+        ("equipment_id", "{fk}", ""),
+    ], ["PRIMARY KEY (service_id, equipment_id)"]),
+    ("revenue", [
+        ("id", "{pk}", ""),
+        ("company_id", "{fk}", "NOT NULL"),
+        ("service_id", "{fk}", ""),
+        ("data", "TEXT", ""),
+        ("valor", "{real}", ""),
+        ("forma", "TEXT", ""),
+    ], []),
+    ("revenue_installments", [
+        ("id", "{pk}", ""),
+        ("revenue_id", "{fk}", "NOT NULL"),
+        ("num_parcela", "INTEGER", ""),
+        ("due_date", "TEXT", ""),
+        ("amount", "{real}", ""),
+        ("paid", "INTEGER DEFAULT 0", ""),
+        ("paid_date", "TEXT", ""),
+        ("received", "INTEGER DEFAULT 0", ""),   # usado por 07 Receitas / 08 Dashboards
+        ("received_date", "TEXT", ""),
+    ], []),
+    # --- 07 Receitas (avulsas) / 09 Impostos
+    ("revenues", [
+        ("id", "{pk}", ""),
+        ("company_id", "{fk}", "NOT NULL"),
+        ("service_id", "{fk}", ""),
+        ("client_id", "{fk}", ""),
+        ("descricao", "TEXT", ""),
+        ("forma_pagamento", "TEXT", ""),
+        ("data_lancamento", "TEXT", ""),
+        ("valor_total", "{real}", ""),
+        ("parcelas", "INTEGER DEFAULT 1", ""),
+        ("fiscal", "INTEGER DEFAULT 1", ""),
+    ], []),
+    ("tax_rules", [
+        ("id", "{pk}", ""),
+        ("regime", "TEXT", "NOT NULL"),
+        ("min_revenue", "{real} DEFAULT 0", ""),
+        ("max_revenue", "{real}", ""),
+        ("rate", "{real} DEFAULT 0", ""),
+    ], []),
+    # --- 06 Despesas
+    ("suppliers", [
+        ("id", "{pk}", ""),
+        ("company_id", "{fk}", "NOT NULL"),
+        ("nome", "TEXT", ""),
+        ("doc", "TEXT", ""),
+        ("email", "TEXT", ""),
+        ("phone", "TEXT", ""),
+        ("address", "TEXT", ""),
+    ], []),
+    ("expenses", [
+        ("id", "{pk}", ""),
+        ("company_id", "{fk}", "NOT NULL"),
+        ("supplier_id", "{fk}", ""),
+        ("fornecedor", "TEXT", ""),      # legado/rápido
+        ("descricao", "TEXT", ""),
+        ("categoria", "TEXT", ""),
+        ("tags", "TEXT", ""),
+        ("forma_pagamento", "TEXT", ""),
+        ("data_lancamento", "TEXT", ""),
+        ("valor_total", "{real}", ""),
+        ("parcelas", "INTEGER DEFAULT 1", ""),
+        ("equipment_id", "{fk}", ""),   # manutenção de equipamento (04)
+    ], []),
+    ("expense_installments", [
+        ("id", "{pk}", ""),
+        ("expense_id", "{fk}", "NOT NULL"),
+        ("num_parcela", "INTEGER", ""),
+        ("due_date", "TEXT", ""),
+        ("amount", "{real}", ""),
+        ("paid", "INTEGER DEFAULT 0", ""),
+        ("paid_date", "TEXT", ""),
+    ], []),
+    # --- caixa (compartilhado)
+    ("cash_ledger", [
+        ("id", "{pk}", ""),
+        ("company_id", "{fk}", "NOT NULL"),
+        ("data", "TEXT", "NOT NULL"),
+        ("tipo", "TEXT", "NOT NULL"),    # 'in' ou 'out'
+        ("valor", "{real}", "NOT NULL"),
+        ("descricao", "TEXT", ""),
+        ("link_tipo", "TEXT", ""),
+        ("link_id", "{fk}", ""),
+    ], []),
+]
+
+
+def ensure_table(conn, table: str, cols: list, constraints: list | None = None):
+    """CREATE TABLE IF NOT EXISTS + adiciona (sem erro esperado) colunas que faltarem."""
+    existing = table_columns(conn, table)
+    if not existing:
+        body = [f"{name} {_t(typ)} {extra}".rstrip() for name, typ, extra in cols]
+        body += list(constraints or [])
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (\n  " + ",\n  ".join(body) + "\n)")
+        return
+    for name, typ, _extra in cols:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {_t(typ)}")
+
+
+# ---------- índices gerenciados (consultas quentes de parcelas/caixa) ----------
+# (nome, tabela, colunas, WHERE do índice parcial ou None). Ao incluir um
+# índice aqui, publique uma migração nova chamando ensure_indexes().
+INDEXES = [
+    ("idx_clients_company_id", "clients", "company_id", None),
+    ("idx_services_company_data", "services", "company_id, data", None),
+    # 05 Recebíveis / exclusão em cascata: services -> revenue -> parcelas
+    ("idx_revenue_service", "revenue", "service_id, company_id", None),
+    ("idx_revenue_inst_revenue", "revenue_installments", "revenue_id", None),
+    ("idx_revenue_inst_open", "revenue_installments", "revenue_id, due_date", "paid = 0"),
+    # 07 Receitas / 08 / 09: tabela revenues (flag received)
+    ("idx_revenues_company", "revenues", "company_id, data_lancamento", None),
+    ("idx_revenue_inst_unreceived", "revenue_installments", "revenue_id, due_date", "received = 0"),
+    # 06 Despesas / 08
+    ("idx_expenses_company", "expenses", "company_id", None),
+    ("idx_expense_inst_expense", "expense_installments", "expense_id, due_date, amount", None),
+    ("idx_expense_inst_open", "expense_installments", "expense_id, due_date, amount", "paid = 0"),
+    # caixa: resumo do dia e estorno por vínculo
+    ("idx_cash_ledger_company_data", "cash_ledger", "company_id, data", None),
+    ("idx_cash_ledger_link", "cash_ledger", "link_tipo, link_id", None),
+]
+
+
+def ensure_indexes(conn):
+    """CREATE INDEX IF NOT EXISTS para todo o conjunto gerenciado (idempotente)."""
+    for name, table, cols, where in INDEXES:
+        sql = f"CREATE INDEX IF NOT EXISTS {name} ON {table}({cols})"
+        conn.execute(sql + (f" WHERE {where}" if where else ""))
+
+
+# ---------- MIGRAÇÕES (numeradas; nunca renumerar/editar as já publicadas) ----------
+def m001_base_schema(conn):
+    """Schema base: tabelas de db_core + as que cada página criava a cada rerun."""
+    for table, cols, constraints in BASE_SCHEMA:
+        ensure_table(conn, table, cols, constraints)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clients_company_id ON clients(company_id)")
+
+
+def m002_admin_seed(conn):
+    """Garante admin@admin / admin quando ainda não há usuários."""
+    ensure_admin_seed()
+
+
+def m003_hot_path_indexes(conn):
+    """Índices de parcelas em aberto, dashboards e exclusão em cascata."""
+    ensure_indexes(conn)
+
+
+def m004_cache_versions(conn):
+    """Versão por tabela usada pelo cache de consultas (db_core) entre processos."""
+    ensure_table(conn, "cache_versions", [
+        ("table_name", "TEXT", "PRIMARY KEY"),
+        ("version", "INTEGER", "NOT NULL DEFAULT 0"),
+    ])
+
+
+def m005_settlement_batches(conn):
+    """Lotes de baixa (settlement.py): cada lançamento de caixa aponta para o seu lote."""
+    ensure_table(conn, "settlement_batches", [
+        ("id", "{pk}", ""),
+        ("company_id", "{fk}", "NOT NULL"),
+        ("link_tipo", "TEXT", "NOT NULL"),
+        ("created_at", "TEXT", "NOT NULL"),
+        ("user_id", "{fk}", ""),
+        ("qtd", "INTEGER", "NOT NULL DEFAULT 0"),
+        ("total", "{real}", "NOT NULL DEFAULT 0"),
+    ])
+    ensure_table(conn, "cash_ledger", [("settlement_id", "{fk}", "")])
+    # fora de INDEXES: a coluna não existe quando m003 roda num banco novo.
+    # Parcial: lançamentos antigos/manuais (sem lote) não entram no índice.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_cash_ledger_settlement ON cash_ledger(settlement_id)"
+        " WHERE settlement_id IS NOT NULL"
+    )
+
+
+def m006_expense_recurrences(conn):
     """
-    Aplica migrações idempotentes:
-      - companies: responsável, endereço completo, CNAEs
-      - users: tokens de reset/convite + permissions (escopo CRUD por página/empresa)
-      - clients: endereço completo
-      - cnae: catálogo opcional para descrição por código
+    Despesas recorrentes como regra (recurrence.py): as ocorrências são geradas
+    na leitura e só viram linhas em expenses ao pagar/editar, marcadas com
+    (recurrence_id, occurrence) — o índice único impede materializar duas vezes.
     """
-    with get_conn() as conn:
-        # --- 01: EMPRESAS (responsável + endereço + CNAE)
-        company_new_cols = [
-            ("resp_cpf", "TEXT"),
-            ("resp_nome", "TEXT"),
-            ("resp_telefone", "TEXT"),
-            ("resp_email", "TEXT"),
-            ("cep", "TEXT"),
-            ("logradouro", "TEXT"),
-            ("complemento", "TEXT"),
-            ("numero", "TEXT"),
-            ("bairro", "TEXT"),
-            ("cidade", "TEXT"),
-            ("estado", "TEXT"),
-            ("cnae_principal", "TEXT"),
-            ("cnae_secundarios", "TEXT"),  # lista de códigos separados por vírgula
-        ]
-        for col, typ in company_new_cols:
-            if not column_exists(conn, "companies", col):
-                conn.execute(f"ALTER TABLE companies ADD COLUMN {col} {typ}")
-
-        # --- 00: USUÁRIOS (tokens + permissões)
-        if not table_exists(conn, "password_reset_tokens"):
-            if USE_PG:
-                conn.execute(
-                    """
-                    CREATE TABLE password_reset_tokens (
-                      id SERIAL PRIMARY KEY,
-                      user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                      token TEXT NOT NULL UNIQUE,
-                      expires_at TEXT NOT NULL,
-                      used BOOLEAN DEFAULT FALSE
-                    )
-                    """
-                )
-            else:
-                conn.execute(
-                    """
-                    CREATE TABLE password_reset_tokens (
-                      id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      user_id INTEGER NOT NULL,
-                      token TEXT NOT NULL UNIQUE,
-                      expires_at TEXT NOT NULL,
-                      used INTEGER DEFAULT 0,
-                      FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-                    )
-                    """
-                )
+    ensure_table(conn, "expense_recurrences", [
+        ("id", "{pk}", ""),
+        ("company_id", "{fk}", "NOT NULL"),
+        ("supplier_id", "{fk}", ""),
+        ("fornecedor", "TEXT", ""),
+        ("descricao", "TEXT", ""),
+        ("categoria", "TEXT", ""),
+        ("tags", "TEXT", ""),
+        ("forma_pagamento", "TEXT", ""),
+        ("valor_total", "{real}", "NOT NULL"),
+        ("parcelas", "INTEGER", "NOT NULL DEFAULT 1"),
+        ("freq_months", "INTEGER", "NOT NULL DEFAULT 1"),   # 1 mensal, 3 trimestral, 12 anual...
+        ("start_date", "TEXT", "NOT NULL"),                 # 1ª ocorrência (define o dia)
+        ("end_date", "TEXT", ""),                           # última data possível (NULL = sem fim)
+        ("occurrences", "INTEGER", ""),                     # nº máximo de ocorrências (NULL = sem fim)
+        ("created_at", "{ts}", ""),
+    ])
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_expense_rec_company ON expense_recurrences(company_id, start_date)")
+    ensure_table(conn, "expenses", [("recurrence_id", "{fk}", ""), ("occurrence", "INTEGER", "")])
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_expenses_recurrence ON expenses(recurrence_id, occurrence)"
+        " WHERE recurrence_id IS NOT NULL"
+    )
+
+
+def m007_cash_daily(conn):
+    """
+    Cubo diário do fluxo de caixa (cash_cube.py) para 08_📊: criado aqui e
+    preenchido por m008 (que define quais parcelas de receita contam); depois
+    é mantido por quem escreve.
+    """
+    ensure_table(conn, "cash_daily", [
+        ("company_id", "{fk}", "NOT NULL"),
+        ("day", "TEXT", "NOT NULL"),            # 'YYYY-MM-DD' do vencimento
+        ("direction", "TEXT", "NOT NULL"),      # 'in' / 'out'
+        ("status", "TEXT", "NOT NULL"),         # 'open' / 'settled'
+        ("total", "{real}", "NOT NULL DEFAULT 0"),
+        ("qtd", "INTEGER", "NOT NULL DEFAULT 0"),
+    ], ["PRIMARY KEY (company_id, day, direction, status)"])
+
+
+def m008_revenue_installments_origem(conn):
+    """
+    revenue_installments guarda parcelas de dois documentos com ids independentes:
+    OS (revenue, 05) e receitas avulsas (revenues, 07). origem ('os'/'avulsa')
+    diz de qual; o cubo cash_daily conta só as avulsas. Parcelas antigas são
+    classificadas pelo documento que existe; se o id existe nas duas tabelas,
+    pela baixa (paid é de OS, received de avulsa). As que sobram ficam NULL,
+    fora do cubo. Em seguida o cubo é refeito com essa definição.
+    """
+    from cash_cube import rebuild_with  # import tardio: cash_cube depende de db_core/dialect
+
+    ensure_table(conn, "revenue_installments", [("origem", "TEXT", "")])   # 'os' / 'avulsa'
+    conn.execute(
+        """
+        UPDATE revenue_installments SET origem = CASE
+          WHEN NOT EXISTS (SELECT 1 FROM revenues d WHERE d.id = revenue_installments.revenue_id) THEN 'os'
+          WHEN NOT EXISTS (SELECT 1 FROM revenue d WHERE d.id = revenue_installments.revenue_id) THEN 'avulsa'
+          WHEN paid = 1 THEN 'os'
+          WHEN received = 1 THEN 'avulsa'
+        END
+        WHERE origem IS NULL
+        """
+    )
+    rebuild_with(conn)
 
-        if not table_exists(conn, "permissions"):
-            if USE_PG:
-                conn.execute(
-                    """
-                    CREATE TABLE permissions (
-                      id SERIAL PRIMARY KEY,
-                      user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                      company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
-                      page_key TEXT NOT NULL,
-                      can_view BOOLEAN DEFAULT TRUE,
-                      can_create BOOLEAN DEFAULT FALSE,
-                      can_edit BOOLEAN DEFAULT FALSE,
-                      can_delete BOOLEAN DEFAULT FALSE,
-                      UNIQUE(user_id, company_id, page_key)
-                    )
-                    """
-                )
-            else:
-                conn.execute(
-                    """
-                    CREATE TABLE permissions (
-                      id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      user_id INTEGER NOT NULL,
-                      company_id INTEGER NOT NULL,
-                      page_key TEXT NOT NULL,
-                      can_view INTEGER DEFAULT 1,
-                      can_create INTEGER DEFAULT 0,
-                      can_edit INTEGER DEFAULT 0,
-                      can_delete INTEGER DEFAULT 0,
-                      UNIQUE(user_id, company_id, page_key),
-                      FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE,
-                      FOREIGN KEY(company_id) REFERENCES companies(id) ON DELETE CASCADE
-                    )
-                    """
-                )
 
-        # --- 02: CLIENTES (endereço completo)
-        client_new_cols = [
-            ("cep", "TEXT"),
-            ("logradouro", "TEXT"),
-            ("complemento", "TEXT"),
-            ("numero", "TEXT"),
-            ("bairro", "TEXT"),
-            ("cidade", "TEXT"),
-            ("estado", "TEXT"),
-        ]
-        for col, typ in client_new_cols:
-            if not column_exists(conn, "clients", col):
-                conn.execute(f"ALTER TABLE clients ADD COLUMN {col} {typ}")
-
-        # --- CNAE (tabela catálogo opcional)
-        if not table_exists(conn, "cnae"):
+MIGRATIONS = [
+    (1, "base_schema", m001_base_schema),
+    (2, "admin_seed", m002_admin_seed),
+    (3, "hot_path_indexes", m003_hot_path_indexes),
+    (4, "cache_versions", m004_cache_versions),
+    (5, "settlement_batches", m005_settlement_batches),
+    (6, "expense_recurrences", m006_expense_recurrences),
+    (7, "cash_daily", m007_cash_daily),
+    (8, "revenue_installments_origem", m008_revenue_installments_origem),
+]
+HEAD_VERSION = max(v for v, _, _ in MIGRATIONS)
+
+_MIGRATION_LOCK_KEY = 74_2025_001   # chave do pg_advisory_xact_lock
+_process_lock = threading.Lock()
+
+
+def schema_version() -> int:
+    """Versão aplicada (0 se o banco ainda não tem schema_migrations)."""
+    try:
+        with get_conn() as conn:
+            row = conn.execute("SELECT MAX(version) AS v FROM schema_migrations").fetchone()
+            return int(row["v"] or 0) if row else 0
+    except Exception:
+        return 0
+
+
+def _lock_for_migration(conn):
+    if USE_PG:
+        conn.execute("SELECT pg_advisory_xact_lock(?)", (_MIGRATION_LOCK_KEY,))
+    else:
+        conn.execute("BEGIN EXCLUSIVE")
+
+
+def migrate() -> int:
+    """
+    Aplica as migrações pendentes, uma única vez, e devolve a versão final.
+    Caminho quente (já migrado): uma consulta MAX(version) na PK de schema_migrations.
+    """
+    if schema_version() >= HEAD_VERSION:
+        return HEAD_VERSION
+
+    with _process_lock:
+        with get_conn() as conn:
+            _lock_for_migration(conn)
             conn.execute(
                 """
-                CREATE TABLE cnae (
-                  code TEXT PRIMARY KEY,
-                  descricao TEXT NOT NULL
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                  version INTEGER PRIMARY KEY,
+                  name TEXT NOT NULL,
+                  applied_at TEXT NOT NULL
                 )
                 """
             )
-
-        # tudo OK
-        try:
-            conn.commit()
-        except Exception:
-            pass
+            applied = {r["version"] for r in conn.execute("SELECT version FROM schema_migrations").fetchall()}
+            for version, name, fn in MIGRATIONS:
+                if version in applied:
+                    continue
+                fn(conn)
+                conn.execute(
+                    "INSERT INTO schema_migrations(version, name, applied_at) VALUES (?,?,?)",
+                    (version, name, datetime.utcnow().isoformat(timespec="seconds")),
+                )
+    return HEAD_VERSION
 
 
 def init_all():
-    """Roda init + migração + seed de admin."""
-    init_schema_and_seed()  # schema base (já cria tax_rules, etc.)
-    migrate()               # aplica mudanças desta versão
+    """Roda migrações (schema + seed) e garante o admin."""
+    migrate()               # aplica o que faltar desta versão
     ensure_admin_seed()     # garante admin@admin / admin
 
 
 if __name__ == "__main__":
     init_all()
-    print("Banco inicializado/migrado. Usuário padrão: admin@admin / admin")
+    print(f"Banco inicializado/migrado (versão {schema_version()}). Usuário padrão: admin@admin / admin")
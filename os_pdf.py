@@ -0,0 +1,927 @@
+# os_pdf.py
+# -*- coding: utf-8 -*-
+"""
+PDF PRO da Ordem de Serviço (05_🧾_Serviços_e_OS): uma OS por página (ou mais,
+se precisar). ReportLab, com fallback para fpdf2. Cabeçalho/rodapé fixos viram
+um form XObject por documento.
+Os dados vêm de service_ops.fetch_service_bundles (consultas fixas por lote).
+
+Lotes grandes (generate_os_pdf_batch): blocos de OS renderizados num pool de
+processos e unidos em ordem com pypdf; a numeração "Página N" é carimbada
+depois da união, para seguir contínua entre os blocos.
+
+Exportação em disco (export_os_pdf): sequencial, com os dados carregados por
+blocos e a saída escrita no arquivo. Só o ZIP (um PDF por OS) tem pico de
+memória constante; no PDF único o ReportLab guarda todas as páginas até save(),
+então a memória ainda cresce com o lote (unir blocos em arquivo com pypdf foi
+medido e ficou pior: o PdfWriter também segura as páginas até write()).
+
+Cache de fragmentos: cada OS renderizada (sem numeração) fica em disco, com
+chave = hash do bundle + campos da empresa usados no cabeçalho + TEMPLATE_VERSION.
+O lote montado também é guardado (chave = hash das chaves das OS, em ordem),
+num cache à parte para não expulsar fragmentos: reimprimir um lote sem mudanças
+é só leitura; com poucas OS alteradas, só elas são renderizadas e o resto é
+unido. Ao mudar o layout, incremente TEMPLATE_VERSION.
+Os arquivos têm dados de clientes de todas as empresas: o diretório é criado
+0o700 e os arquivos 0o600; se ele existir e for de outro usuário (ou um link),
+o cache fica desligado.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from db_core import get_conn
+from service_ops import fetch_service_bundles
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_CHUNK_SIZE = int(os.getenv("PDF_CHUNK_SIZE", "25"))   # OS por bloco do pool
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "locadora_os_pdf"))
+PDF_CACHE_MAX_MB = float(os.getenv("PDF_CACHE_MAX_MB", "256"))   # 0 desliga o cache
+PDF_BATCH_CACHE_MAX_MB = float(os.getenv("PDF_BATCH_CACHE_MAX_MB", "64"))   # lotes montados (à parte)
+
+TEMPLATE_VERSION = 3
+# Campos de companies desenhados por header(); ao usar outro campo lá, inclua aqui
+_HEADER_FIELDS = ("razao_social", "cnpj", "cidade", "estado")
+
+
+# ============================================================
+# ====================== PDF PRO MAKER =======================
+# ============================================================
+
+def _rv(row, key, default=""):
+    """Row value safe: funciona para sqlite3.Row e dict."""
+    try:
+        v = row[key]
+        return v if v is not None else default
+    except Exception:
+        return default
+
+
+def _fmt_date_iso(iso: str | None) -> str:
+    if not iso:
+        return ""
+    try:
+        return datetime.fromisoformat(iso).strftime("%d/%m/%Y")
+    except Exception:
+        return str(iso)
+
+
+def _fmt_money(v) -> str:
+    try:
+        return f"R$ {float(v):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    except Exception:
+        return f"R$ {v}"
+
+
+def _os_number(sid: int, dt_iso: str | None) -> str:
+    ano = ""
+    try:
+        ano = datetime.fromisoformat(dt_iso).strftime("%Y") if dt_iso else ""
+    except Exception:
+        pass
+    return f"{sid:06d}" + (f"/{ano}" if ano else "")
+
+
+def _split_desc(desc: str) -> list[str]:
+    """Quebra descrição em itens (por linhas)."""
+    if not desc:
+        return []
+    parts = [x.strip("-• \t") for x in str(desc).splitlines()]
+    return [x for x in parts if x]
+
+
+def _fetch_company_company(cid: int):
+    with get_conn() as conn:
+        comp = conn.execute("SELECT * FROM companies WHERE id=?", (cid,)).fetchone()
+    return comp
+
+
+def _render_reportlab(ids: list[int], comp, bundles: dict, out, number_pages: bool = True):
+    """Desenha as OS com ReportLab em `out` (caminho, arquivo ou BytesIO)."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.units import mm
+    from reportlab.lib.colors import HexColor
+    from reportlab.lib.utils import simpleSplit
+
+    c = canvas.Canvas(out, pagesize=A4)
+    W, H = A4
+
+    brand_primary = HexColor("#0F172A")   # slate-900
+    brand_accent  = HexColor("#2563EB")   # blue-600
+    brand_muted   = HexColor("#CBD5E1")   # slate-300
+    line_gray     = HexColor("#E2E8F0")   # slate-200
+
+    # Partes fixas de toda página (faixa do cabeçalho, título, empresa, rodapé):
+    # compiladas uma vez por documento como form XObject e só referenciadas
+    # (doForm) em cada página. Por página vão apenas o nº da OS e a paginação.
+    comp_nome = _rv(comp, "razao_social", "EMPRESA")
+
+    def compile_static_form(cnv):
+        cnv.beginForm("os_static")
+        cnv.setFillColor(brand_primary)
+        cnv.rect(0, H-40*mm, W, 40*mm, stroke=0, fill=1)
+
+        # Título
+        cnv.setFillColor(HexColor("#FFFFFF"))
+        cnv.setFont("Helvetica-Bold", 18)
+        cnv.drawString(20*mm, H-18*mm, "ORDEM DE SERVIÇO")
+
+        # Empresa (razão/CNPJ/contatos)
+        cnv.setFont("Helvetica-Bold", 11)
+        cnv.drawString(20*mm, H-28*mm, comp_nome)
+        cnv.setFont("Helvetica", 9)
+        cnpj = _rv(comp, "cnpj", "")
+        linha2 = []
+        if cnpj: linha2.append(f"CNPJ: {cnpj}")
+        cidade     = _rv(comp, "cidade", "")
+        uf         = _rv(comp, "estado", "")
+        if cidade or uf:
+            linha2.append(f"{cidade} - {uf}")
+        if linha2:
+            cnv.drawString(20*mm, H-33*mm, " · ".join(linha2))
+
+        # Rodapé (a paginação é variável e fica em footer())
+        cnv.setStrokeColor(line_gray)
+        cnv.line(20*mm, 15*mm, W-20*mm, 15*mm)
+        cnv.setFont("Helvetica", 8)
+        cnv.setFillColor(brand_primary)
+        cnv.drawString(20*mm, 10.5*mm, "Documento gerado por locadora_finance")
+        cnv.endForm()
+
+    def header(cnv, y0, sid, srv_row):
+        cnv.doForm("os_static")
+        cnv.setFillColor(HexColor("#FFFFFF"))
+        cnv.setFont("Helvetica", 10)
+        osnum = _os_number(sid, _rv(srv_row, "data", ""))
+        cnv.drawRightString(W-20*mm, H-18*mm, f"OS Nº {osnum}")
+
+    def section_title(cnv, y, txt):
+        cnv.setFillColor(brand_accent)
+        cnv.rect(20*mm, y-8*mm, W-40*mm, 8*mm, stroke=0, fill=1)
+        cnv.setFillColor(HexColor("#FFFFFF"))
+        cnv.setFont("Helvetica-Bold", 11)
+        cnv.drawString(22*mm, y-6.5*mm, txt)
+        return y-10*mm
+
+    def box_kv(cnv, y, pairs: list[tuple[str, str]], per_row=2):
+        """Desenha pares chave:valor em grade leve."""
+        cnv.setFont("Helvetica", 9)
+        cnv.setFillColor(HexColor("#000000"))
+        colw = (W-40*mm)/per_row
+        x = 20*mm
+        rowh = 8.5*mm
+        for i, (k, v) in enumerate(pairs):
+            col = i % per_row
+            if col == 0 and i > 0:
+                y -= rowh
+                x = 20*mm
+            cnv.setFillColor(line_gray)
+            cnv.rect(x, y-rowh+1.5*mm, colw-2*mm, rowh-2*mm, stroke=0, fill=1)
+            cnv.setFillColor(brand_primary)
+            cnv.setFont("Helvetica-Bold", 8)
+            cnv.drawString(x+2*mm, y-2.5*mm, k.upper())
+            cnv.setFont("Helvetica", 9)
+            cnv.setFillColor(HexColor("#000000"))
+            # wrap do valor
+            lines = simpleSplit(v, "Helvetica", 9, colw-6*mm)
+            if lines:
+                cnv.drawString(x+2*mm, y-6.5*mm, lines[0])
+            x += colw
+        return y- rowh - 2*mm
+
+    def long_text(cnv, y, txt):
+        cnv.setFillColor(HexColor("#000000"))
+        cnv.setFont("Helvetica", 9)
+        lines = simpleSplit(txt, "Helvetica", 9, W-40*mm)
+        for ln in lines:
+            if y < 25*mm:
+                footer(cnv)
+                cnv.showPage()
+                header(cnv, H, sid, srv)
+                y = H-50*mm
+                y = section_title(cnv, y, "DETALHAMENTO DO SERVIÇO")
+            cnv.drawString(20*mm, y, ln)
+            y -= 5.2*mm
+        return y
+
+    def bullet_list(cnv, y, items: list[str]):
+        cnv.setFont("Helvetica", 9)
+        cnv.setFillColor(HexColor("#000000"))
+        for it in items:
+            if y < 25*mm:
+                footer(cnv)
+                cnv.showPage()
+                header(cnv, H, sid, srv)
+                y = H-50*mm
+                y = section_title(cnv, y, "DETALHAMENTO DO SERVIÇO")
+            wrapped = simpleSplit(it, "Helvetica", 9, W-46*mm)
+            cnv.circle(22*mm, y+1.5*mm, 0.8*mm, fill=1, stroke=0)
+            cnv.drawString(25*mm, y, wrapped[0])
+            y -= 5.2*mm
+            for rest in wrapped[1:]:
+                cnv.drawString(25*mm, y, rest)
+                y -= 5.2*mm
+        return y
+
+    def table_installments(cnv, y, inst_rows):
+        if not inst_rows:
+            return y
+        cnv.setFont("Helvetica-Bold", 9)
+        cnv.setFillColor(brand_primary)
+        headers = ["Parcela", "Vencimento", "Valor", "Situação"]
+        colw = [(W-40*mm)*0.15, (W-40*mm)*0.25, (W-40*mm)*0.25, (W-40*mm)*0.35]
+        xs = [20*mm]
+        for w_ in colw[:-1]:
+            xs.append(xs[-1]+w_)
+        # header bg
+        cnv.setFillColor(brand_muted)
+        cnv.rect(20*mm, y-7*mm, W-40*mm, 7*mm, stroke=0, fill=1)
+        cnv.setFillColor(brand_primary)
+        for i, h in enumerate(headers):
+            cnv.drawString(xs[i]+2*mm, y-4.8*mm, h.upper())
+        y -= 9*mm
+
+        cnv.setFont("Helvetica", 9)
+        cnv.setFillColor(HexColor("#000000"))
+        for r in inst_rows:
+            if y < 30*mm:
+                footer(cnv)
+                cnv.showPage()
+                header(cnv, H, sid, srv)
+                y = H-50*mm
+                y = section_title(cnv, y, "PARCELAS / RECEBÍVEIS")
+                # redesenha cabeçalho
+                cnv.setFillColor(brand_muted)
+                cnv.rect(20*mm, y-7*mm, W-40*mm, 7*mm, stroke=0, fill=1)
+                cnv.setFillColor(brand_primary)
+                for i, h in enumerate(headers):
+                    cnv.drawString(xs[i]+2*mm, y-4.8*mm, h.upper())
+                y -= 9*mm
+                cnv.setFillColor(HexColor("#000000"))
+                cnv.setFont("Helvetica", 9)
+
+            situ = "Pago" if int(_rv(r, "paid", 0)) == 1 else "Pendente"
+            if int(_rv(r, "paid", 0)) == 1 and _rv(r, "paid_date", ""):
+                situ = f"Pago em {_fmt_date_iso(_rv(r, 'paid_date', ''))}"
+            vals = [
+                str(_rv(r, "num_parcela", "")),
+                _fmt_date_iso(_rv(r, "due_date", "")),
+                _fmt_money(_rv(r, "amount", 0.0)),
+                situ,
+            ]
+            for i, v in enumerate(vals):
+                cnv.drawString(xs[i]+2*mm, y-4.5*mm, v)
+            # linha
+            cnv.setStrokeColor(line_gray)
+            cnv.line(20*mm, y-6.2*mm, W-20*mm, y-6.2*mm)
+            y -= 8*mm
+
+        return y-2*mm
+
+    def signatures(cnv, y):
+        if y < 45*mm:
+            footer(cnv)
+            cnv.showPage()
+            header(cnv, H, sid, srv)
+            y = H-50*mm
+        cnv.setStrokeColor(line_gray)
+        cnv.line(35*mm, y-12*mm, 95*mm, y-12*mm)
+        cnv.line(115*mm, y-12*mm, W-35*mm, y-12*mm)
+        cnv.setFont("Helvetica", 9)
+        cnv.setFillColor(HexColor("#000000"))
+        cnv.drawCentredString((35+95)/2*mm, y-16*mm, "Assinatura do Responsável Técnico")
+        cnv.drawCentredString((115+(W/mm-35))/2*mm, y-16*mm, "Assinatura do Cliente")
+        return y-22*mm
+
+    def footer(cnv):
+        if number_pages:
+            cnv.setFont("Helvetica", 8)
+            cnv.setFillColor(brand_primary)
+            cnv.drawRightString(W-20*mm, 10.5*mm, f"Página {cnv.getPageNumber()}")
+
+    compile_static_form(c)
+
+    # ====== LOOP de OS selecionadas
+    for sid in ids:
+        pack = bundles.get(sid)
+        if not pack:
+            continue
+        srv = pack["srv"]
+        cli = pack["cli"]
+        emps = pack["emps"]
+        eqps = pack["eqps"]
+        inst = pack["inst"]
+
+        # CABEÇALHO
+        header(c, H, sid, srv)
+        y = H-50*mm
+
+        # Cliente
+        y = section_title(c, y, "DADOS DO CLIENTE")
+        cli_pairs = [
+            ("Cliente", _rv(cli, "nome", "-") if cli else "-"),
+            ("Documento", _rv(cli, "doc", "-") if cli else "-"),
+            ("Telefone", _rv(cli, "phone", "-") if cli else "-"),
+            ("E-mail", _rv(cli, "email", "-") if cli else "-"),
+            ("Endereço", " ".join(x for x in [
+                _rv(cli, "logradouro", ""),
+                _rv(cli, "numero", ""),
+                _rv(cli, "bairro", ""),
+                _rv(cli, "cidade", ""),
+                _rv(cli, "estado", ""),
+            ] if x) if cli else "-"),
+            ("CEP", _rv(cli, "cep", "-") if cli else "-"),
+        ]
+        y = box_kv(c, y, cli_pairs, per_row=2)
+
+        # Serviço: resumo
+        y = section_title(c, y, "RESUMO DO SERVIÇO")
+        srv_pairs = [
+            ("Data", _fmt_date_iso(_rv(srv, "data", ""))),
+            ("Status", _rv(srv, "status", "").capitalize()),
+            ("Classificação", "Fiscal" if int(_rv(srv, "fiscal", 1)) == 1 else "Gerencial"),
+            ("Forma de Pagamento", _rv(srv, "forma_pagamento", "")),
+            ("Parcelas", str(_rv(srv, "parcelas", 1))),
+            ("Valor Total", _fmt_money(_rv(srv, "valor_total", 0.0))),
+        ]
+        y = box_kv(c, y, srv_pairs, per_row=3)
+
+        # Detalhamento
+        desc = _rv(srv, "descricao", "")
+        items = _split_desc(desc)
+        y = section_title(c, y, "DETALHAMENTO DO SERVIÇO")
+        if items:
+            y = bullet_list(c, y, items)
+        else:
+            y = long_text(c, y, desc or "-")
+
+        # Equipe / Equipamentos
+        if emps or eqps:
+            y = section_title(c, y, "RECURSOS ALOCADOS")
+            if emps:
+                nomes = [(" • " + _rv(e, "nome", "")) + (f" ({_rv(e,'funcao','')})" if _rv(e, "funcao", "") else "") for e in emps]
+                y = long_text(c, y, "Colaboradores:\n" + "\n".join(nomes))
+            if eqps:
+                descs = [" • " + _rv(e, "descricao", "") for e in eqps]
+                y = long_text(c, y, ("Equipamentos:\n" if emps else "") + "\n".join(descs))
+
+        # Parcelas / Recebíveis
+        if inst:
+            y = section_title(c, y, "PARCELAS / RECEBÍVEIS")
+            y = table_installments(c, y, inst)
+
+        # Observações (campo livre)
+        y = section_title(c, y, "OBSERVAÇÕES E CONDIÇÕES")
+        obs = (
+            "Este documento comprova a contratação/execução dos serviços descritos. "
+            "Garantias e responsabilidades seguem as normas aplicáveis e o contrato firmado entre as partes. "
+            "Em caso de divergência, contate-nos imediatamente."
+        )
+        y = long_text(c, y, obs)
+
+        # Assinaturas
+        y = signatures(c, y)
+
+        # Rodapé e próxima página
+        footer(c)
+        c.showPage()
+
+    c.save()
+
+
+def _render_fpdf(ids: list[int], comp, bundles: dict) -> bytes:
+    """Fallback com fpdf2 (layout simplificado, mas elegante)."""
+    try:
+        from fpdf import FPDF
+    except Exception:
+        # sem nada disponível
+        return b"%PDF-1.4\n% Faltou reportlab e fpdf2\n"
+
+    class PDF(FPDF):
+        def header(self):
+            self.set_fill_color(15, 23, 42)  # slate-900
+            self.rect(0, 0, 210, 25, "F")
+            self.set_text_color(255, 255, 255)
+            self.set_font("Helvetica", "B", 16)
+            self.set_xy(10, 7)
+            self.cell(0, 8, "ORDEM DE SERVIÇO", 0, 1, "L")
+            self.ln(2)
+
+        def footer(self):
+            self.set_y(-15)
+            self.set_draw_color(226, 232, 240)
+            self.line(10, self.get_y(), 200, self.get_y())
+            self.set_font("Helvetica", "", 8)
+            self.set_text_color(15, 23, 42)
+            self.cell(0, 8, "Documento gerado por locadora_finance", 0, 0, "L")
+            self.cell(0, 8, f"Página {self.page_no()}", 0, 0, "R")
+
+    pdf = PDF(orientation="P", unit="mm", format="A4")
+    pdf.set_auto_page_break(auto=True, margin=18)
+
+    for sid in ids:
+        pack = bundles.get(sid)
+        if not pack:
+            continue
+        srv = pack["srv"]
+        cli = pack["cli"]
+        emps = pack["emps"]
+        eqps = pack["eqps"]
+        inst = pack["inst"]
+
+        pdf.add_page()
+
+        # Número OS
+        pdf.set_xy(10, 10)
+        pdf.set_text_color(255, 255, 255)
+        pdf.set_font("Helvetica", "", 10)
+        pdf.cell(0, 6, f"OS Nº {_os_number(sid, _rv(srv, 'data', ''))}", 0, 1, "R")
+
+        # Empresa
+        pdf.ln(8)
+        pdf.set_text_color(0, 0, 0)
+        pdf.set_font("Helvetica", "B", 12)
+        pdf.cell(0, 6, _rv(comp, "razao_social", "EMPRESA"), 0, 1, "L")
+        pdf.set_font("Helvetica", "", 9)
+        cnpj = _rv(comp, "cnpj", "")
+        cidade = _rv(comp, "cidade", "")
+        uf = _rv(comp, "estado", "")
+        linha2 = " · ".join([x for x in [f"CNPJ: {cnpj}" if cnpj else "", f"{cidade} - {uf}" if (cidade or uf) else ""] if x])
+        if linha2:
+            pdf.cell(0, 5, linha2, 0, 1, "L")
+
+        # Cliente
+        pdf.ln(2)
+        pdf.set_fill_color(37, 99, 235)  # blue-600
+        pdf.set_text_color(255, 255, 255)
+        pdf.set_font("Helvetica", "B", 10)
+        pdf.cell(0, 7, "DADOS DO CLIENTE", 0, 1, "L", True)
+        pdf.set_text_color(0, 0, 0)
+        pdf.set_font("Helvetica", "", 9)
+        pdf.multi_cell(0, 5, f"Cliente: {_rv(cli,'nome','-') if cli else '-'}")
+        pdf.multi_cell(0, 5, f"Documento: {_rv(cli,'doc','-') if cli else '-'} · Telefone: {_rv(cli,'phone','-') if cli else '-'} · E-mail: {_rv(cli,'email','-') if cli else '-'}")
+        end = " ".join(x for x in [
+            _rv(cli, "logradouro", ""),
+            _rv(cli, "numero", ""),
+            _rv(cli, "bairro", ""),
+            _rv(cli, "cidade", ""),
+            _rv(cli, "estado", ""),
+        ] if x) if cli else "-"
+        pdf.multi_cell(0, 5, f"Endereço: {end} · CEP: {_rv(cli,'cep','-') if cli else '-'}")
+
+        # Resumo
+        pdf.ln(2)
+        pdf.set_fill_color(37, 99, 235)
+        pdf.set_text_color(255, 255, 255)
+        pdf.set_font("Helvetica", "B", 10)
+        pdf.cell(0, 7, "RESUMO DO SERVIÇO", 0, 1, "L", True)
+        pdf.set_text_color(0, 0, 0)
+        pdf.set_font("Helvetica", "", 9)
+        pdf.multi_cell(0, 5, f"Data: {_fmt_date_iso(_rv(srv,'data',''))} · Status: {_rv(srv,'status','').capitalize()} · Classificação: {'Fiscal' if int(_rv(srv,'fiscal',1))==1 else 'Gerencial'}")
+        pdf.multi_cell(0, 5, f"Forma: {_rv(srv,'forma_pagamento','')} · Parcelas: {str(_rv(srv,'parcelas',1))} · Valor Total: {_fmt_money(_rv(srv,'valor_total',0.0))}")
+
+        # Detalhamento
+        pdf.ln(2)
+        pdf.set_fill_color(37, 99, 235)
+        pdf.set_text_color(255, 255, 255)
+        pdf.set_font("Helvetica", "B", 10)
+        pdf.cell(0, 7, "DETALHAMENTO DO SERVIÇO", 0, 1, "L", True)
+        pdf.set_text_color(0, 0, 0)
+        pdf.set_font("Helvetica", "", 9)
+        desc = _rv(srv, "descricao", "")
+        items = _split_desc(desc)
+        if items:
+            for it in items:
+                pdf.cell(4, 5, "•")
+                pdf.multi_cell(0, 5, it)
+        else:
+            pdf.multi_cell(0, 5, desc or "-")
+
+        # Equipe / Equipamentos
+        if emps or eqps:
+            pdf.ln(1)
+            pdf.set_fill_color(37, 99, 235)
+            pdf.set_text_color(255, 255, 255)
+            pdf.set_font("Helvetica", "B", 10)
+            pdf.cell(0, 7, "RECURSOS ALOCADOS", 0, 1, "L", True)
+            pdf.set_text_color(0, 0, 0)
+            pdf.set_font("Helvetica", "", 9)
+            if emps:
+                nomes = [(_rv(e, "nome", "")) + (f" ({_rv(e,'funcao','')})" if _rv(e, "funcao", "") else "") for e in emps]
+                pdf.multi_cell(0, 5, "Colaboradores: " + ", ".join(nomes))
+            if eqps:
+                descs = [_rv(e, "descricao", "") for e in eqps]
+                pdf.multi_cell(0, 5, "Equipamentos: " + ", ".join(descs))
+
+        # Parcelas
+        if inst:
+            pdf.ln(1)
+            pdf.set_fill_color(37, 99, 235)
+            pdf.set_text_color(255, 255, 255)
+            pdf.set_font("Helvetica", "B", 10)
+            pdf.cell(0, 7, "PARCELAS / RECEBÍVEIS", 0, 1, "L", True)
+            pdf.set_text_color(0, 0, 0)
+            pdf.set_font("Helvetica", "", 9)
+            for r in inst:
+                situ = "Pendente"
+                if int(_rv(r, "paid", 0)) == 1:
+                    situ = "Pago"
+                    if _rv(r, "paid_date", ""):
+                        situ += f" em {_fmt_date_iso(_rv(r,'paid_date',''))}"
+                pdf.multi_cell(0, 5, f"Parc. {_rv(r,'num_parcela','')} · Venc.: {_fmt_date_iso(_rv(r,'due_date',''))} · Valor: {_fmt_money(_rv(r,'amount',0.0))} · {situ}")
+
+        # Observações
+        pdf.ln(1)
+        pdf.set_fill_color(37, 99, 235)
+        pdf.set_text_color(255, 255, 255)
+        pdf.set_font("Helvetica", "B", 10)
+        pdf.cell(0, 7, "OBSERVAÇÕES E CONDIÇÕES", 0, 1, "L", True)
+        pdf.set_text_color(0, 0, 0)
+        pdf.set_font("Helvetica", "", 9)
+        obs = (
+            "Este documento comprova a contratação/execução dos serviços descritos. "
+            "Garantias e responsabilidades seguem as normas aplicáveis e o contrato firmado entre as partes."
+        )
+        pdf.multi_cell(0, 5, obs)
+
+        # Assinaturas
+        pdf.ln(12)
+        y = pdf.get_y()
+        pdf.line(25, y, 95, y)
+        pdf.line(115, y, 185, y)
+        pdf.set_font("Helvetica", "", 9)
+        pdf.set_y(y + 2)
+        pdf.cell(70, 5, "Assinatura do Responsável Técnico", 0, 0, "C")
+        pdf.set_x(115)
+        pdf.cell(70, 5, "Assinatura do Cliente", 0, 1, "C")
+
+    return pdf.output(dest="S").encode("latin-1")
+
+
+
+
+def generate_os_pdf_pro(ids: list[int], company_id: int) -> bytes:
+    """Gera um único PDF com uma OS por página (mais de uma página por OS se precisar)."""
+    comp = _fetch_company_company(company_id)
+    bundles = fetch_service_bundles(ids, company_id)
+
+    # Tenta ReportLab; se falhar, usa fpdf2
+    try:
+        buf = io.BytesIO()
+        _render_reportlab(ids, comp, bundles, buf)
+        return buf.getvalue()
+    except Exception:
+        return _render_fpdf(ids, comp, bundles)
+
+
+# ============================================================
+# ============ CACHE DE FRAGMENTOS (uma OS por arquivo) ======
+# ============================================================
+def _fragment_key(comp, pack: dict) -> str:
+    payload = {
+        "v": TEMPLATE_VERSION,
+        "comp": {f: _rv(comp, f, "") for f in _HEADER_FIELDS} if comp else None,
+        "pack": pack,
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _private_dir(path: str) -> bool:
+    """Cria `path` (e pais) só para o usuário do processo; False se não dá para confiar nele."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st_ = os.lstat(path)
+    if os.path.islink(path) or (hasattr(os, "getuid") and st_.st_uid != os.getuid()):
+        return False
+    if st_.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return True
+
+
+class _FragmentCache:
+    """Arquivos <dir>/<ab>/<hash>.pdf; LRU pelo mtime (tocado a cada leitura), limitado em bytes."""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._bytes = None   # total em disco; varrido na primeira gravação
+        self._lock = threading.Lock()
+        self._checked = False
+        self.hits = 0
+        self.misses = 0
+
+    def _enabled(self) -> bool:
+        """Limite > 0 e diretório privado (verificado uma vez; senão o cache desliga)."""
+        if self.max_bytes > 0 and not self._checked:
+            with self._lock:
+                if not self._checked:
+                    try:
+                        # a base (PDF_CACHE_DIR) também: makedirs só aplica o modo ao último nível
+                        ok = _private_dir(os.path.dirname(self.root)) and _private_dir(self.root)
+                    except OSError:
+                        ok = False
+                    if not ok:
+                        self.max_bytes = 0
+                    self._checked = True
+        return self.max_bytes > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".pdf")
+
+    def get(self, key: str) -> bytes | None:
+        if not self._enabled():
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        if not self._enabled():
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)   # atômico: leitores nunca veem arquivo pela metade
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(size for _, size, _ in self._entries())
+            else:
+                self._bytes += len(data)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for sub in os.scandir(self.root):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith(".pdf"):
+                    try:
+                        st_ = entry.stat()
+                    except OSError:
+                        continue
+                    yield entry.path, st_.st_size, st_.st_mtime
+
+    def _evict(self):
+        """Remove os menos usados até ficar em 90% do limite."""
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._bytes = total
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": self.hits / total if total else 0.0}
+
+
+fragment_cache = _FragmentCache(os.path.join(PDF_CACHE_DIR, "os"), int(PDF_CACHE_MAX_MB * 2**20))
+# lotes montados: LRU próprio, para um lote grande não expulsar os fragmentos
+batch_cache = _FragmentCache(os.path.join(PDF_CACHE_DIR, "lotes"), int(PDF_BATCH_CACHE_MAX_MB * 2**20))
+
+
+def _render_fragments(ids: list[int], comp, bundles: dict) -> list[bytes]:
+    """Um PDF sem numeração por OS (roda no worker ou localmente)."""
+    out = []
+    for sid in ids:
+        buf = io.BytesIO()
+        _render_reportlab([sid], comp, {sid: bundles[sid]}, buf, number_pages=False)
+        out.append(buf.getvalue())
+    return out
+
+
+# ============================================================
+# ============ LOTE PARALELO (pool de processos) =============
+# ============================================================
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _new_pool(workers: int) -> ProcessPoolExecutor:
+    # 'spawn': o Streamlit roda em várias threads, e fork com threads vivas não é seguro
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _pdf_pool() -> ProcessPoolExecutor:
+    """Pool único por processo (PDF_WORKERS), criado no primeiro lote."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _new_pool(PDF_WORKERS)
+        return _pool
+
+
+def _page_number_overlay(total: int) -> bytes:
+    """Um PDF só com "Página N" (mesma posição do rodapé) para cada página."""
+    from reportlab.lib.colors import HexColor
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.pdfgen import canvas
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    W, _H = A4
+    for n in range(1, total + 1):
+        c.setFont("Helvetica", 8)
+        c.setFillColor(HexColor("#0F172A"))
+        c.drawRightString(W-20*mm, 10.5*mm, f"Página {n}")
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def _merge_numbered(parts: list[bytes], out):
+    """Une os blocos na ordem e carimba a numeração contínua."""
+    from pypdf import PdfReader, PdfWriter
+
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(PdfReader(io.BytesIO(part)))
+    overlay = PdfReader(io.BytesIO(_page_number_overlay(len(writer.pages))))
+    for page, stamp in zip(writer.pages, overlay.pages):
+        page.merge_page(stamp)
+        page.compress_content_streams()   # merge_page regrava o conteúdo sem compressão
+    # cada fragmento traz o seu form "os_static", as fontes e o dicionário de
+    # fontes: iguais viram um objeto só. Uma passada só funde objetos cujas
+    # referências já coincidem, então são três: fontes -> /Font -> forms.
+    for _ in range(3):
+        writer.compress_identical_objects()
+    writer.write(out)
+
+
+def generate_os_pdf_batch(ids: list[int], company_id: int, progress=None,
+                          workers: int | None = None, chunk_size: int | None = None) -> bytes:
+    """
+    Mesmo PDF de generate_os_pdf_pro, montado a partir de fragmentos por OS:
+    os que estão no cache são só lidos; os demais são renderizados em blocos
+    (no pool de processos, se houver mais de um bloco e mais de um worker).
+    progress(feitos, total) é chamado a cada bloco concluído (ex.: st.progress).
+    Sem pypdf, cai no renderizador sequencial.
+    """
+    workers = workers or PDF_WORKERS
+    chunk_size = chunk_size or PDF_CHUNK_SIZE
+    try:
+        import pypdf  # noqa: F401
+    except ImportError:
+        pdf = generate_os_pdf_pro(ids, company_id)
+        if progress:
+            progress(1, 1)
+        return pdf
+
+    comp = _fetch_company_company(company_id)
+    comp = dict(comp) if comp else None
+    bundles = fetch_service_bundles(ids, company_id)
+    ids = [sid for sid in ids if sid in bundles]
+    keys = {sid: _fragment_key(comp, bundles[sid]) for sid in ids}
+    # lote idêntico já montado (mesmas OS, mesma ordem): só leitura
+    batch_key = hashlib.sha256("lote:".join(keys[sid] for sid in ids).encode()).hexdigest()
+    cached = batch_cache.get(batch_key)
+    if cached is not None:
+        if progress:
+            progress(1, 1)
+        return cached
+
+    frags = {sid: fragment_cache.get(keys[sid]) for sid in ids}
+    missing = [sid for sid in ids if frags[sid] is None]
+    chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+
+    def collect(chunk, rendered):
+        for sid, pdf in zip(chunk, rendered):
+            fragment_cache.put(keys[sid], pdf)
+            frags[sid] = pdf
+
+    if workers <= 1 or len(chunks) <= 1:
+        for done, chunk in enumerate(chunks, 1):
+            collect(chunk, _render_fragments(chunk, comp, bundles))
+            if progress:
+                progress(done, len(chunks))
+    else:
+        # pool compartilhado; outro tamanho (bench) usa um pool descartável
+        pool = _pdf_pool() if workers == PDF_WORKERS else _new_pool(workers)
+        try:
+            futures = {
+                pool.submit(_render_fragments, chunk, comp, {sid: bundles[sid] for sid in chunk}): chunk
+                for chunk in chunks
+            }
+            for done, fut in enumerate(as_completed(futures), 1):
+                collect(futures[fut], fut.result())
+                if progress:
+                    progress(done, len(chunks))
+        finally:
+            if pool is not _pool:
+                pool.shutdown()
+    if progress and not chunks:
+        progress(1, 1)
+
+    buf = io.BytesIO()
+    _merge_numbered([frags[sid] for sid in ids], buf)
+    pdf = buf.getvalue()
+    batch_cache.put(batch_key, pdf)
+    return pdf
+
+
+# ============================================================
+# ============ EXPORTAÇÃO EM DISCO (lotes grandes) ============
+# ============================================================
+class _ChunkedBundles:
+    """sid -> bundle, carregado bloco a bloco; só o bloco corrente fica em memória."""
+
+    def __init__(self, ids: list[int], company_id: int, chunk_size: int):
+        self._company_id = company_id
+        self._chunks = [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+        self._chunk_of = {sid: n for n, chunk in enumerate(self._chunks) for sid in chunk}
+        self._current = None
+        self._data: dict = {}
+        self.loaded = 0   # blocos carregados (progresso)
+
+    def get(self, sid):
+        n = self._chunk_of.get(sid)
+        if n is None:
+            return None
+        if n != self._current:
+            self._data = fetch_service_bundles(self._chunks[n], self._company_id)
+            self._current = n
+            self.loaded += 1
+        return self._data.get(sid)
+
+
+def _with_progress(ids: list[int], progress):
+    """Itera ids avisando progress(feitas, total) a cada OS."""
+    for done, sid in enumerate(ids, 1):
+        yield sid
+        if progress:
+            progress(done, len(ids))
+
+
+def _single_os_pdf(sid: int, comp, pack: dict) -> bytes:
+    """PDF de uma OS (numeração 1..n), a partir do cache de fragmentos quando há pypdf."""
+    try:
+        import pypdf  # noqa: F401
+    except ImportError:
+        buf = io.BytesIO()
+        _render_reportlab([sid], comp, {sid: pack}, buf)
+        return buf.getvalue()
+    key = _fragment_key(comp, pack)
+    frag = fragment_cache.get(key)
+    if frag is None:
+        frag = _render_fragments([sid], comp, {sid: pack})[0]
+        fragment_cache.put(key, frag)
+    buf = io.BytesIO()
+    _merge_numbered([frag], buf)
+    return buf.getvalue()
+
+
+def export_os_pdf(ids: list[int], company_id: int, dest: str, per_os_zip: bool = False,
+                  chunk_size: int | None = None, progress=None) -> str:
+    """
+    Grava as OS em `dest`, com os dados carregados por blocos. Com per_os_zip,
+    um ZIP com um PDF por OS acrescentado a cada OS renderizada: memória
+    constante, qualquer que seja o lote. Sem ele, um PDF único: o ReportLab só
+    escreve no arquivo em save() e até lá guarda as páginas, então o pico
+    cresce com o lote (menos que BytesIO + bytes, mas não é constante).
+    progress(feitas, total) por OS.
+    """
+    chunk_size = chunk_size or PDF_CHUNK_SIZE
+    comp = _fetch_company_company(company_id)
+    bundles = _ChunkedBundles(list(ids), company_id, chunk_size)
+    total = len(ids)
+
+    if not per_os_zip:
+        _render_reportlab(_with_progress(ids, progress), comp, bundles, dest)
+        return dest
+
+    with zipfile.ZipFile(dest, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for done, sid in enumerate(ids, 1):
+            pack = bundles.get(sid)
+            if pack:
+                zf.writestr(f"OS_{sid:06d}.pdf", _single_os_pdf(sid, comp, pack))
+            if progress:
+                progress(done, total)
+    return dest
@@ -1,8 +1,10 @@
 ﻿import streamlit as st, uuid, datetime
 from db_core import get_conn
+from dialect import insert_ignore, upsert
 from security import create_user
 from utils_email import send_email
-from permissions import check_perm
+from session_helpers import invalidate_tenant_context
+from permissions import ACTION_BITS, check_perm, invalidate_permissions, load_permission_matrix
 
 st.set_page_config(page_title="🔐 Usuários (Admin)", layout="wide")
 
@@ -108,9 +110,11 @@ if users:
             target_ids = {opts[n] for n in sel_emp}
             with get_conn() as conn:
                 conn.execute("DELETE FROM user_companies WHERE user_id=?", (uid,))
-                for cid in target_ids:
-                    conn.execute("INSERT OR IGNORE INTO user_companies(user_id, company_id) VALUES (?,?)", (uid, cid))
+                if target_ids:
+                    conn.executemany(insert_ignore("user_companies", ["user_id", "company_id"]),
+                                     [(uid, cid) for cid in target_ids])
                 conn.commit()
+            invalidate_tenant_context()
             st.success("Vínculos atualizados."); st.rerun()
 
     with st.expander("🔏 Escopo por página (CRUD)", expanded=True):
@@ -128,26 +132,21 @@ if users:
         ]
         # selecionar empresa alvo
         cid = st.selectbox("Empresa alvo", [c["id"] for c in companies], format_func=lambda x: next(c["razao_social"] for c in companies if c["id"]==x))
+        matrix = load_permission_matrix(uid, cid)
         rows=[]
-        with get_conn() as conn:
-            for key,title in pages:
-                p = conn.execute("""
-                  SELECT can_view,can_create,can_edit,can_delete
-                  FROM permissions WHERE user_id=? AND company_id=? AND page_key=?""",
-                  (uid, cid, key)).fetchone()
-                rows.append([key,title] + [bool(p[k]) if p else (key=="EMPRESAS" and st.session_state.user["role"]=="admin") for k in ["can_view","can_create","can_edit","can_delete"]])
+        for key,title in pages:
+            bits = matrix.get(key)
+            rows.append([key,title] + [bool(bits & ACTION_BITS[a]) if bits is not None else (key=="EMPRESAS" and st.session_state.user["role"]=="admin") for a in ["view","create","edit","delete"]])
         import pandas as pd
         df = pd.DataFrame(rows, columns=["page_key","Página","Ver","Incluir","Editar","Excluir"])
         edited = st.data_editor(df, hide_index=True, disabled=["page_key","Página"], use_container_width=True)
         if st.button("Salvar escopo"):
             with get_conn() as conn:
-                for _,r in edited.iterrows():
-                    conn.execute("""
-                      INSERT INTO permissions(user_id,company_id,page_key,can_view,can_create,can_edit,can_delete)
-                      VALUES (?,?,?,?,?,?,?)
-                      ON CONFLICT(user_id,company_id,page_key) DO UPDATE SET
-                        can_view=excluded.can_view, can_create=excluded.can_create,
-                        can_edit=excluded.can_edit, can_delete=excluded.can_delete
-                    """, (uid, cid, r["page_key"], int(r["Ver"]), int(r["Incluir"]), int(r["Editar"]), int(r["Excluir"])))
+                sql = upsert("permissions",
+                             ["user_id","company_id","page_key","can_view","can_create","can_edit","can_delete"],
+                             ["user_id","company_id","page_key"])
+                conn.executemany(sql, [(uid, cid, r["page_key"], int(r["Ver"]), int(r["Incluir"]), int(r["Editar"]), int(r["Excluir"]))
+                                       for _,r in edited.iterrows()])
                 conn.commit()
+            invalidate_permissions(uid)
             st.success("Escopo salvo.")
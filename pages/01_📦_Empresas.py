@@ -4,6 +4,9 @@ from functools import lru_cache
 
 import streamlit as st
 from db_core import get_conn
+from dialect import insert_ignore, upsert
+from session_helpers import invalidate_tenant_context
+from init_db import migrate
 from utils import cnpj_mask
 from utils_cep import busca_cep
 
@@ -39,18 +42,9 @@ def rget(row, key, default=""):
 def ensure_cnae_table():
     """
     Garante a existência da tabela CNAE (SQLite e Postgres/Supabase).
-    Schema mínimo: code TEXT PRIMARY KEY, descricao TEXT NOT NULL.
+    A tabela vem das migrações versionadas (init_db); aqui só confere a versão.
     """
-    with get_conn() as conn:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS cnae (
-                code TEXT PRIMARY KEY,
-                descricao TEXT NOT NULL
-            )
-            """
-        )
-        conn.commit()
+    migrate()
 
 
 def seed_cnae_if_empty():
@@ -98,15 +92,8 @@ def seed_cnae_if_empty():
 
     try:
         with get_conn() as conn:
-            for code, desc in rows_to_insert:
-                try:
-                    conn.execute("INSERT INTO cnae(code, descricao) VALUES (?, ?)", (code, desc))
-                except Exception:
-                    # se já existe, tenta atualizar a descrição
-                    try:
-                        conn.execute("UPDATE cnae SET descricao=? WHERE code=?", (desc, code))
-                    except Exception:
-                        pass
+            # se já existe, atualiza a descrição (upsert em lote)
+            conn.executemany(upsert("cnae", ["code", "descricao"], "code"), rows_to_insert)
             conn.commit()
     except Exception:
         # não derruba a página por causa do seed
@@ -122,7 +109,6 @@ def _lookup_local_cnae(code_norm: str) -> str | None:
     if not code_norm:
         return None
 
-    ensure_cnae_table()
     try:
         with get_conn() as conn:
             row = conn.execute("SELECT descricao FROM cnae WHERE code=?", (code_norm,)).fetchone()
@@ -290,6 +276,7 @@ with st.expander("➕ Nova empresa", expanded=is_admin()):
                         ),
                     )
                     conn.commit()
+                invalidate_tenant_context()
                 st.success("Empresa cadastrada com sucesso.")
                 st.session_state.pop("_addr_novo", None)
                 st.rerun()
@@ -424,12 +411,15 @@ else:
                         ),
                     )
                     conn.commit()
+                invalidate_tenant_context()
                 st.success("Empresa atualizada.")
 
             if can_edit and colD.button("Excluir", key=f"del{e['id']}"):
                 with get_conn() as conn:
+                    conn.execute("DELETE FROM cash_daily WHERE company_id=?", (e["id"],))
                     conn.execute("DELETE FROM companies WHERE id=?", (e["id"],))
                     conn.commit()
+                invalidate_tenant_context()
                 st.warning("Empresa excluída.")
                 st.rerun()
 
@@ -456,22 +446,12 @@ else:
                         with get_conn() as conn:
                             u = conn.execute("SELECT id FROM users WHERE email=?", (email,)).fetchone()
                             if u:
-                                # Compat: SQLite (INSERT OR IGNORE) e Postgres (ON CONFLICT DO NOTHING)
-                                try:
-                                    conn.execute(
-                                        "INSERT OR IGNORE INTO user_companies(user_id, company_id) VALUES (?,?)",
-                                        (u["id"], e["id"]),
-                                    )
-                                except Exception:
-                                    try:
-                                        conn.execute(
-                                            "INSERT INTO user_companies(user_id, company_id) VALUES (?,?) "
-                                            "ON CONFLICT (user_id, company_id) DO NOTHING",
-                                            (u["id"], e["id"]),
-                                        )
-                                    except Exception:
-                                        pass
+                                conn.execute(
+                                    insert_ignore("user_companies", ["user_id", "company_id"]),
+                                    (u["id"], e["id"]),
+                                )
                                 conn.commit()
+                                invalidate_tenant_context()
                                 st.success("Usuário vinculado.")
                                 st.rerun()
                             else:
@@ -3,7 +3,8 @@ import io
 import pandas as pd
 import streamlit as st
 from session_helpers import require_company_with_picker
-from db_core import get_conn, init_schema_and_seed
+from db_core import get_conn, cached_query
+from init_db import migrate
 from utils_cep import busca_cep
 
 # (opcional) permissões finas por página/empresa
@@ -14,8 +15,8 @@ except Exception:
 
 st.set_page_config(page_title="👥 Clientes", layout="wide")
 
-# Garante o schema mínimo (users, companies, clients, etc.)
-init_schema_and_seed()
+# Garante o schema (migrações versionadas; já migrado = 1 consulta de versão)
+migrate()
 
 # Exige login e seleciona/garante empresa ativa
 cid = require_company_with_picker()
@@ -123,38 +124,37 @@ with colf2:
     ordenar = st.selectbox("Ordenar por", ["nome", "created_at", "doc"], index=0)
 
 # Busca com whitelist para ORDER BY
-with get_conn() as conn:
-    valid_orders = {
-        "nome": "nome",
-        "doc": "doc",
-        "email": "email",
-        "phone": "phone",
-        "id": "id",
-        "created_at": "created_at",
-    }
-    order_by = valid_orders.get(str(ordenar).lower(), "nome")
-
-    if q.strip():
-        like = f"%{q.strip()}%"
-        rows = conn.execute(
-            f"""
-            SELECT * FROM clients
-            WHERE company_id=?
-              AND (
-                   nome LIKE ?
-                OR COALESCE(doc,'') LIKE ?
-                OR COALESCE(email,'') LIKE ?
-                OR COALESCE(phone,'') LIKE ?
-              )
-            ORDER BY {order_by}
-            """,
-            (cid, like, like, like, like),
-        ).fetchall()
-    else:
-        rows = conn.execute(
-            f"SELECT * FROM clients WHERE company_id=? ORDER BY {order_by}",
-            (cid,),
-        ).fetchall()
+valid_orders = {
+    "nome": "nome",
+    "doc": "doc",
+    "email": "email",
+    "phone": "phone",
+    "id": "id",
+    "created_at": "created_at",
+}
+order_by = valid_orders.get(str(ordenar).lower(), "nome")
+
+if q.strip():
+    like = f"%{q.strip()}%"
+    rows = cached_query(
+        f"""
+        SELECT * FROM clients
+        WHERE company_id=?
+          AND (
+               nome LIKE ?
+            OR COALESCE(doc,'') LIKE ?
+            OR COALESCE(email,'') LIKE ?
+            OR COALESCE(phone,'') LIKE ?
+          )
+        ORDER BY {order_by}
+        """,
+        (cid, like, like, like, like),
+    )
+else:
+    rows = cached_query(
+        f"SELECT * FROM clients WHERE company_id=? ORDER BY {order_by}",
+        (cid,),
+    )
 
 st.subheader(f"Clientes ({len(rows)})")
 
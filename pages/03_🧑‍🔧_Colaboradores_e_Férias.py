@@ -10,7 +10,8 @@ import pandas as pd
 import streamlit as st
 
 from session_helpers import require_company_with_picker
-from db_core import get_conn
+from db_core import get_conn, fetch_df, cached_df
+from init_db import migrate
 
 # ==============================
 # Config
@@ -25,76 +26,6 @@ def require_company():
         st.stop()
 
 
-def ensure_schema():
-    """Create/adjust minimally required tables/columns."""
-    with get_conn() as conn:
-        # employees
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS employees(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                company_id INTEGER NOT NULL,
-                matricula TEXT,
-                nome TEXT,
-                funcao TEXT,
-                salario REAL DEFAULT 0,
-                diaria REAL DEFAULT 0,
-                data_admissao TEXT,
-                data_rescisao TEXT,
-                ativo INTEGER DEFAULT 1
-            )
-            """
-        )
-        # vacations
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS vacations(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id INTEGER NOT NULL,
-                inicio_gozo TEXT,
-                fim_gozo TEXT,
-                dias INTEGER,
-                base REAL,
-                um_terco REAL,
-                inss REAL,
-                fgts REAL,
-                irrf REAL,
-                liquido REAL,
-                observacao TEXT
-            )
-            """
-        )
-        # leaves (afastamentos)
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS leaves(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id INTEGER NOT NULL,
-                tipo TEXT,
-                inicio TEXT,
-                fim TEXT,
-                observacao TEXT
-            )
-            """
-        )
-        # cash ledger (entrada/saída)
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS cash_ledger(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                company_id INTEGER NOT NULL,
-                data TEXT NOT NULL,
-                tipo TEXT NOT NULL,            -- 'in' ou 'out'
-                valor REAL NOT NULL,
-                descricao TEXT,
-                link_tipo TEXT,
-                link_id INTEGER
-            )
-            """
-        )
-        conn.commit()
-
-
 def fmt_dmy(x: Optional[str | date]) -> str:
     if x is None:
         return ""
@@ -198,7 +129,7 @@ def calc_ferias(
 # App
 # ==============================
 require_company()
-ensure_schema()
+migrate()
 cid = require_company_with_picker()
 
 st.title("🧑‍🔧 Colaboradores & Férias")
@@ -230,23 +161,15 @@ with col1:
 with col2:
     st.subheader("Colaboradores")
     incluir_inativos = st.checkbox("Incluir inativos", value=False)
-    with get_conn() as conn:
-        if incluir_inativos:
-            emps = conn.execute(
-                "SELECT * FROM employees WHERE company_id=? ORDER BY nome",
-                (cid,),
-            ).fetchall()
-        else:
-            emps = conn.execute(
-                "SELECT * FROM employees WHERE company_id=? AND COALESCE(ativo,1)=1 ORDER BY nome",
-                (cid,),
-            ).fetchall()
-
-    df_emps = pd.DataFrame([{k: r[k] for k in r.keys()} for r in emps])
+    filtro_ativo = "" if incluir_inativos else " AND COALESCE(ativo,1)=1"
+    df_emps = cached_df(
+        f"SELECT * FROM employees WHERE company_id=?{filtro_ativo} ORDER BY nome",
+        (cid,),
+        parse_dates=["data_admissao", "data_rescisao"],
+    )
     if not df_emps.empty:
         for col in ["data_admissao", "data_rescisao"]:
-            if col in df_emps.columns:
-                df_emps[col] = df_emps[col].apply(fmt_dmy)
+            df_emps[col] = df_emps[col].dt.strftime("%d/%m/%Y").fillna("")
     st.dataframe(df_emps, use_container_width=True)
 
     with st.expander("📌 Marcar rescisão / mover para inativos"):
@@ -447,44 +370,38 @@ if emp_name:
                 st.success("Afastamento lançado.")
 
     st.markdown("#### Registros de férias")
-    with get_conn() as conn:
-        vf = conn.execute(
-            "SELECT * FROM vacations WHERE employee_id=? ORDER BY date(inicio_gozo) DESC",
-            (emp_id,),
-        ).fetchall()
-    df_vf = pd.DataFrame([{k: r[k] for k in r.keys()} for r in vf])
+    df_vf = fetch_df(
+        "SELECT * FROM vacations WHERE employee_id=? ORDER BY date(inicio_gozo) DESC",
+        (emp_id,),
+        parse_dates=["inicio_gozo", "fim_gozo"],
+    )
     if not df_vf.empty:
         for c in ["inicio_gozo", "fim_gozo"]:
-            if c in df_vf:
-                df_vf[c] = df_vf[c].apply(fmt_dmy)
+            df_vf[c] = df_vf[c].dt.strftime("%d/%m/%Y").fillna("")
     st.dataframe(df_vf, use_container_width=True)
 
     st.markdown("#### Registros de afastamentos")
-    with get_conn() as conn:
-        af = conn.execute(
-            "SELECT * FROM leaves WHERE employee_id=? ORDER BY date(inicio) DESC",
-            (emp_id,),
-        ).fetchall()
-    df_af = pd.DataFrame([{k: r[k] for k in r.keys()} for r in af])
+    df_af = fetch_df(
+        "SELECT * FROM leaves WHERE employee_id=? ORDER BY date(inicio) DESC",
+        (emp_id,),
+        parse_dates=["inicio", "fim"],
+    )
     if not df_af.empty:
         for c in ["inicio", "fim"]:
-            if c in df_af:
-                df_af[c] = df_af[c].apply(fmt_dmy)
+            df_af[c] = df_af[c].dt.strftime("%d/%m/%Y").fillna("")
     st.dataframe(df_af, use_container_width=True)
 
 # Exportação da lista de colaboradores (PDF/XLSX/CSV)
 st.divider()
 st.subheader("Exportações")
-with get_conn() as conn:
-    emps2 = conn.execute(
-        "SELECT matricula,nome,funcao,salario,diaria,data_admissao,data_rescisao,COALESCE(ativo,1) as ativo FROM employees WHERE company_id=?",
-        (cid,),
-    ).fetchall()
-df_list = pd.DataFrame([{k: r[k] for k in r.keys()} for r in emps2])
+df_list = fetch_df(
+    "SELECT matricula,nome,funcao,salario,diaria,data_admissao,data_rescisao,COALESCE(ativo,1) as ativo FROM employees WHERE company_id=?",
+    (cid,),
+    parse_dates=["data_admissao", "data_rescisao"],
+)
 if not df_list.empty:
     for col in ["data_admissao", "data_rescisao"]:
-        if col in df_list:
-            df_list[col] = df_list[col].apply(fmt_dmy)
+        df_list[col] = df_list[col].dt.strftime("%d/%m/%Y").fillna("")
 
     # CSV
     csv_buf = io.StringIO()
@@ -8,7 +8,9 @@ import pandas as pd
 import streamlit as st
 
 from session_helpers import require_company_with_picker
-from db_core import get_conn
+from cash_cube import bump
+from db_core import get_conn, fetch_df, last_insert_id_sql
+from init_db import migrate
 
 st.set_page_config(page_title="🛠️ Equipamentos & Manutenção", layout="wide")
 
@@ -18,96 +20,6 @@ def require_company():
         st.stop()
 
 
-def ensure_schema_eq():
-    with get_conn() as conn:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS equipment(
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              company_id INTEGER NOT NULL,
-              codigo TEXT,
-              descricao TEXT,
-              tipo TEXT,
-              placa TEXT,
-              chassi TEXT,
-              doc_vencimento TEXT,
-              manut_km INTEGER DEFAULT 0,
-              manut_data TEXT,
-              observacao TEXT,
-              ativo INTEGER DEFAULT 1
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS equipment_docs(
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              equipment_id INTEGER NOT NULL,
-              nome TEXT,
-              dt_validade TEXT,
-              resolvido INTEGER DEFAULT 0
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS equipment_maintenance(
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              equipment_id INTEGER NOT NULL,
-              tipo TEXT,
-              data TEXT,
-              km INTEGER,
-              descricao TEXT,
-              custo REAL DEFAULT 0
-            )
-            """
-        )
-        # Alvarás/licenças da empresa
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS company_permits(
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              company_id INTEGER NOT NULL,
-              nome TEXT,
-              dt_validade TEXT,
-              resolvido INTEGER DEFAULT 0
-            )
-            """
-        )
-        # expenses (p/ integração de custo manutenção)
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS expenses(
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              company_id INTEGER NOT NULL,
-              fornecedor TEXT,
-              descricao TEXT,
-              categoria TEXT,
-              tags TEXT,
-              forma_pagamento TEXT,
-              data_lancamento TEXT,
-              valor_total REAL,
-              parcelas INTEGER DEFAULT 1,
-              equipment_id INTEGER
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS expense_installments(
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              expense_id INTEGER NOT NULL,
-              num_parcela INTEGER,
-              due_date TEXT,
-              amount REAL,
-              paid INTEGER DEFAULT 0,
-              paid_date TEXT
-            )
-            """
-        )
-        conn.commit()
-
-
 def fmt_dmy(x):
     try:
         if isinstance(x, str):
@@ -118,7 +30,7 @@ def fmt_dmy(x):
 
 
 require_company()
-ensure_schema_eq()
+migrate()
 cid = require_company_with_picker()
 
 st.title("🛠️ Equipamentos & Manutenção")
@@ -159,17 +71,14 @@ with st.expander("📇 Cadastro de equipamentos", expanded=True):
                 conn.commit()
             st.success("Equipamento salvo.")
 
-with get_conn() as conn:
-    eqs = conn.execute(
-        "SELECT * FROM equipment WHERE company_id=? AND COALESCE(ativo,1)=1 ORDER BY descricao",
-        (cid,),
-    ).fetchall()
-
-df_eq = pd.DataFrame([{k: r[k] for k in r.keys()} for r in eqs])
+df_eq = fetch_df(
+    "SELECT * FROM equipment WHERE company_id=? AND COALESCE(ativo,1)=1 ORDER BY descricao",
+    (cid,),
+    parse_dates=["doc_vencimento", "manut_data"],
+)
 if not df_eq.empty:
     for c in ["doc_vencimento", "manut_data"]:
-        if c in df_eq:
-            df_eq[c] = df_eq[c].apply(fmt_dmy)
+        df_eq[c] = df_eq[c].dt.strftime("%d/%m/%Y").fillna("")
 st.dataframe(df_eq, use_container_width=True)
 
 # --- Expanders por equipamento (docs/manutenções)
@@ -191,14 +100,13 @@ for _, row in df_eq.iterrows():
                         )
                         conn.commit()
                     st.success("Documento salvo.")
-            with get_conn() as conn:
-                docs = conn.execute(
-                    "SELECT * FROM equipment_docs WHERE equipment_id=? ORDER BY date(dt_validade) DESC",
-                    (eid,),
-                ).fetchall()
-            df_docs = pd.DataFrame([{k: r[k] for k in r.keys()} for r in docs])
+            df_docs = fetch_df(
+                "SELECT * FROM equipment_docs WHERE equipment_id=? ORDER BY date(dt_validade) DESC",
+                (eid,),
+                parse_dates=["dt_validade"],
+            )
             if not df_docs.empty:
-                df_docs["dt_validade"] = df_docs["dt_validade"].apply(fmt_dmy)
+                df_docs["dt_validade"] = df_docs["dt_validade"].dt.strftime("%d/%m/%Y").fillna("")
             st.dataframe(df_docs, use_container_width=True)
 
         with c2:
@@ -211,19 +119,18 @@ for _, row in df_eq.iterrows():
                 custo = st.number_input("Custo (R$)", min_value=0.0, step=0.01, format="%.2f")
                 okm = st.form_submit_button("Salvar manutenção")
                 if okm:
-                    with get_conn() as conn:
+                    with get_conn() as conn, conn.pipeline():
                         # Lança manutenção
-                        cur = conn.execute(
+                        conn.execute(
                             """
                             INSERT INTO equipment_maintenance(equipment_id,tipo,data,km,descricao,custo)
                             VALUES (?,?,?,?,?,?)
                             """,
                             (eid, tipo_m, dt_m.isoformat(), km, d_m, custo),
                         )
-                        manut_id = cur.lastrowid
                         # Integra em Despesas (categoria=Manutenção Equipamento)
                         if custo and custo > 0:
-                            cur2 = conn.execute(
+                            conn.execute(
                                 """
                                 INSERT INTO expenses(company_id,fornecedor,descricao,categoria,tags,forma_pagamento,data_lancamento,valor_total,parcelas,equipment_id)
                                 VALUES (?,?,?,?,?,?,?,?,?,?)
@@ -241,22 +148,22 @@ for _, row in df_eq.iterrows():
                                     eid,
                                 ),
                             )
-                            exp_id = cur2.lastrowid
                             conn.execute(
-                                "INSERT INTO expense_installments(expense_id,num_parcela,due_date,amount) VALUES (?,?,?,?)",
-                                (exp_id, 1, dt_m.isoformat(), custo),
+                                "INSERT INTO expense_installments(expense_id,num_parcela,due_date,amount) "
+                                f"VALUES ({last_insert_id_sql('expenses')},?,?,?)",
+                                (1, dt_m.isoformat(), custo),
                             )
+                            bump(conn, cid, dt_m.isoformat(), "out", "open", custo)
                         conn.commit()
                     st.success("Manutenção lançada e despesa integrada ao módulo 💸 Despesas.")
 
-            with get_conn() as conn:
-                mans = conn.execute(
-                    "SELECT * FROM equipment_maintenance WHERE equipment_id=? ORDER BY date(data) DESC",
-                    (eid,),
-                ).fetchall()
-            df_m = pd.DataFrame([{k: r[k] for k in r.keys()} for r in mans])
+            df_m = fetch_df(
+                "SELECT * FROM equipment_maintenance WHERE equipment_id=? ORDER BY date(data) DESC",
+                (eid,),
+                parse_dates=["data"],
+            )
             if not df_m.empty:
-                df_m["data"] = df_m["data"].apply(fmt_dmy)
+                df_m["data"] = df_m["data"].dt.strftime("%d/%m/%Y").fillna("")
             st.dataframe(df_m, use_container_width=True)
 
 # --- Alvarás/Permissões da empresa
@@ -275,14 +182,13 @@ with st.form("f_alvara"):
             conn.commit()
         st.success("Alvará salvo.")
 
-with get_conn() as conn:
-    alvs = conn.execute(
-        "SELECT * FROM company_permits WHERE company_id=? ORDER BY date(dt_validade) DESC",
-        (cid,),
-    ).fetchall()
-df_alv = pd.DataFrame([{k: r[k] for k in r.keys()} for r in alvs])
+df_alv = fetch_df(
+    "SELECT * FROM company_permits WHERE company_id=? ORDER BY date(dt_validade) DESC",
+    (cid,),
+    parse_dates=["dt_validade"],
+)
 if not df_alv.empty:
-    df_alv["dt_validade"] = df_alv["dt_validade"].apply(fmt_dmy)
+    df_alv["dt_validade"] = df_alv["dt_validade"].dt.strftime("%d/%m/%Y").fillna("")
 st.dataframe(df_alv, use_container_width=True)
 
 # --- Notificações D-30/20/10/5 (lista e marcação como resolvido)
@@ -3,12 +3,19 @@
 # ============================================================
 from __future__ import annotations
 import io
-from datetime import date, datetime, timedelta
+from datetime import date
 import pandas as pd
 import streamlit as st
 
 from session_helpers import require_company_with_picker
-from db_core import get_conn
+from cash_cube import track
+from db_core import get_conn, fetch_df, cached_df
+from dialect import day_params, today_iso
+from init_db import migrate
+from recurrence import (FREQUENCIES, RULE_LIST_SQL, create_rule, delete_rule, end_rule, horizon, materialize,
+                        materialize_installments, virtual_installments)
+from schedule import build_schedule
+from settlement import CASH_DAY_SQL, OPEN_EXPENSE_INSTALLMENTS_SQL, settle_installments
 
 st.set_page_config(page_title="💸 Despesas", layout="wide")
 
@@ -18,73 +25,8 @@ def require_company():
         st.stop()
 
 
-def ensure_schema_exp():
-    with get_conn() as conn:
-        # Fornecedores
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS suppliers(
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              company_id INTEGER NOT NULL,
-              nome TEXT,
-              doc TEXT,
-              email TEXT,
-              phone TEXT,
-              address TEXT
-            )
-            """
-        )
-        # Despesas
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS expenses(
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              company_id INTEGER NOT NULL,
-              supplier_id INTEGER,
-              fornecedor TEXT,      -- legado/rápido
-              descricao TEXT,
-              categoria TEXT,
-              tags TEXT,
-              forma_pagamento TEXT,
-              data_lancamento TEXT,
-              valor_total REAL,
-              parcelas INTEGER DEFAULT 1
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS expense_installments(
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              expense_id INTEGER NOT NULL,
-              num_parcela INTEGER,
-              due_date TEXT,
-              amount REAL,
-              paid INTEGER DEFAULT 0,
-              paid_date TEXT
-            )
-            """
-        )
-        # Caixa
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS cash_ledger(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                company_id INTEGER NOT NULL,
-                data TEXT NOT NULL,
-                tipo TEXT NOT NULL,            -- 'in' ou 'out'
-                valor REAL NOT NULL,
-                descricao TEXT,
-                link_tipo TEXT,
-                link_id INTEGER
-            )
-            """
-        )
-        conn.commit()
-
-
 require_company()
-ensure_schema_exp()
+migrate()
 cid = require_company_with_picker()
 
 st.title("💸 Despesas (a pagar)")
@@ -107,12 +49,10 @@ with st.expander("📇 Fornecedores (CPF/CNPJ, endereço)", expanded=False):
                 conn.commit()
             st.success("Fornecedor salvo.")
 
-    with get_conn() as conn:
-        sups = conn.execute("SELECT * FROM suppliers WHERE company_id=? ORDER BY nome", (cid,)).fetchall()
-    df_sups = pd.DataFrame([{k: r[k] for k in r.keys()} for r in sups])
+    df_sups = fetch_df("SELECT * FROM suppliers WHERE company_id=? ORDER BY nome", (cid,))
     st.dataframe(df_sups, use_container_width=True)
 
-# --- Lançar despesa (repetir N meses / categorias / tags)
+# --- Lançar despesa (avulsa ou recorrente / categorias / tags)
 with st.form("f_exp"):
     st.subheader("Lançar despesa")
     fornecedor = st.selectbox("Fornecedor (cadastro)", ["-"] + (df_sups["nome"].tolist() if not df_sups.empty else []))
@@ -124,7 +64,11 @@ with st.form("f_exp"):
     dt = st.date_input("Data de lançamento", value=date.today())
     valor = st.number_input("Valor total (R$)", min_value=0.0, step=0.01, format="%.2f")
     parcelas = st.number_input("Parcelas", min_value=1, max_value=120, value=1)
-    repetir = st.number_input("Repetir por N meses (cópias futuras)", min_value=0, max_value=60, value=0)
+    c1, c2, c3 = st.columns(3)
+    freq = c1.selectbox("Recorrência", [0] + list(FREQUENCIES),
+                        format_func=lambda f: FREQUENCIES.get(f, "Não repete"))
+    ocorrencias = c2.number_input("Ocorrências (0 = sem fim)", min_value=0, value=0)
+    ate = c3.date_input("Até (opcional)", value=None)
     ok = st.form_submit_button("Salvar")
     if ok:
         with get_conn() as conn:
@@ -133,96 +77,103 @@ with st.form("f_exp"):
             if fornecedor and fornecedor != "-":
                 row = conn.execute("SELECT id FROM suppliers WHERE company_id=? AND nome=?", (cid, fornecedor)).fetchone()
                 supplier_id = row["id"] if row else None
+            campos = dict(
+                supplier_id=supplier_id,
+                fornecedor=fornecedor_livre or fornecedor if fornecedor != "-" else fornecedor_livre,
+                descricao=descricao,
+                categoria=categoria,
+                tags=tags,
+                forma_pagamento=forma,
+            )
 
-            def inserir_uma_despesa(base_date: date):
-                cur = conn.execute(
+            if freq:
+                # recorrente: só a regra; as ocorrências são previstas na leitura
+                # e gravadas ao pagar/editar (recurrence.py)
+                create_rule(conn, cid, valor, int(parcelas), dt, freq_months=freq, end=ate,
+                            occurrences=int(ocorrencias) or None, **campos)
+            else:
+                exp_id = conn.execute(
                     """
                     INSERT INTO expenses(company_id,supplier_id,fornecedor,descricao,categoria,tags,forma_pagamento,data_lancamento,valor_total,parcelas)
                     VALUES (?,?,?,?,?,?,?,?,?,?)
+                    RETURNING id
                     """,
-                    (
-                        cid,
-                        supplier_id,
-                        fornecedor_livre or fornecedor if fornecedor != "-" else fornecedor_livre,
-                        descricao,
-                        categoria,
-                        tags,
-                        forma,
-                        base_date.isoformat(),
-                        valor,
-                        parcelas,
-                    ),
+                    (cid, campos["supplier_id"], campos["fornecedor"], descricao, categoria, tags, forma,
+                     dt.isoformat(), valor, parcelas),
+                ).fetchone()["id"]
+                conn.copy_rows(
+                    "expense_installments",
+                    ["expense_id", "num_parcela", "due_date", "amount"],
+                    build_schedule(valor, int(parcelas), dt).rows([exp_id]),
                 )
-                exp_id = cur.lastrowid
-                par_val = round(valor / parcelas, 2)
-                vals = [par_val] * parcelas
-                dif = round(valor - sum(vals), 2)
-                vals[-1] += dif
-                for i in range(parcelas):
-                    due = (base_date.replace(day=1) + timedelta(days=31 * i)).replace(day=base_date.day)
-                    conn.execute(
-                        "INSERT INTO expense_installments(expense_id,num_parcela,due_date,amount) VALUES (?,?,?,?)",
-                        (exp_id, i + 1, due.isoformat(), vals[i]),
-                    )
-                return exp_id
-
-            # atual
-            inserir_uma_despesa(dt)
-            # cópias futuras
-            b = dt
-            for _ in range(int(repetir)):
-                b = (b.replace(day=1) + timedelta(days=31)).replace(day=dt.day)
-                inserir_uma_despesa(b)
-
+                track(conn, "out", 1, parents=[exp_id])
             conn.commit()
-        st.success("Despesa(s) lançada(s) com parcelas geradas.")
+        st.success("Despesa recorrente cadastrada." if freq else "Despesa lançada com parcelas geradas.")
+
+# --- Recorrências (regras; ocorrências previstas até o horizonte)
+with st.expander("🔁 Despesas recorrentes", expanded=False):
+    df_rules = cached_df(RULE_LIST_SQL, (cid,))
+    st.dataframe(df_rules, use_container_width=True)
+    if not df_rules.empty:
+        rule_labels = {int(r.id): f"#{r.id} {r.descricao or ''} ({r.fornecedor or '-'})" for r in df_rules.itertuples()}
+        c1, c2 = st.columns(2)
+        with c1.form("f_rule_end"):
+            rid = st.selectbox("Regra", list(rule_labels), format_func=rule_labels.get)
+            fim = st.date_input("Encerrar em", value=date.today())
+            b_end, b_del = st.columns(2)
+            if b_end.form_submit_button("Encerrar"):
+                end_rule(cid, rid, fim)
+                st.success("Recorrência encerrada; ocorrências posteriores não serão previstas.")
+                st.rerun()
+            if b_del.form_submit_button("Excluir regra"):
+                delete_rule(cid, rid)
+                st.success("Regra excluída (ocorrências já gravadas continuam como despesas).")
+                st.rerun()
+
+        # editar/cancelar uma ocorrência = materializá-la com outro valor/parcelas
+        df_occ = virtual_installments(cid).drop_duplicates(["recurrence_id", "occurrence"])
+        with c2.form("f_occ_edit"):
+            occ_labels = {
+                (int(r.recurrence_id), int(r.occurrence)):
+                    f"{rule_labels.get(int(r.recurrence_id), r.recurrence_id)} — {r.data_lancamento:%d/%m/%Y}"
+                for r in df_occ.itertuples()
+            }
+            occ = st.selectbox("Ocorrência prevista", list(occ_labels), format_func=occ_labels.get)
+            novo_valor = st.number_input("Novo valor total (R$)", min_value=0.0, step=0.01, format="%.2f")
+            novas_parcelas = st.number_input("Parcelas", min_value=1, max_value=120, value=1, key="occ_parc")
+            cancelar = st.checkbox("Cancelar esta ocorrência")
+            if st.form_submit_button("Gravar ocorrência") and occ:
+                overrides = {"valor_total": 0.0, "parcelas": 0} if cancelar else \
+                    {"valor_total": novo_valor, "parcelas": int(novas_parcelas)}
+                materialize(cid, [occ], overrides)
+                st.success("Ocorrência cancelada." if cancelar else "Ocorrência gravada com o novo valor.")
+                st.rerun()
 
 st.divider()
 st.subheader("Parcelas em aberto / pagamento")
 
-with get_conn() as conn:
-    rows = conn.execute(
-        """
-        SELECT ei.id, COALESCE(s.nome, e.fornecedor) AS fornecedor, e.descricao, e.categoria, e.tags,
-               e.forma_pagamento, ei.num_parcela, ei.due_date, ei.amount
-        FROM expense_installments ei
-        JOIN expenses e ON e.id=ei.expense_id
-        LEFT JOIN suppliers s ON s.id=e.supplier_id
-        WHERE e.company_id=? AND ei.paid=0
-        ORDER BY date(ei.due_date) ASC
-        """,
-        (cid,),
-    ).fetchall()
-
-df_rows = pd.DataFrame([{k: r[k] for k in r.keys()} for r in rows])
+df_rows = cached_df(OPEN_EXPENSE_INSTALLMENTS_SQL, (cid,), parse_dates=["due_date"])
+# parcelas previstas das recorrências (até o horizonte), com chave "r<regra>.<ocorrência>.<parcela>"
+df_prev = virtual_installments(cid)
+df_rows = df_rows.assign(id=df_rows["id"].astype(str), origem="lançada")
+if not df_prev.empty:
+    df_rows = pd.concat(
+        [df_rows, df_prev.rename(columns={"key": "id"})[df_rows.columns.drop("origem")].assign(origem="prevista")],
+        ignore_index=True,
+    ).sort_values("due_date", kind="stable")
+st.caption(f"Parcelas previstas de despesas recorrentes até {pd.Timestamp(horizon()):%d/%m/%Y}.")
 if not df_rows.empty:
-    df_rows["due_date"] = df_rows["due_date"].apply(lambda x: datetime.fromisoformat(x).strftime("%d/%m/%Y"))
+    df_rows["due_date"] = df_rows["due_date"].dt.strftime("%d/%m/%Y").fillna("")
 st.dataframe(df_rows, use_container_width=True)
 
-ids = st.multiselect("Selecionar parcelas para quitar", [r["id"] for r in rows])
+ids = st.multiselect(
+    "Selecionar parcelas para quitar",
+    df_rows["id"].tolist() if not df_rows.empty else [],
+)
 if st.button("Quitar selecionadas") and ids:
-    now = datetime.now().isoformat()
-    with get_conn() as conn:
-        for pid in ids:
-            amt = conn.execute(
-                "SELECT ei.amount FROM expense_installments ei WHERE ei.id=?",
-                (pid,),
-            ).fetchone()
-            conn.execute("UPDATE expense_installments SET paid=1, paid_date=? WHERE id=?", (now, pid))
-            if amt:
-                conn.execute(
-                    "INSERT INTO cash_ledger(company_id,data,tipo,valor,descricao,link_tipo,link_id) VALUES (?,?,?,?,?,?,?)",
-                    (
-                        cid,
-                        now,
-                        "out",
-                        amt["amount"],
-                        f"Pagamento parcela despesa #{pid}",
-                        "expense_installment",
-                        pid,
-                    ),
-                )
-        conn.commit()
+    # previstas são materializadas (despesa + parcelas) antes da baixa
+    ids = materialize_installments(cid, ids)
+    settle_installments(cid, "expense_installment", ids, user_id=st.session_state.user["id"])
     st.success("Parcelas quitadas e caixa atualizado.")
     st.rerun()
 
@@ -230,11 +181,7 @@ if st.button("Quitar selecionadas") and ids:
 st.divider()
 st.subheader("📦 Caixa – resumo do dia")
 with get_conn() as conn:
-    hoje_iso = date.today().isoformat()
-    caixa = conn.execute(
-        "SELECT tipo, SUM(valor) as total FROM cash_ledger WHERE company_id=? AND date(data)=date(?) GROUP BY tipo",
-        (cid, hoje_iso),
-    ).fetchall()
+    caixa = conn.execute(CASH_DAY_SQL, (cid, *day_params(today_iso()))).fetchall()
 rows_cx = {r["tipo"]: r["total"] for r in caixa}
 entradas = rows_cx.get("in", 0.0) or 0.0
 saidas = rows_cx.get("out", 0.0) or 0.0
@@ -1,8 +1,11 @@
 ﻿from session_helpers import require_company_with_picker
 import streamlit as st
 from datetime import date
+from cash_cube import track
 from db_core import get_conn
-from utils import add_months
+from dialect import ids_param, in_ids
+from schedule import build_schedule
+from settlement import OPEN_REVENUE_INSTALLMENTS_SQL
 
 st.set_page_config(page_title="💰 Receitas", layout="wide")
 
@@ -31,17 +34,12 @@ with st.form("f_rev"):
     if ok:
         with get_conn() as conn:
             cur = conn.execute("""INSERT INTO revenues(company_id,service_id,client_id,descricao,forma_pagamento,data_lancamento,valor_total,parcelas,fiscal)
-                                  VALUES (?,?,?,?,?,?,?,?,?)""",
+                                  VALUES (?,?,?,?,?,?,?,?,?) RETURNING id""",
                                (cid, None, cli_map.get(cli) if cli else None, desc, forma, dt.isoformat(), valor, parcelas, 1 if fiscal else 0))
-            rev_id = cur.lastrowid
-            par_val = round(valor/parcelas, 2)
-            vals = [par_val]*parcelas
-            dif = round(valor - sum(vals), 2)
-            vals[-1] += dif
-            for i in range(parcelas):
-                due = add_months(dt, i)
-                conn.execute("""INSERT INTO revenue_installments(revenue_id,num_parcela,due_date,amount)
-                                VALUES (?,?,?,?)""",(rev_id, i+1, due.isoformat(), vals[i]))
+            rev_id = cur.fetchone()["id"]
+            conn.copy_rows("revenue_installments", ["revenue_id","num_parcela","due_date","amount","origem"],
+                           [r + ("avulsa",) for r in build_schedule(valor, parcelas, dt).rows([rev_id])])
+            track(conn, "in", 1, parents=[rev_id])
             conn.commit()
         st.success("Receita lançada com parcelas geradas.")
 
@@ -49,22 +47,22 @@ st.divider()
 st.subheader("Parcelas em aberto / recebimento")
 
 with get_conn() as conn:
-    rows = conn.execute("""
-        SELECT ri.id, r.descricao, r.forma_pagamento, ri.num_parcela, ri.due_date, ri.amount
-        FROM revenue_installments ri
-        JOIN revenues r ON r.id=ri.revenue_id
-        WHERE r.company_id=? AND ri.received=0
-        ORDER BY date(ri.due_date) ASC
-    """, (cid,)).fetchall()
+    rows = conn.execute(OPEN_REVENUE_INSTALLMENTS_SQL, (cid,)).fetchall()
 
 st.dataframe([{k: r[k] for k in r.keys()} for r in rows], use_container_width=True)
 
 ids = st.multiselect("Selecionar parcelas para receber", [r["id"] for r in rows])
-if st.button("Receber selecionadas"):
+if st.button("Receber selecionadas") and ids:
     from datetime import datetime
+    # um UPDATE para a seleção toda, só das ainda em aberto (recebimento
+    # concorrente não conta duas vezes); o cubo move essas de aberto -> recebido
     with get_conn() as conn:
-        for pid in ids:
-            conn.execute("UPDATE revenue_installments SET received=1, received_date=? WHERE id=?", (datetime.now().isoformat(), pid))
+        got = [r["id"] for r in conn.execute(
+            f"UPDATE revenue_installments SET received=1, received_date=? WHERE received=0 AND {in_ids('id')} RETURNING id",
+            (datetime.now().isoformat(), ids_param(ids)),
+        ).fetchall()]
+        track(conn, "in", -1, ids=got, status="open")
+        track(conn, "in", 1, ids=got)
         conn.commit()
     st.success("Parcelas recebidas.")
     st.rerun()
@@ -1,7 +1,11 @@
 ﻿from session_helpers import require_company_with_picker
 import streamlit as st
 import pandas as pd
+from datetime import date, timedelta
+from cash_cube import CURVE_DAILY_SQL, CURVE_MONTHLY_SQL, KPIS_SQL
 from db_core import get_conn
+from dialect import today_iso
+from recurrence import horizon, virtual_installments
 
 st.set_page_config(page_title="📊 Caixa & Dashboards", layout="wide")
 
@@ -13,61 +17,57 @@ cid = require_company_with_picker()
 
 st.title("📊 Fluxo de Caixa e KPIs")
 
+# Tudo vem do cubo cash_daily (cash_cube.py): uma linha por dia/direção/status,
+# agregada no banco — as leituras abaixo devolvem poucas linhas, qualquer que
+# seja o histórico. Despesas recorrentes ainda não materializadas entram por fora.
+hoje = today_iso()
 with get_conn() as conn:
-    # a pagar
-    pagar = conn.execute("""
-        SELECT date(ei.due_date) as data, SUM(ei.amount) as valor
-        FROM expense_installments ei
-        JOIN expenses e ON e.id=ei.expense_id
-        WHERE e.company_id=?
-        GROUP BY date(ei.due_date)
-        ORDER BY 1
-    """,(cid,)).fetchall()
-    # a receber
-    receber = conn.execute("""
-        SELECT date(ri.due_date) as data, SUM(ri.amount) as valor
-        FROM revenue_installments ri
-        JOIN revenues r ON r.id=ri.revenue_id
-        WHERE r.company_id=?
-        GROUP BY date(ri.due_date)
-        ORDER BY 1
-    """,(cid,)).fetchall()
+    kpis = conn.execute(KPIS_SQL, (hoje, cid)).fetchall()
+kpi = {r["direction"]: r for r in kpis}
 
-df_out = pd.DataFrame(pagar, columns=["data","valor"])
-df_in  = pd.DataFrame(receber, columns=["data","valor"])
+# despesas recorrentes ainda não materializadas (previstas até o horizonte)
+prev_out = virtual_installments(cid)
 
-df_out["data"] = pd.to_datetime(df_out["data"])
-df_in["data"]  = pd.to_datetime(df_in["data"])
-
-# status atual (vencidas e não pagas/recebidas)
-with get_conn() as conn:
-    venc_out = conn.execute("""
-        SELECT SUM(ei.amount) AS v
-        FROM expense_installments ei
-        JOIN expenses e ON e.id=ei.expense_id
-        WHERE e.company_id=? AND ei.paid=0 AND date(ei.due_date) < date('now')
-    """,(cid,)).fetchone()["v"] or 0
-    venc_in = conn.execute("""
-        SELECT SUM(ri.amount) AS v
-        FROM revenue_installments ri
-        JOIN revenues r ON r.id=ri.revenue_id
-        WHERE r.company_id=? AND ri.received=0 AND date(ri.due_date) < date('now')
-    """,(cid,)).fetchone()["v"] or 0
+venc_out = (kpi["out"]["vencido"] if "out" in kpi else 0) or 0
+venc_out += prev_out.loc[prev_out["due_date"] < pd.Timestamp(hoje), "amount"].sum()
+venc_in = (kpi["in"]["vencido"] if "in" in kpi else 0) or 0
+total_out = ((kpi["out"]["total"] if "out" in kpi else 0) or 0) + prev_out["amount"].sum()
+total_in = (kpi["in"]["total"] if "in" in kpi else 0) or 0
 
 col1, col2, col3 = st.columns(3)
 col1.metric("🔻 Vencidas (a pagar)", f"R$ {venc_out:,.2f}".replace(",", "X").replace(".", ",").replace("X","."))
 col2.metric("🔺 Vencidas (a receber)", f"R$ {venc_in:,.2f}".replace(",", "X").replace(".", ",").replace("X","."))
-saldo_estimado = (df_in["valor"].sum() if not df_in.empty else 0) - (df_out["valor"].sum() if not df_out.empty else 0)
-col3.metric("💼 Saldo estimado (todas as datas)", f"R$ {saldo_estimado:,.2f}".replace(",", "X").replace(".", ",").replace("X","."))
+saldo_estimado = total_in - total_out
+col3.metric(f"💼 Saldo estimado (recorrências até {pd.Timestamp(horizon()):%d/%m/%Y})", f"R$ {saldo_estimado:,.2f}".replace(",", "X").replace(".", ",").replace("X","."))
 
 st.subheader("Curva de entradas x saídas por data")
-if df_in.empty and df_out.empty:
+mensal = st.radio("Granularidade", ["Mensal (todo o histórico)", "Diária (período)"], horizontal=True).startswith("Mensal")
+if not mensal:
+    c1, c2 = st.columns(2)
+    ini = c1.date_input("De", value=date.today() - timedelta(days=30))
+    fim = c2.date_input("Até", value=date.today() + timedelta(days=90))
+with get_conn() as conn:
+    if mensal:
+        curva = conn.execute(CURVE_MONTHLY_SQL, (cid,)).fetchall()
+    else:
+        curva = conn.execute(CURVE_DAILY_SQL, (cid, ini.isoformat(), (fim + timedelta(days=1)).isoformat())).fetchall()
+
+df = pd.DataFrame([dict(r) for r in curva], columns=["data", "direction", "valor"])
+if not prev_out.empty:
+    prev = prev_out[["due_date", "amount"]].set_axis(["data", "valor"], axis=1)
+    if mensal:
+        prev["data"] = prev["data"].dt.strftime("%Y-%m")
+    else:
+        prev = prev[(prev["data"] >= pd.Timestamp(ini)) & (prev["data"] <= pd.Timestamp(fim))]
+        prev["data"] = prev["data"].dt.strftime("%Y-%m-%d")
+    df = pd.concat([df, prev.assign(direction="out")], ignore_index=True)
+df = df.groupby(["data", "direction"], as_index=False)["valor"].sum()
+
+if df.empty:
     st.info("Sem dados para exibir.")
 else:
     import plotly.express as px
-    df_in["tipo"] = "Entradas"
-    df_out["tipo"] = "Saídas"
-    df = pd.concat([df_in, df_out], ignore_index=True)
-    fig = px.line(df, x="data", y="valor", color="tipo", markers=True)
+    df["data"] = pd.to_datetime(df["data"])
+    df["tipo"] = df["direction"].map({"in": "Entradas", "out": "Saídas"})
+    fig = px.line(df.sort_values("data"), x="data", y="valor", color="tipo", markers=True)
     st.plotly_chart(fig, use_container_width=True)
-
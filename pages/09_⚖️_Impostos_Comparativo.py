@@ -2,6 +2,7 @@
 import streamlit as st
 import pandas as pd
 from db_core import get_conn
+from dialect import in_range, month_bucket, month_params
 
 st.set_page_config(page_title="⚖️ Impostos (Comparativo)", layout="wide")
 
@@ -39,28 +40,28 @@ with st.expander("Adicionar/editar regra"):
 st.divider()
 st.subheader("Comparativo mensal por regime")
 
-mes = st.selectbox("Mês (YYYY-MM)", options=["(todos)"] + [
-    r["m"] for r in get_conn().execute("""
-        SELECT strftime('%Y-%m', data_lancamento) AS m
+with get_conn() as conn:
+    meses = conn.execute(f"""
+        SELECT {month_bucket('data_lancamento')} AS m
         FROM revenues WHERE company_id=? AND fiscal=1
-        GROUP BY m ORDER BY m DESC
+        GROUP BY 1 ORDER BY 1 DESC
     """, (cid,)).fetchall()
-])
+mes = st.selectbox("Mês (YYYY-MM)", options=["(todos)"] + [r["m"] for r in meses])
 
 query = """
-SELECT strftime('%Y-%m', ri.due_date) AS m, SUM(ri.amount) AS valor
+SELECT {m} AS m, SUM(ri.amount) AS valor
 FROM revenue_installments ri
 JOIN revenues r ON r.id=ri.revenue_id
 WHERE r.company_id=? AND r.fiscal=1
 {and_mes}
-GROUP BY m
-ORDER BY m
+GROUP BY 1
+ORDER BY 1
 """
-and_mes = "" if mes == "(todos)" else "AND strftime('%Y-%m', ri.due_date)=?"
-params = (cid,) if mes == "(todos)" else (cid, mes)
+and_mes = "" if mes == "(todos)" else f"AND {in_range('ri.due_date')}"
+params = (cid,) if mes == "(todos)" else (cid, *month_params(mes))
 
 with get_conn() as conn:
-    revs = conn.execute(query.format(and_mes=and_mes), params).fetchall()
+    revs = conn.execute(query.format(m=month_bucket("ri.due_date"), and_mes=and_mes), params).fetchall()
     rules = conn.execute("SELECT * FROM tax_rules").fetchall()
 
 if not revs:
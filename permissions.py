@@ -1,18 +1,48 @@
 # permissions.py
+import threading
+
 import streamlit as st
 from db_core import get_conn
 
+# Bits por ação: a matriz de (usuário, empresa) vira {page_key: int}
+ACTION_BITS = {"view": 1, "create": 2, "edit": 4, "delete": 8}
+_COLUMNS = (("can_view", 1), ("can_create", 2), ("can_edit", 4), ("can_delete", 8))
+
+# Época por usuário (processo): o editor de 00_🔐_Usuarios incrementa ao salvar,
+# e as sessões daquele usuário recarregam a matriz na próxima checagem.
+_epochs: dict[int, int] = {}
+_epochs_lock = threading.Lock()
+
+
+def invalidate_permissions(user_id: int):
+    with _epochs_lock:
+        _epochs[user_id] = _epochs.get(user_id, 0) + 1
+
+
+def load_permission_matrix(user_id: int, company_id: int) -> dict[str, int]:
+    """Uma consulta: todas as páginas de (usuário, empresa) como bitset."""
+    with get_conn() as conn:
+        rows = conn.execute("""
+          SELECT page_key, can_view, can_create, can_edit, can_delete
+          FROM permissions
+          WHERE user_id=? AND company_id=?
+        """, (user_id, company_id)).fetchall()
+    return {r["page_key"]: sum(bit for col, bit in _COLUMNS if r[col]) for r in rows}
+
+
+def _session_matrix(user_id: int, company_id: int) -> dict[str, int]:
+    cache = st.session_state.setdefault("_perm_matrix", {})
+    epoch = _epochs.get(user_id, 0)
+    hit = cache.get(company_id)
+    if hit is None or hit[0] != (user_id, epoch):
+        hit = ((user_id, epoch), load_permission_matrix(user_id, company_id))
+        cache[company_id] = hit
+    return hit[1]
+
+
 def check_perm(page_key: str, action: str, company_id: int) -> bool:
     # admin sempre pode tudo
     u = st.session_state.get("user")
     if not u: return False
     if u["role"] == "admin": return True
-    with get_conn() as conn:
-        row = conn.execute("""
-          SELECT can_view, can_create, can_edit, can_delete
-          FROM permissions
-          WHERE user_id=? AND company_id=? AND page_key=?
-        """, (u["id"], company_id, page_key)).fetchone()
-    if not row: return False
-    mapping = {"view":"can_view","create":"can_create","edit":"can_edit","delete":"can_delete"}
-    return bool(row[mapping[action]])
+    return bool(_session_matrix(u["id"], company_id).get(page_key, 0) & ACTION_BITS[action])
@@ -0,0 +1,293 @@
+# recurrence.py
+# -*- coding: utf-8 -*-
+"""
+Despesas recorrentes (06_💸_Despesas) guardadas como regra, não como cópias.
+
+Uma linha em expense_recurrences (valor, parcelas, frequência em meses, início,
+fim e/ou nº de ocorrências) substitui as N cópias futuras de "Repetir por N
+meses". A ocorrência n vence em start_date + n*freq_months meses (dia preservado,
+fim de mês limitado — schedule.add_months) e as suas parcelas seguem o mesmo
+motor das despesas comuns (schedule.build_schedule).
+
+  - leitura: virtual_installments() expande as regras até um horizonte, já sem
+    as ocorrências materializadas; custo O(regras + ocorrências no horizonte)
+  - escrita: uma ocorrência só vira expenses/expense_installments ao ser paga
+    (materialize_installments) ou editada/cancelada (materialize)
+Chave de uma parcela prevista: "r<regra>.<ocorrência>.<parcela>".
+"""
+from __future__ import annotations
+
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from cash_cube import track
+from db_core import cached_df, get_conn
+from dialect import ids_param, in_ids, today_iso
+from schedule import add_months, build_schedule
+
+# até onde as telas projetam regras sem fim (meses a partir de hoje)
+RECURRENCE_HORIZON_MONTHS = int(os.getenv("RECURRENCE_HORIZON_MONTHS", "12"))
+
+FREQUENCIES = {1: "Mensal", 2: "Bimestral", 3: "Trimestral", 6: "Semestral", 12: "Anual"}
+
+_RULE_COLUMNS = ("supplier_id", "fornecedor", "descricao", "categoria", "tags", "forma_pagamento")
+
+
+def horizon(today: date | str | None = None, months: int | None = None) -> str:
+    """Data ISO limite das projeções (hoje + RECURRENCE_HORIZON_MONTHS)."""
+    months = RECURRENCE_HORIZON_MONTHS if months is None else months
+    d = np.datetime64(str(today or today_iso())[:10], "D")
+    return str(add_months(d, months))
+
+
+def virtual_key(rule_id: int, occurrence: int, num: int) -> str:
+    return f"r{rule_id}.{occurrence}.{num}"
+
+
+def parse_key(key) -> tuple[int, int, int] | None:
+    """(regra, ocorrência, parcela) de uma chave prevista; None para ids reais."""
+    key = str(key)
+    if not key.startswith("r"):
+        return None
+    rule_id, occurrence, num = key[1:].split(".")
+    return int(rule_id), int(occurrence), int(num)
+
+
+# =============================================================================
+# Leitura: expansão das regras
+# =============================================================================
+def expand_occurrences(rules: pd.DataFrame, until: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Ocorrências de todas as regras com data <= until, vetorizado.
+    Devolve (posição da regra em `rules`, nº da ocorrência 0.., data).
+    """
+    empty = (np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, "datetime64[D]"))
+    if rules.empty:
+        return empty
+    start = pd.to_datetime(rules["start_date"]).to_numpy().astype("datetime64[D]")
+    end = pd.to_datetime(rules["end_date"]).to_numpy().astype("datetime64[D]")
+    freq = rules["freq_months"].to_numpy(dtype=np.int64)
+    limit = np.datetime64(until[:10], "D")
+
+    # cota superior por regra (meses até o limite / frequência), cortada por `occurrences`
+    span = limit.astype("datetime64[M]").astype(np.int64) - start.astype("datetime64[M]").astype(np.int64)
+    counts = np.where(span >= 0, span // freq + 1, 0)
+    cap = pd.to_numeric(rules["occurrences"]).to_numpy(dtype=float)
+    counts = np.where(np.isnan(cap), counts, np.minimum(counts, np.nan_to_num(cap))).astype(np.int64)
+    if not counts.sum():
+        return empty
+
+    rule = np.repeat(np.arange(counts.size), counts)
+    n = np.arange(rule.size) - (np.cumsum(counts) - counts)[rule]
+    when = add_months(start[rule], n * freq[rule])
+    keep = (when <= limit) & (np.isnat(end[rule]) | (when <= end[rule]))
+    return rule[keep], n[keep], when[keep]
+
+
+# Consultas (importadas também por bench.py plan-check)
+# (company_id,): lista de regras do painel "Despesas recorrentes" (06)
+RULE_LIST_SQL = """
+    SELECT r.id, COALESCE(s.nome, r.fornecedor) AS fornecedor, r.descricao, r.categoria, r.valor_total,
+           r.parcelas, r.freq_months, r.start_date, r.end_date, r.occurrences
+    FROM expense_recurrences r
+    LEFT JOIN suppliers s ON s.id=r.supplier_id
+    WHERE r.company_id=?
+    ORDER BY r.start_date, r.id
+"""
+
+# (company_id, até)
+RULES_SQL = """
+    SELECT r.id, r.supplier_id, COALESCE(s.nome, r.fornecedor) AS fornecedor, r.descricao, r.categoria,
+           r.tags, r.forma_pagamento, r.valor_total, r.parcelas, r.freq_months,
+           r.start_date, r.end_date, r.occurrences
+    FROM expense_recurrences r
+    LEFT JOIN suppliers s ON s.id=r.supplier_id
+    WHERE r.company_id=? AND r.start_date <= ?
+    ORDER BY r.id
+"""
+
+# (company_id,)
+MATERIALIZED_SQL = "SELECT recurrence_id, occurrence FROM expenses WHERE company_id=? AND recurrence_id IS NOT NULL"
+
+
+def _load_rules(company_id: int, until: str) -> pd.DataFrame:
+    return cached_df(RULES_SQL, (company_id, until))
+
+
+def _materialized(company_id: int) -> np.ndarray:
+    """Pares (regra, ocorrência) já gravados em expenses, como chave int64 regra<<20 | ocorrência."""
+    df = cached_df(MATERIALIZED_SQL, (company_id,))
+    return (df["recurrence_id"].to_numpy(np.int64) << 20) | df["occurrence"].to_numpy(np.int64)
+
+
+def virtual_installments(company_id: int, until: str | None = None) -> pd.DataFrame:
+    """
+    Parcelas previstas (ainda não materializadas) das ocorrências com data <= until
+    (padrão: horizon()). Colunas: key, recurrence_id, occurrence, fornecedor,
+    descricao, categoria, tags, forma_pagamento, data_lancamento, num_parcela,
+    due_date (datetime64), amount.
+    """
+    until = until or horizon()
+    rules = _load_rules(company_id, until)
+    pos, n, when = expand_occurrences(rules, until)
+    rule_ids = rules["id"].to_numpy(np.int64)[pos] if pos.size else pos
+    fresh = ~np.isin((rule_ids << 20) | n, _materialized(company_id))
+    pos, n, when, rule_ids = pos[fresh], n[fresh], when[fresh], rule_ids[fresh]
+    if not pos.size:
+        return pd.DataFrame(columns=["key", "recurrence_id", "occurrence", "fornecedor", "descricao", "categoria",
+                                     "tags", "forma_pagamento", "data_lancamento", "num_parcela", "due_date", "amount"])
+
+    freq = rules["freq_months"].to_numpy(np.int64)[pos]
+    sched = build_schedule(rules["valor_total"].to_numpy(float)[pos], rules["parcelas"].to_numpy(np.int64)[pos],
+                           pd.to_datetime(rules["start_date"]).to_numpy().astype("datetime64[D]")[pos], n * freq)
+    occ = sched.contract
+    df = rules.iloc[pos[occ]][["fornecedor", "descricao", "categoria", "tags", "forma_pagamento"]].reset_index(drop=True)
+    df.insert(0, "occurrence", n[occ])
+    df.insert(0, "recurrence_id", rule_ids[occ])
+    df.insert(0, "key", [virtual_key(r, o, k) for r, o, k in zip(rule_ids[occ].tolist(), n[occ].tolist(),
+                                                                  sched.num.tolist())])
+    df["data_lancamento"] = pd.to_datetime(when[occ])
+    df["num_parcela"] = sched.num
+    df["due_date"] = pd.to_datetime(sched.due)
+    df["amount"] = sched.cents / 100
+    return df
+
+
+# =============================================================================
+# Escrita: regra nova e materialização de ocorrências
+# =============================================================================
+def create_rule(conn, company_id: int, valor_total: float, parcelas: int, start: date | str,
+                freq_months: int = 1, end: date | str | None = None, occurrences: int | None = None,
+                **fields) -> int:
+    """Grava a regra (uma linha, qualquer que seja o nº de ocorrências) e devolve o id."""
+    cols = ["company_id", "valor_total", "parcelas", "freq_months", "start_date", "end_date", "occurrences"]
+    vals = [company_id, valor_total, int(parcelas), int(freq_months), str(start)[:10],
+            str(end)[:10] if end else None, int(occurrences) if occurrences else None]
+    for c in _RULE_COLUMNS:
+        if c in fields:
+            cols.append(c)
+            vals.append(fields[c])
+    return conn.execute(
+        f"INSERT INTO expense_recurrences ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) RETURNING id",
+        vals,
+    ).fetchone()["id"]
+
+
+def materialize(company_id: int, pairs, overrides: dict | None = None) -> dict[tuple[int, int], int]:
+    """
+    Grava as ocorrências `pairs` [(regra, ocorrência)] como despesas comuns, com
+    as suas parcelas, e devolve {(regra, ocorrência): expense_id}. Ocorrências já
+    materializadas são reaproveitadas; as inexistentes (fora do fim/contagem da
+    regra, ou de outra empresa) ficam de fora.
+    overrides: {"valor_total": ..., "parcelas": ...} para editar a ocorrência;
+    parcelas=0 cancela (a despesa fica gravada, sem parcelas). Só valem para
+    ocorrências ainda não materializadas.
+    """
+    pairs = sorted({(int(r), int(n)) for r, n in pairs})
+    if not pairs:
+        return {}
+    overrides = overrides or {}
+    with get_conn() as conn:
+        rules = {
+            r["id"]: r for r in conn.execute(
+                f"SELECT * FROM expense_recurrences WHERE company_id=? AND {in_ids('id')}",
+                (company_id, ids_param({r for r, _ in pairs})),
+            ).fetchall()
+        }
+        created = []
+        for rule_id, n in pairs:
+            rule = rules.get(rule_id)
+            if rule is None or n < 0 or (rule["occurrences"] and n >= rule["occurrences"]):
+                continue
+            when = str(add_months(np.datetime64(rule["start_date"][:10], "D"), n * rule["freq_months"]))
+            if rule["end_date"] and when > rule["end_date"][:10]:
+                continue
+            valor = overrides.get("valor_total", rule["valor_total"])
+            parcelas = int(overrides.get("parcelas", rule["parcelas"]))
+            row = conn.execute(
+                """
+                INSERT INTO expenses(company_id,supplier_id,fornecedor,descricao,categoria,tags,forma_pagamento,
+                                     data_lancamento,valor_total,parcelas,recurrence_id,occurrence)
+                VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
+                ON CONFLICT DO NOTHING
+                RETURNING id
+                """,
+                (company_id, rule["supplier_id"], rule["fornecedor"], rule["descricao"], rule["categoria"],
+                 rule["tags"], rule["forma_pagamento"], when, valor, parcelas, rule_id, n),
+            ).fetchone()
+            if row and parcelas > 0:
+                created.append((row["id"], valor, parcelas, rule["start_date"][:10], n * rule["freq_months"]))
+
+        if created:
+            exp_ids, vals, counts, starts, offsets = zip(*created)
+            conn.copy_rows(
+                "expense_installments",
+                ["expense_id", "num_parcela", "due_date", "amount"],
+                build_schedule(vals, counts, starts, offsets).rows(exp_ids),
+            )
+            track(conn, "out", 1, parents=exp_ids)
+        found = conn.execute(
+            f"""
+            SELECT id, recurrence_id, occurrence FROM expenses
+            WHERE company_id=? AND {in_ids('recurrence_id')}
+            """,
+            (company_id, ids_param(list(rules))),
+        ).fetchall() if rules else []
+        conn.commit()
+    wanted = set(pairs)
+    return {(r["recurrence_id"], r["occurrence"]): r["id"] for r in found
+            if (r["recurrence_id"], r["occurrence"]) in wanted}
+
+
+def materialize_installments(company_id: int, keys) -> list[int]:
+    """
+    Ids reais de uma seleção que mistura ids de expense_installments e chaves
+    previstas: materializa as ocorrências das chaves e troca cada uma pelo id da
+    parcela correspondente (para settle_installments).
+    """
+    ids, virtual = [], []
+    for key in keys:
+        parsed = parse_key(key)
+        if parsed is None:
+            ids.append(int(key))
+        else:
+            virtual.append(parsed)
+    if not virtual:
+        return ids
+    expenses = materialize(company_id, [(r, n) for r, n, _ in virtual])
+    if not expenses:
+        return ids
+    with get_conn() as conn:
+        rows = conn.execute(
+            f"SELECT id, expense_id, num_parcela FROM expense_installments WHERE {in_ids('expense_id')}",
+            (ids_param(expenses.values()),),
+        ).fetchall()
+    by_num = {(r["expense_id"], r["num_parcela"]): r["id"] for r in rows}
+    for rule_id, n, num in virtual:
+        inst = by_num.get((expenses.get((rule_id, n)), num))
+        if inst is not None:
+            ids.append(inst)
+    return ids
+
+
+# =============================================================================
+# Manutenção das regras
+# =============================================================================
+def end_rule(company_id: int, rule_id: int, end: date | str):
+    """Encerra a regra: nenhuma ocorrência depois de `end` (as já gravadas ficam)."""
+    with get_conn() as conn:
+        conn.execute(
+            "UPDATE expense_recurrences SET end_date=? WHERE id=? AND company_id=?",
+            (str(end)[:10], rule_id, company_id),
+        )
+        conn.commit()
+
+
+def delete_rule(company_id: int, rule_id: int):
+    """Remove a regra; ocorrências materializadas continuam como despesas comuns."""
+    with get_conn() as conn:
+        conn.execute("DELETE FROM expense_recurrences WHERE id=? AND company_id=?", (rule_id, company_id))
+        conn.commit()
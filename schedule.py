@@ -0,0 +1,70 @@
+# schedule.py
+# -*- coding: utf-8 -*-
+"""
+Motor de parcelamento compartilhado por Serviços (05), Despesas (06) e Receitas (07).
+
+Para N contratos de uma vez (vetorizado com NumPy):
+  - vencimentos: parcela k vence k meses após o início, no mesmo dia; em meses
+    mais curtos cai no último dia (31/01 -> 28/02 -> 31/03 -> 30/04 ...)
+  - valores em centavos inteiros: cada parcela recebe total // n e a última
+    absorve o resto, então a soma fecha exatamente no total
+O resultado sai pronto para copy_rows/executemany.
+"""
+from __future__ import annotations
+
+from typing import NamedTuple
+
+import numpy as np
+
+
+def add_months(dates, months) -> np.ndarray:
+    """dates + months meses (arrays, com broadcast), preservando o dia e limitando ao fim do mês."""
+    d = np.asarray(dates, dtype="datetime64[D]")
+    month0 = d.astype("datetime64[M]")
+    day = d - month0.astype("datetime64[D]")            # dias desde o dia 1
+    target = month0 + np.asarray(months, dtype=np.int64)
+    last_day = (target + 1).astype("datetime64[D]") - 1
+    return np.minimum(target.astype("datetime64[D]") + day, last_day)
+
+
+class Schedule(NamedTuple):
+    contract: np.ndarray    # índice do contrato (posição em totals/counts/starts)
+    num: np.ndarray         # número da parcela, 1..n
+    due: np.ndarray         # vencimento, datetime64[D]
+    cents: np.ndarray       # valor em centavos (int64)
+
+    def rows(self, contract_ids=None) -> list[tuple]:
+        """
+        Tuplas para inserir: (num, due_iso, amount) ou, com contract_ids (id
+        gerado de cada contrato, na mesma ordem), (id, num, due_iso, amount).
+        """
+        cols = [self.num.tolist(), np.datetime_as_string(self.due, unit="D").tolist(),
+                (self.cents / 100).tolist()]
+        if contract_ids is not None:
+            cols.insert(0, np.asarray(contract_ids)[self.contract].tolist())
+        return list(zip(*cols))
+
+
+def build_schedule(totals, counts, starts, offsets=None) -> Schedule:
+    """
+    Parcelas de vários contratos: totals (R$), counts (nº de parcelas >= 1),
+    starts (1º vencimento). offsets (meses) desloca cada contrato a partir do
+    seu start sem perder o dia original: cópias mensais de um lançamento do dia
+    31 continuam vencendo no dia 31 quando o mês tem 31 dias.
+    """
+    counts = np.atleast_1d(np.asarray(counts, dtype=np.int64))
+    if (counts < 1).any():
+        raise ValueError("Cada contrato precisa de ao menos 1 parcela")
+    total_cents = np.rint(np.atleast_1d(np.asarray(totals, dtype=float)) * 100).astype(np.int64)
+    starts = np.atleast_1d(np.asarray(starts, dtype="datetime64[D]"))
+
+    contract = np.repeat(np.arange(counts.size), counts)
+    first = np.cumsum(counts) - counts                   # linha da 1ª parcela de cada contrato
+    k = np.arange(contract.size) - first[contract]       # 0..n-1 dentro do contrato
+
+    base = total_cents // counts
+    cents = base[contract]
+    cents[first + counts - 1] += total_cents - base * counts
+
+    shift = k if offsets is None else k + np.atleast_1d(np.asarray(offsets, dtype=np.int64))[contract]
+    return Schedule(contract, k + 1, add_months(starts[contract], shift), cents)
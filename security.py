@@ -1,9 +1,72 @@
 # security.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import bcrypt
-from db_core import get_conn
+from db_core import get_conn, cached_query
+from dialect import insert_ignore
+
+# ---------- bcrypt fora da thread do script ----------
+# bcrypt libera o GIL: N workers limitam quantos hashes rodam ao mesmo tempo e
+# as demais sessões continuam sendo atendidas durante um pico de logins.
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(min(4, os.cpu_count() or 1))))
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))   # latência alvo de 1 hash
+BCRYPT_MIN_ROUNDS, BCRYPT_MAX_ROUNDS = 10, 15
+
+_hash_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_rounds = int(os.getenv("BCRYPT_ROUNDS", "0")) or None   # fixo por env; senão calibrado
+_rounds_lock = threading.Lock()
+
+
+def calibrate_bcrypt_rounds(target_ms: float = BCRYPT_TARGET_MS) -> int:
+    """Maior custo cujo hash fica dentro de target_ms neste host (cada +1 dobra o tempo)."""
+    t0 = time.perf_counter()
+    bcrypt.hashpw(b"calibracao", bcrypt.gensalt(BCRYPT_MIN_ROUNDS))
+    ms = (time.perf_counter() - t0) * 1000
+    rounds = BCRYPT_MIN_ROUNDS
+    while rounds < BCRYPT_MAX_ROUNDS and ms * 2 <= target_ms:
+        rounds += 1
+        ms *= 2
+    return rounds
+
+
+def bcrypt_rounds() -> int:
+    global _rounds
+    if _rounds is None:
+        with _rounds_lock:
+            if _rounds is None:
+                _rounds = calibrate_bcrypt_rounds()
+    return _rounds
+
+
+def _hash_rounds(pw_hash: bytes) -> int:
+    # formato $2b$12$<salt+hash>
+    try:
+        return int(pw_hash.split(b"$")[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+def _as_bytes(value) -> bytes:
+    # BLOB (sqlite) -> bytes; BYTEA (psycopg) -> bytes/memoryview; legado -> str
+    if isinstance(value, str):
+        return value.encode()
+    return bytes(value)
+
+
+def hash_password(password: str) -> bytes:
+    rounds = bcrypt_rounds()
+    return _hash_pool.submit(bcrypt.hashpw, password.encode(), bcrypt.gensalt(rounds)).result()
+
+
+def check_password(password: str, pw_hash) -> bool:
+    return _hash_pool.submit(bcrypt.checkpw, password.encode(), _as_bytes(pw_hash)).result()
+
 
 def create_user(name: str, email: str, password: str, role: str = "admin", active: bool = True):
-    pw_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+    pw_hash = hash_password(password)
     with get_conn() as conn:
         conn.execute(
             "INSERT INTO users(name,email,password_hash,is_active,role) VALUES (?,?,?,?,?)",
@@ -12,28 +75,39 @@ def create_user(name: str, email: str, password: str, role: str = "admin", activ
         conn.commit()
 
 def verify_credentials(email: str, password: str):
+    # a conexão não fica presa enquanto o hash roda
     with get_conn() as conn:
         row = conn.execute("SELECT * FROM users WHERE email=? AND is_active=1", (email,)).fetchone()
-        if not row:
-            return None
-        if bcrypt.checkpw(password.encode(), row["password_hash"]):
-            return dict(row)
-    return None
+    if not row:
+        return None
+    stored = _as_bytes(row["password_hash"])
+    if not check_password(password, stored):
+        return None
+    if _hash_rounds(stored) < bcrypt_rounds():
+        # custo subiu (calibração/env): regrava com o custo atual, senha já validada.
+        # Nunca rebaixa: a calibração varia entre processos/hosts e faria o hash
+        # oscilar a cada login.
+        new_hash = hash_password(password)
+        with get_conn() as conn:
+            conn.execute(
+                "UPDATE users SET password_hash=? WHERE id=? AND password_hash=?",
+                (new_hash, row["id"], stored),
+            )
+    return dict(row)
 
 def add_user_to_company(user_id: int, company_id: int):
     with get_conn() as conn:
-        conn.execute("INSERT OR IGNORE INTO user_companies(user_id, company_id) VALUES (?,?)",
+        conn.execute(insert_ignore("user_companies", ["user_id", "company_id"]),
                      (user_id, company_id))
         conn.commit()
 
 def list_user_companies(user_id: int):
-    with get_conn() as conn:
-        return conn.execute("""
-            SELECT c.* FROM companies c
-            JOIN user_companies uc ON uc.company_id=c.id
-            WHERE uc.user_id=?
-            ORDER BY c.razao_social
-        """, (user_id,)).fetchall()
+    return cached_query("""
+        SELECT c.* FROM companies c
+        JOIN user_companies uc ON uc.company_id=c.id
+        WHERE uc.user_id=?
+        ORDER BY c.razao_social
+    """, (user_id,))
 
 def ensure_admin_seed():
     # cria admin@admin com senha admin se não houver usuários
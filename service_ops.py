@@ -0,0 +1,180 @@
+# service_ops.py
+# -*- coding: utf-8 -*-
+"""
+Operações em lote sobre serviços (05_🧾_Serviços_e_OS).
+Cada operação roda um número fixo de comandos, qualquer que seja a quantidade
+de ids: a lista vai num único parâmetro (dialect.in_ids / ids_param).
+"""
+from __future__ import annotations
+
+import pandas as pd
+
+from db_core import get_conn
+from dialect import ids_param, in_ids
+
+# Consultas das telas e da cascata, importadas também por bench.py plan-check:
+# o EXPLAIN roda sobre o mesmo texto que a página executa.
+SERVICES_SQL = """
+    SELECT s.id, s.data, c.nome as cliente, s.descricao, s.valor_total,
+           s.forma_pagamento, s.parcelas, s.status, s.fiscal, s.client_id
+    FROM services s
+    LEFT JOIN clients c ON c.id = s.client_id
+    WHERE s.company_id=?
+    ORDER BY s.data DESC, s.id DESC
+"""
+
+RECEIVABLES_SQL = """
+    SELECT ri.id, r.service_id, s.data as data_servico, c.nome as cliente,
+           ri.num_parcela, ri.due_date, ri.amount, ri.paid, ri.paid_date
+    FROM revenue_installments ri
+    JOIN revenue r ON r.id=ri.revenue_id
+    JOIN services s ON s.id=r.service_id
+    LEFT JOIN clients c ON c.id=s.client_id
+    WHERE s.company_id=? AND ri.paid=0
+    ORDER BY ri.due_date ASC, ri.id ASC
+"""
+
+# cascata de delete_services, na ordem: (rótulo, SQL, quantos company_id=? antes da lista de ids)
+DELETE_SERVICES_CASCADE = [
+    ("caixa vinculado", f"""
+        DELETE FROM cash_ledger
+        WHERE company_id=? AND link_tipo='revenue_installment'
+          AND link_id IN (
+            SELECT ri.id FROM revenue_installments ri
+            JOIN revenue r ON r.id = ri.revenue_id
+            WHERE r.company_id=? AND {in_ids('r.service_id')}
+          )
+    """, 2),
+    ("parcelas", f"""
+        DELETE FROM revenue_installments
+        WHERE revenue_id IN (SELECT id FROM revenue WHERE company_id=? AND {in_ids('service_id')})
+    """, 1),
+    ("receita", f"DELETE FROM revenue WHERE company_id=? AND {in_ids('service_id')}", 1),
+] + [
+    (f"vínculos ({link_table})", f"""
+        DELETE FROM {link_table}
+        WHERE service_id IN (SELECT id FROM services WHERE company_id=? AND {in_ids('id')})
+    """, 1)
+    for link_table in ("service_employees", "service_equipments")
+] + [
+    ("serviços", f"DELETE FROM services WHERE company_id=? AND {in_ids('id')}", 1),
+]
+
+
+def delete_services(company_id: int, ids) -> int:
+    """
+    Exclui os serviços e tudo que pende deles, em cascata manual
+    (DELETE_SERVICES_CASCADE): caixa das parcelas -> parcelas -> receita ->
+    vínculos -> serviço. Só afeta serviços da empresa informada. Devolve
+    quantos serviços saíram.
+    """
+    ids = list(ids)
+    if not ids:
+        return 0
+    p = ids_param(ids)
+    with get_conn() as conn:
+        for _, sql, n_company in DELETE_SERVICES_CASCADE:
+            cur = conn.execute(sql, (company_id,) * n_company + (p,))
+        return cur.rowcount
+
+
+def fetch_service_bundles(ids, company_id: int) -> dict[int, dict]:
+    """
+    Tudo que a OS em PDF precisa, para vários serviços de uma vez: 5 consultas
+    (serviços, clientes, colaboradores, equipamentos, parcelas) agrupadas em
+    memória. Devolve {service_id: {"srv", "cli", "emps", "eqps", "inst"}} só
+    com os serviços da empresa; linhas como dict.
+    """
+    ids = list(ids)
+    if not ids:
+        return {}
+    p = ids_param(ids)
+    with get_conn() as conn:
+        srvs = conn.execute(
+            f"SELECT * FROM services WHERE company_id=? AND {in_ids('id')}", (company_id, p)
+        ).fetchall()
+        clis = conn.execute(
+            f"""
+            SELECT * FROM clients
+            WHERE id IN (SELECT client_id FROM services WHERE company_id=? AND {in_ids('id')})
+            """,
+            (company_id, p),
+        ).fetchall()
+        emps = conn.execute(
+            f"""
+            SELECT se.service_id, e.nome, e.funcao
+            FROM employees e
+            JOIN service_employees se ON se.employee_id=e.id
+            WHERE {in_ids('se.service_id')}
+            ORDER BY se.service_id, e.nome
+            """,
+            (p,),
+        ).fetchall()
+        eqps = conn.execute(
+            f"""
+            SELECT se.service_id, e.descricao
+            FROM equipment e
+            JOIN service_equipments se ON se.equipment_id=e.id
+            WHERE {in_ids('se.service_id')}
+            ORDER BY se.service_id, e.descricao
+            """,
+            (p,),
+        ).fetchall()
+        inst = conn.execute(
+            f"""
+            SELECT r.service_id, ri.num_parcela, ri.due_date, ri.amount, ri.paid, ri.paid_date
+            FROM revenue_installments ri
+            JOIN revenue r ON r.id=ri.revenue_id
+            WHERE r.company_id=? AND {in_ids('r.service_id')}
+            ORDER BY r.service_id, ri.num_parcela ASC
+            """,
+            (company_id, p),
+        ).fetchall()
+
+    clients = {r["id"]: dict(r) for r in clis}
+    out = {
+        r["id"]: {"srv": dict(r), "cli": clients.get(r["client_id"]), "emps": [], "eqps": [], "inst": []}
+        for r in srvs
+    }
+    for key, rows in (("emps", emps), ("eqps", eqps), ("inst", inst)):
+        for r in rows:
+            pack = out.get(r["service_id"])
+            if pack is not None:
+                pack[key].append(dict(r))
+    return out
+
+
+# Colunas editáveis do grid de serviços (as demais ficam desabilitadas)
+EDITABLE_COLUMNS = ("descricao", "status")
+
+
+def changed_rows(original: pd.DataFrame, edited: pd.DataFrame, columns=EDITABLE_COLUMNS, key="id") -> pd.DataFrame:
+    """
+    Linhas de `edited` cujas `columns` diferem de `original` (casadas por `key`).
+    Comparação vetorizada; NaN/None dos dois lados contam como iguais, e
+    NULL <-> valor conta como alteração (em string[pyarrow], ne() com NA dá NA).
+    """
+    cols = list(columns)
+    before = original.set_index(key)[cols]
+    after = edited.set_index(key)[cols].reindex(before.index)
+    diff = ~(before.eq(after).fillna(False).astype(bool) | (before.isna() & after.isna()))
+    return after[diff.any(axis=1)].reset_index()
+
+
+def save_service_edits(company_id: int, original: pd.DataFrame, edited: pd.DataFrame) -> int:
+    """Grava só as linhas alteradas no data_editor, num único executemany."""
+    changed = changed_rows(original, edited)
+    if changed.empty:
+        return 0
+    params = [
+        (
+            None if pd.isna(r.descricao) else r.descricao,
+            None if pd.isna(r.status) else r.status,
+            int(r.id),
+            company_id,
+        )
+        for r in changed.itertuples(index=False)
+    ]
+    with get_conn() as conn:
+        conn.executemany("UPDATE services SET descricao=?, status=? WHERE id=? AND company_id=?", params)
+    return len(params)
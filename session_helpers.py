@@ -1,32 +1,95 @@
-﻿import streamlit as st
+import threading
+
+import streamlit as st
 from db_core import get_conn
 from security import list_user_companies
 
+# =============================================================================
+# Contexto do tenant (empresas do usuário + empresa ativa), montado no login
+#  - fica em st.session_state.tenant e serve a sidebar/picker sem ir ao banco
+#  - 01_📦_Empresas chama invalidate_tenant_context() ao criar/editar/excluir/
+#    vincular empresas; as sessões remontam o contexto na próxima leitura
+# =============================================================================
+_tenant_epoch = 0
+_tenant_epoch_lock = threading.Lock()
+
+
+def invalidate_tenant_context():
+    global _tenant_epoch
+    with _tenant_epoch_lock:
+        _tenant_epoch += 1
+
+
+class TenantContext:
+    def __init__(self, user: dict, companies: list[dict], epoch: int):
+        self.user_id = user["id"]
+        self.epoch = epoch
+        self.companies = companies
+        self.by_id = {c["id"]: c for c in companies}
+
+    @classmethod
+    def load(cls, user: dict) -> "TenantContext":
+        """Empresas vinculadas (ou todas, se admin sem vínculo): no máximo 2 consultas."""
+        epoch = _tenant_epoch
+        rows = list_user_companies(user["id"])
+        if not rows and user["role"] == "admin":
+            with get_conn() as conn:
+                rows = conn.execute("SELECT * FROM companies ORDER BY razao_social").fetchall()
+        return cls(user, [dict(r) for r in rows], epoch)
+
+    def labels(self) -> dict:
+        return {c["id"]: f'{c["razao_social"]} ({c["regime"]})' for c in self.companies}
+
+
+def tenant_context() -> TenantContext:
+    """Contexto da sessão; só remonta se não existe, mudou o usuário ou foi invalidado."""
+    user = st.session_state.user
+    ctx = st.session_state.get("tenant")
+    if ctx is None or ctx.user_id != user["id"] or ctx.epoch != _tenant_epoch:
+        ctx = TenantContext.load(user)
+        st.session_state.tenant = ctx
+        active = st.session_state.get("company")
+        if active:
+            # empresa ativa atualizada (ou descartada, se perdeu o acesso)
+            st.session_state.company = ctx.by_id.get(active["id"])
+    return ctx
+
+
+def switch_company(company_id: int) -> dict:
+    """Troca a empresa ativa; sem consulta quando ela já está no contexto."""
+    ctx = tenant_context()
+    company = ctx.by_id.get(company_id)
+    if company is None:
+        with get_conn() as conn:
+            row = conn.execute("SELECT * FROM companies WHERE id=?", (company_id,)).fetchone()
+        company = dict(row) if row else None
+    st.session_state.company = company
+    return company
+
+
+def clear_tenant_context():
+    st.session_state.tenant = None
+    st.session_state.company = None
+
+
 def require_company_with_picker() -> int:
     if "user" not in st.session_state or not st.session_state.user:
         st.warning("Faça login na Home.")
         st.stop()
 
+    ctx = tenant_context()
     if st.session_state.get("company"):
         return st.session_state.company["id"]
 
     st.title("🏢 Selecione a Empresa")
-    uid = st.session_state.user["id"]
-
-    with get_conn() as conn:
-        rows = list_user_companies(uid)
-        if not rows and st.session_state.user["role"] == "admin":
-            rows = conn.execute("SELECT * FROM companies ORDER BY razao_social").fetchall()
-
-    if not rows:
+    if not ctx.companies:
         st.info("Nenhuma empresa vinculada. Vá em **📦 Empresas** para cadastrar e vincular.")
         st.stop()
 
-    labels = {r["id"]: f'{r["razao_social"]} ({r["regime"]})' for r in rows}
-    sel = st.selectbox("Empresa", [r["id"] for r in rows], format_func=lambda x: labels[x])
+    labels = ctx.labels()
+    sel = st.selectbox("Empresa", [c["id"] for c in ctx.companies], format_func=lambda x: labels[x])
     if st.button("Entrar"):
-        with get_conn() as conn:
-            st.session_state.company = dict(conn.execute("SELECT * FROM companies WHERE id=?", (sel,)).fetchone())
+        switch_company(sel)
         st.rerun()
 
     st.stop()
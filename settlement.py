@@ -0,0 +1,130 @@
+# settlement.py
+# -*- coding: utf-8 -*-
+"""
+Baixa de parcelas em lote (receber / pagar), compartilhada por
+05_🧾_Serviços_e_OS ("Marcar como recebidas") e 06_💸_Despesas ("Quitar selecionadas").
+
+Cada baixa abre um lote em settlement_batches e roda um número fixo de
+comandos, qualquer que seja a quantidade de parcelas:
+  1. INSERT ... RETURNING id do lote
+  2. UPDATE ... SET paid=1 WHERE paid=0 ... RETURNING id: reivindica as parcelas
+     em aberto da empresa. Numa baixa concorrente da mesma parcela (PG, READ
+     COMMITTED) a segunda espera o lock da linha, reavalia paid=0 e não a pega
+  3. INSERT INTO cash_ledger ... SELECT só das parcelas reivindicadas
+  4. UPDATE dos totais do lote
+Despesas também movem o cubo cash_daily (aberto -> pago) pelas reivindicadas,
+na mesma transação. Parcelas já quitadas ou de outra empresa são ignoradas:
+nunca geram caixa duplicado.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+
+from cash_cube import track
+from db_core import get_conn
+from dialect import ids_param, in_ids, in_range
+
+# Listas das telas (parcelas em aberto e caixa do dia), importadas também por
+# bench.py plan-check junto com os comandos da baixa abaixo.
+OPEN_EXPENSE_INSTALLMENTS_SQL = """
+    SELECT ei.id, COALESCE(s.nome, e.fornecedor) AS fornecedor, e.descricao, e.categoria, e.tags,
+           e.forma_pagamento, ei.num_parcela, ei.due_date, ei.amount
+    FROM expense_installments ei
+    JOIN expenses e ON e.id=ei.expense_id
+    LEFT JOIN suppliers s ON s.id=e.supplier_id
+    WHERE e.company_id=? AND ei.paid=0
+    ORDER BY ei.due_date ASC
+"""
+
+OPEN_REVENUE_INSTALLMENTS_SQL = """
+    SELECT ri.id, r.descricao, r.forma_pagamento, ri.num_parcela, ri.due_date, ri.amount
+    FROM revenue_installments ri
+    JOIN revenues r ON r.id=ri.revenue_id
+    WHERE r.company_id=? AND ri.received=0
+    ORDER BY ri.due_date ASC
+"""
+
+# (company_id, *day_params(dia))
+CASH_DAY_SQL = f"SELECT tipo, SUM(valor) as total FROM cash_ledger WHERE company_id=? AND {in_range('data')} GROUP BY tipo"
+
+# link_tipo -> tabela de parcelas, vínculo com o documento (e a empresa), como
+# o lançamento de caixa é descrito e a direção no cubo cash_daily (None: fora dele)
+_KINDS = {
+    "revenue_installment": {
+        "table": "revenue_installments",
+        "join": "JOIN revenue d ON d.id = i.revenue_id",
+        "tipo": "in",
+        "descricao": "'Recebimento parcela OS #' || d.service_id",
+        "cube": None,       # parcelas de OS (origem 'os'): fora do cubo, que conta só as avulsas
+    },
+    "expense_installment": {
+        "table": "expense_installments",
+        "join": "JOIN expenses d ON d.id = i.expense_id",
+        "tipo": "out",
+        "descricao": "'Pagamento parcela despesa #' || i.id",
+        "cube": "out",
+    },
+}
+
+
+def claim_sql(link_tipo: str) -> str:
+    """UPDATE que reivindica as parcelas em aberto: (quando, company_id, ids)."""
+    kind = _KINDS[link_tipo]
+    return f"""
+        UPDATE {kind['table']} SET paid=1, paid_date=?
+        WHERE paid=0 AND id IN (
+          SELECT i.id FROM {kind['table']} i
+          {kind['join']}
+          WHERE d.company_id=? AND {in_ids('i.id')}
+        )
+        RETURNING id
+    """
+
+
+def ledger_sql(link_tipo: str) -> str:
+    """Caixa das parcelas reivindicadas: (quando, tipo, link_tipo, lote, ids)."""
+    kind = _KINDS[link_tipo]
+    return f"""
+        INSERT INTO cash_ledger(company_id, data, tipo, valor, descricao, link_tipo, link_id, settlement_id)
+        SELECT d.company_id, ?, ?, i.amount, {kind['descricao']}, ?, i.id, ?
+        FROM {kind['table']} i
+        {kind['join']}
+        WHERE {in_ids('i.id')}
+    """
+
+
+# (lote, lote, lote)
+BATCH_TOTALS_SQL = """
+    UPDATE settlement_batches SET
+      qtd = (SELECT COUNT(*) FROM cash_ledger WHERE settlement_id=?),
+      total = (SELECT COALESCE(SUM(valor), 0) FROM cash_ledger WHERE settlement_id=?)
+    WHERE id=?
+"""
+
+
+def settle_installments(company_id: int, link_tipo: str, ids, when: str | None = None,
+                        user_id: int | None = None) -> int | None:
+    """
+    Marca as parcelas `ids` como pagas e lança no caixa, em lote.
+    Devolve o id do lote (None se não há ids).
+    """
+    kind = _KINDS[link_tipo]
+    ids = list(ids)
+    if not ids:
+        return None
+    when = when or datetime.now().isoformat(timespec="seconds")
+    with get_conn() as conn:
+        batch_id = conn.execute(
+            "INSERT INTO settlement_batches(company_id, link_tipo, created_at, user_id) VALUES (?,?,?,?) RETURNING id",
+            (company_id, link_tipo, when, user_id),
+        ).fetchone()["id"]
+        claimed = [r["id"] for r in conn.execute(
+            claim_sql(link_tipo), (when, company_id, ids_param(ids))
+        ).fetchall()]
+        if claimed:
+            conn.execute(ledger_sql(link_tipo), (when, kind["tipo"], link_tipo, batch_id, ids_param(claimed)))
+            if kind["cube"]:
+                track(conn, kind["cube"], -1, ids=claimed, status="open")
+                track(conn, kind["cube"], 1, ids=claimed)
+        conn.execute(BATCH_TOTALS_SQL, (batch_id, batch_id, batch_id))
+    return batch_id